@@ -0,0 +1,80 @@
+"""Measure the import time of the package, and the startup time of a
+short-lived job using it.
+
+Run with:
+    $ python -m benchmarks.bench_import [--budget 15]
+
+Exit with status 1 if 'import midi' takes more than the budget, in
+milliseconds.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+# A short-lived worker: import, decode a few bytes, exit.
+JOB = ('import midi; from midi.parser import MidiParser; '
+       'MidiParser().feed(bytes([0x90, 60, 100]))')
+
+
+def import_time(module='midi', runs=10):
+    """Return the median cumulative import time of 'module', in
+    microseconds, as reported by python -X importtime."""
+    times = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import {}'.format(module)],
+            stderr=subprocess.PIPE, check=True).stderr.decode()
+        for line in output.splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                times.append(int(fields[1]))
+    return statistics.median(times)
+
+
+def startup_time(code, runs=10):
+    """Return the median wall-clock time of 'python -c code', in
+    microseconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        times.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(times)
+
+
+def loaded_modules(code='import midi'):
+    """Return the set of the modules loaded by 'code'."""
+    output = subprocess.run(
+        [sys.executable, '-c',
+         '{}; import sys; print(" ".join(sys.modules))'.format(code)],
+        stdout=subprocess.PIPE, check=True).stdout.decode()
+    return set(output.split())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_import')
+    parser.add_argument('--budget', type=float, default=None,
+                        help="maximum time of 'import midi', in ms")
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    imported = import_time('midi', args.runs)
+    baseline = startup_time('pass', args.runs)
+    job = startup_time(JOB, args.runs)
+    print('import midi:      {:>8.1f} ms'.format(imported / 1000))
+    print('python startup:   {:>8.1f} ms'.format(baseline / 1000))
+    print('short-lived job:  {:>8.1f} ms (+{:.1f} ms)'.format(
+        job / 1000, (job - baseline) / 1000))
+    heavy = loaded_modules() & {'serial', 'asyncio', 'selectors', 're'}
+    if heavy:
+        print('Modules loaded needlessly:', ', '.join(sorted(heavy)))
+    if args.budget is not None and imported / 1000 > args.budget:
+        print('Over the budget of {} ms.'.format(args.budget))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Measure construction time and memory of decoded messages.
+
+Run with:
+    $ python -m benchmarks.bench_message [count]
+"""
+import sys
+import timeit
+import tracemalloc
+
+from midi.utils import build_message_from_sequence
+
+
+def make_sequences(count):
+    return [(0x90 | (i % 16), i % 128, 1 + i % 127) for i in range(count)]
+
+
+def main(count=1000000):
+    sequences = make_sequences(count)
+
+    def decode():
+        return [build_message_from_sequence(seq) for seq in sequences]
+
+    tracemalloc.start()
+    messages = decode()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+
+    best = min(timeit.repeat(decode, number=1, repeat=3))
+    print('{} messages: {:.1f} ns/msg, {:.1f} bytes/msg'.format(
+        count, best / count * 1e9, peak / count))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""Compare the legacy per-byte write loop with the bulk write paths.
+
+Run with:
+    $ python -m benchmarks.bench_write
+"""
+import timeit
+from unittest.mock import patch
+
+from midi import Message, MidiConnector, NoteOn, ControlChange
+
+from .common import NullSerial
+
+
+def make_messages(count):
+    return [Message(NoteOn(i % 128, 100), 1) if i % 2 else
+            Message(ControlChange(7, i % 128), 2) for i in range(count)]
+
+
+def main(count=10000, repeat=5):
+    messages = make_messages(count)
+    with patch('midi.midi.Serial', NullSerial):
+        conn = MidiConnector('/dev/null')
+    serial = conn._MidiConnector__connector
+
+    def per_byte():
+        for message in messages:
+            for byte in message.bytes_content:
+                serial.write(byte)
+
+    def write():
+        for message in messages:
+            conn.write(message)
+
+    def write_many():
+        conn.write_many(messages)
+
+    for name, func in (('per-byte loop', per_byte), ('write()', write),
+                       ('write_many()', write_many)):
+        serial.calls = serial.bytes = 0
+        func()
+        calls, sent = serial.calls, serial.bytes
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print('{:<14} {:>9.1f} ns/msg {:>7} writes {:>7} bytes'.format(
+            name, best / count * 1e9, calls, sent))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Helpers shared by the benchmarks: timing, memory and serial stand-ins."""
+import gc
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+
+class NullSerial:
+    """Stand-in for serial.Serial which only counts syscalls and bytes."""
+    def __init__(self, *args, **kwargs):
+        self.calls = 0
+        self.bytes = 0
+        self.in_waiting = 0
+
+    def write(self, data):
+        self.calls += 1
+        self.bytes += len(data)
+        return len(data)
+
+    def read(self, size=1):
+        return b''
+
+
+class BufferSerial(NullSerial):
+    """Stand-in for serial.Serial serving the bytes of a buffer as input."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.load(b'')
+
+    def load(self, data):
+        self._data = memoryview(bytes(data))
+        self._position = 0
+
+    @property
+    def in_waiting(self):
+        return len(self._data) - self._position
+
+    @in_waiting.setter
+    def in_waiting(self, value):
+        pass
+
+    def read(self, size=1):
+        start = self._position
+        self._position = min(start + size, len(self._data))
+        return self._data[start:self._position].tobytes()
+
+
+def best_time(func, number=1, repeat=5):
+    """Return the best duration of 'number' calls to func(), in seconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def peak_memory(func):
+    """Return the result of func(), and the peak memory it allocated, in
+    bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, path):
+    """Write the results, and the environment they were measured in, as
+    JSON."""
+    document = {
+        'revision': git_revision(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return document
+
+
+def read_results(path):
+    with open(path) as f:
+        return json.load(f)
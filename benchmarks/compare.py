@@ -0,0 +1,55 @@
+"""Compare two JSON results files written by the benchmark suite.
+
+Run with:
+    $ python -m benchmarks.compare before.json after.json [--threshold 10]
+
+Exit with status 1 if a result got worse by more than 'threshold' percent.
+"""
+import argparse
+import json
+import sys
+
+from .common import read_results
+
+
+def key(entry):
+    return entry['name'], json.dumps(entry['params'], sort_keys=True)
+
+
+def compare(before, after, threshold=10):
+    """Return the (name, params, before, after, change) rows, and whether any
+    result regressed by more than 'threshold' percent."""
+    previous = {key(entry): entry['value'] for entry in before['results']}
+    rows = []
+    regressed = False
+    for entry in after['results']:
+        old = previous.get(key(entry))
+        if old is None:
+            continue
+        change = (entry['value'] - old) / old * 100 if old else 0
+        regressed = regressed or change > threshold
+        rows.append((entry['name'], entry['params'], old, entry['value'],
+                     change))
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='regression threshold, in percent')
+    args = parser.parse_args(argv)
+    before, after = read_results(args.before), read_results(args.after)
+    rows, regressed = compare(before, after, args.threshold)
+    print('{} -> {}'.format(before['revision'], after['revision']))
+    for name, params, old, new, change in rows:
+        flag = '  <-- regression' if change > args.threshold else ''
+        print('{:<22} {:<18} {:>12.1f} {:>12.1f} {:>+7.1f}%{}'.format(
+            name, ' '.join('{}={}'.format(*item) for item in params.items()),
+            old, new, change, flag))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+"""Benchmark suite of py-midi, writing its results as JSON.
+
+Every result is a duration or a size per message (or per byte), so lower is
+always better. Compare two runs with benchmarks.compare.
+
+Run with:
+    $ python -m benchmarks [--quick] [--output results.json] [name ...]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from unittest.mock import patch
+
+from midi import ControlChange, Message, MidiConnector, NoteOn, SysEx
+from midi.dispatch import Dispatcher
+from midi.journal import JournalReader, JournalWriter
+from midi.metrics import InMemoryMetrics, MetricsSink
+from midi.rtpmidi import RtpMidiSession
+from midi.state import ChannelState
+from midi.transports import MemoryTransport
+from midi.parser import MidiParser
+from midi.utils import build_message_from_sequence
+
+from .bench_import import JOB, import_time, startup_time
+from .common import BufferSerial, best_time, peak_memory, write_results
+
+SYSEX_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+
+
+def make_messages(count):
+    return [Message(NoteOn(i % 128, 1 + i % 127), 1 + i % 16) if i % 2 else
+            Message(ControlChange(7, i % 128), 1 + i % 16)
+            for i in range(count)]
+
+
+def make_stream(count):
+    return b''.join(bytes(message) for message in make_messages(count))
+
+
+def result(name, value, unit, **params):
+    return dict(name=name, value=value, unit=unit, params=params)
+
+
+def bench_encode(count, repeat):
+    messages = make_messages(count)
+
+    def content():
+        for message in messages:
+            message._content = None
+            message.content
+
+    def bytes_content():
+        for message in messages:
+            message._content = None
+            message.bytes_content
+
+    def to_bytes():
+        for message in messages:
+            message._content = None
+            bytes(message)
+
+    return [result('encode.' + func.__name__,
+                   best_time(func, repeat=repeat) / count * 1e9, 'ns/msg',
+                   count=count)
+            for func in (content, bytes_content, to_bytes)]
+
+
+def bench_decode(count, repeat):
+    messages = make_messages(count)
+    sequences = [tuple(message.content) for message in messages]
+    frames = [bytes(message) for message in messages]
+    packed = [message.to_packed() for message in messages]
+    stream = make_stream(count)
+
+    def sequence():
+        for seq in sequences:
+            build_message_from_sequence(seq)
+
+    def from_bytes():
+        for frame in frames:
+            Message.from_bytes(frame)
+
+    def from_packed():
+        for value in packed:
+            Message.from_packed(value)
+
+    def parser():
+        MidiParser().feed(stream)
+
+    with patch('midi.midi.Serial', BufferSerial):
+        conn = MidiConnector('/dev/null')
+    serial = conn._MidiConnector__connector
+
+    def connector_read():
+        serial.load(stream)
+        read = conn.read
+        for _ in range(count):
+            read()
+
+    def connector_read_many():
+        serial.load(stream)
+        conn.read_many()
+
+    return [result('decode.' + func.__name__,
+                   best_time(func, repeat=repeat) / count * 1e9, 'ns/msg',
+                   count=count)
+            for func in (sequence, from_bytes, from_packed, parser,
+                         connector_read, connector_read_many)]
+
+
+def bench_loopback(count, repeat):
+    """End-to-end throughput through a pseudo-terminal standing in for a
+    UART. The pty does not enforce the baudrate: this measures the software
+    overhead only."""
+    messages = make_messages(count)
+    master, slave = os.openpty()
+    try:
+        conn = MidiConnector(os.ttyname(slave), timeout=1)
+
+        def feed():
+            # Write the bytes on the other end, as a MIDI device would.
+            data = memoryview(b''.join(bytes(msg) for msg in messages))
+            while data:
+                sent = os.write(master, data[:4096])
+                data = data[sent:]
+
+        def run():
+            writer = threading.Thread(target=feed)
+            writer.start()
+            received = 0
+            while received < count:
+                batch = conn.read_many(timeout=1)
+                if not batch:
+                    raise RuntimeError('Loopback stalled.')
+                received += len(batch)
+            writer.join()
+
+        return [result('loopback.read_many',
+                       best_time(run, repeat=repeat) / count * 1e9, 'ns/msg',
+                       count=count)]
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def bench_transport(count, repeat):
+    """Throughput between two connectors, through an in-memory transport
+    and through an RTP-MIDI session over localhost, in batches of 64
+    messages."""
+    messages = make_messages(count)
+    batches = [messages[start:start + 64] for start in range(0, count, 64)]
+
+    def run(sender, receiver):
+        def transfer():
+            received = 0
+            for batch in batches:
+                sender.write_many(batch)
+                expected = received + len(batch)
+                while received < expected:
+                    messages = receiver.read_many(timeout=1)
+                    if not messages:
+                        raise RuntimeError('Transport stalled.')
+                    received += len(messages)
+        return best_time(transfer, repeat=repeat) / count * 1e9
+
+    local, remote = MemoryTransport.pair()
+    results = [result(
+        'transport.memory', run(MidiConnector(transport=local),
+                                MidiConnector(transport=remote)),
+        'ns/msg', count=count)]
+
+    with RtpMidiSession(0, host='127.0.0.1') as first, \
+            RtpMidiSession(0, host='127.0.0.1') as second:
+        invited = threading.Event()
+
+        def poll():
+            while not invited.is_set():
+                second.poll(0.01)
+
+        poller = threading.Thread(target=poll)
+        poller.start()
+        try:
+            first.invite('127.0.0.1', second.port)
+        finally:
+            invited.set()
+            poller.join()
+        results.append(result(
+            'transport.rtpmidi', run(MidiConnector(transport=first),
+                                     MidiConnector(transport=second)),
+            'ns/msg', count=count))
+    return results
+
+
+def bench_sysex(sizes, repeat):
+    results = []
+    for size in sizes:
+        payload = bytes(i % 128 for i in range(size))
+        message = Message(SysEx.from_payload(0x7d, payload))
+        data = bytes(message)
+        number = max(1, 10000 // size)
+
+        def encode():
+            message._content = None
+            bytes(message)
+
+        def decode():
+            MidiParser().feed(data)
+
+        results.append(result(
+            'sysex.encode', best_time(encode, number, repeat) / size * 1e9,
+            'ns/byte', size=size))
+        results.append(result(
+            'sysex.decode', best_time(decode, number, repeat) / size * 1e9,
+            'ns/byte', size=size))
+    return results
+
+
+def bench_metrics(count, repeat):
+    """Overhead of the metrics hooks: disabled, with a sink ignoring
+    everything, and with the in-memory sink."""
+    messages = make_messages(count)
+    stream = make_stream(count)
+    results = []
+    for sink in (None, MetricsSink(), InMemoryMetrics()):
+        name = type(sink).__name__ if sink is not None else 'disabled'
+        with patch('midi.midi.Serial', BufferSerial):
+            conn = MidiConnector('/dev/null', metrics=sink)
+        serial = conn._MidiConnector__connector
+
+        def read():
+            serial.load(stream)
+            while conn.read_many(max_messages=64):
+                pass
+
+        def write():
+            for message in messages:
+                conn.write(message)
+
+        results.append(result(
+            'metrics.read_many', best_time(read, repeat=repeat) / count * 1e9,
+            'ns/msg', count=count, sink=name))
+        results.append(result(
+            'metrics.write', best_time(write, repeat=repeat) / count * 1e9,
+            'ns/msg', count=count, sink=name))
+    return results
+
+
+def bench_state(count, repeat):
+    """Channel state tracking: updating it with decoded messages, to compare
+    with decode.parser, and copying it."""
+    messages = MidiParser().feed(make_stream(count))
+    state = ChannelState()
+    return [
+        result('state.update_many',
+               best_time(lambda: state.update_many(messages), repeat=repeat)
+               / count * 1e9, 'ns/msg', count=count),
+        result('state.snapshot',
+               best_time(state.snapshot, 1000, repeat) * 1e9, 'ns'),
+        result('state.chase', best_time(state.chase, 10, repeat) * 1e9,
+               'ns'),
+    ]
+
+
+def bench_dispatch(count, repeat):
+    """Routing decoded messages to handlers: an isinstance and channel chain,
+    as handler loops usually do, against the precompiled Dispatcher."""
+    messages = make_messages(count)
+    seen = []
+    handle = seen.append
+
+    def branches():
+        for message in messages:
+            message_type = message.type
+            if isinstance(message_type, NoteOn):
+                if message.channel == 3:
+                    handle(message)
+            elif isinstance(message_type, ControlChange):
+                if message_type.control_number == 7:
+                    handle(message)
+
+    dispatcher = Dispatcher()
+    dispatcher.add(handle, NoteOn, channel=3)
+    dispatcher.add(handle, ControlChange, control_number=7)
+    batches = Dispatcher()
+    batches.add(seen.extend, NoteOn, channel=3, batch=True)
+    batches.add(seen.extend, ControlChange, control_number=7, batch=True)
+
+    def timed(function):
+        def run():
+            function()
+            seen.clear()
+        return best_time(run, repeat=repeat) / count * 1e9
+
+    return [
+        result('dispatch.isinstance', timed(branches), 'ns/msg',
+               count=count),
+        result('dispatch.table',
+               timed(lambda: dispatcher.dispatch_many(messages)), 'ns/msg',
+               count=count),
+        result('dispatch.batch',
+               timed(lambda: batches.dispatch_many(messages)), 'ns/msg',
+               count=count),
+    ]
+
+
+def bench_journal(count, repeat):
+    """Recording chunks of 3 bytes into a journal, reading them back, and
+    opening the journal."""
+    chunks = [bytes(message) for message in make_messages(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.midj')
+
+        def append():
+            with JournalWriter(path) as journal:
+                for timestamp, chunk in enumerate(chunks):
+                    journal.append(chunk, timestamp)
+
+        def records():
+            with JournalReader(path) as journal:
+                for _ in journal.records():
+                    pass
+
+        def seek():
+            with JournalReader(path) as journal:
+                journal.seek(count // 2)
+
+        return [
+            result('journal.append',
+                   best_time(append, repeat=repeat) / count * 1e9, 'ns/record',
+                   count=count),
+            result('journal.records',
+                   best_time(records, repeat=repeat) / count * 1e9,
+                   'ns/record', count=count),
+            result('journal.open_and_seek',
+                   best_time(seek, 100, repeat) * 1e9, 'ns', count=count),
+        ]
+
+
+def bench_memory(count):
+    """Peak memory allocated to decode 'count' messages, scaled to one
+    million messages."""
+    stream = make_stream(count)
+    scale = 1000000 / count
+    _, parsed = peak_memory(lambda: MidiParser().feed(stream))
+    _, built = peak_memory(lambda: make_messages(count))
+    return [
+        result('memory.decode', parsed * scale, 'bytes/million', count=count),
+        result('memory.construct', built * scale, 'bytes/million',
+               count=count),
+    ]
+
+
+def bench_import(runs):
+    """Import time of the package, and startup overhead of a short-lived
+    job, measured in fresh interpreters."""
+    baseline = startup_time('pass', runs)
+    return [
+        result('import.midi', import_time('midi', runs) * 1000, 'ns',
+               runs=runs),
+        result('import.job_overhead', (startup_time(JOB, runs) - baseline)
+               * 1000, 'ns', runs=runs),
+    ]
+
+
+def run(quick=False, names=None):
+    count = 10000 if quick else 100000
+    repeat = 3 if quick else 5
+    sizes = SYSEX_SIZES[:-2] if quick else SYSEX_SIZES
+    benchmarks = {
+        'encode': lambda: bench_encode(count, repeat),
+        'decode': lambda: bench_decode(count, repeat),
+        'loopback': lambda: bench_loopback(count, repeat),
+        'transport': lambda: bench_transport(count, repeat),
+        'sysex': lambda: bench_sysex(sizes, repeat),
+        'metrics': lambda: bench_metrics(count, repeat),
+        'state': lambda: bench_state(count, repeat),
+        'dispatch': lambda: bench_dispatch(count, repeat),
+        'journal': lambda: bench_journal(count, repeat),
+        'memory': lambda: bench_memory(100000 if quick else 1000000),
+        'import': lambda: bench_import(5 if quick else 20),
+    }
+    results = []
+    for name, benchmark in benchmarks.items():
+        if names and name not in names:
+            continue
+        for entry in benchmark():
+            print('{:<30} {:>14.1f} {:<14} {}'.format(
+                entry['name'], entry['value'], entry['unit'],
+                entry['params']), file=sys.stderr)
+            results.append(entry)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, among '
+                        'encode, decode, loopback, transport, sysex, metrics, '
+                        'state, dispatch, journal, memory '
+                        'and import')
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer messages and repetitions')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='path of the JSON results file')
+    args = parser.parse_args(argv)
+    write_results(run(args.quick, args.names), args.output)
+    print('Results written to', args.output, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
-from .midi import Message, MidiConnector
+from .message import Message
+from .midi import MidiConnector
 from .types import (NoteOff, NoteOn, PolyphonicAftertouch,
     ControlChange, ProgramChange, ChannelAftertouch, PitchBend,
-    SysEx
+    SysEx, TimeCodeQuarterFrame, SongPosition, SongSelect, TuneRequest
 )
\ No newline at end of file
@@ -0,0 +1,244 @@
+# !/usr/bin/env python3
+
+import asyncio
+import os
+from collections import deque
+
+from .encoder import MidiEncoder
+from .message import Message
+from .midi import _serial_class
+from .parser import MidiParser
+from .types import SysEx
+
+READ_SIZE = 4096
+
+
+class AsyncMidiConnector:
+    """asyncio interface object between program and machine's serial port.
+
+    The serial port file descriptor is watched by the running event loop, so
+    that many ports can be handled by a single thread. The connector must be
+    created from a coroutine.
+
+    Args
+    ====
+    port (str): path to the machine's serial interface, eg '/dev/serial0'
+    on a RaspberryPi3
+
+    baudrate (int): default to 31250, and should not be changed.
+
+    running_status (bool, optional): see MidiConnector.
+
+    cache (midi.codec.MessageCache, optional): see MidiConnector.
+
+    high_water (int, optional): maximum number of bytes waiting in the output
+    buffer before write() waits for the port to catch up.
+
+    Example:
+    >>> conn = AsyncMidiConnector('/dev/serial0')
+    >>> async for msg in conn:
+    ...     await conn.write(msg)  # MIDI through
+    """
+    def __init__(self, port, baudrate=31250, running_status=False,
+                 cache=None, high_water=4096):
+        self.port = port
+        self.baudrate = baudrate
+        self.high_water = high_water
+        self._loop = asyncio.get_running_loop()
+        self._serial = _serial_class()(
+            port=port, baudrate=baudrate, timeout=0)
+        self._fd = self._serial.fileno()
+        self._parser = MidiParser(cache)
+        self._encoder = MidiEncoder(running_status)
+        self._pending = deque()
+        self._readers = []
+        self._output = bytearray()
+        self._drained = None
+        self._writing = False
+        self._closed = False
+        self._error = None
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def __repr__(self):
+        return "AsyncMidiConnector('{}', baudrate={})".format(
+            self.port, self.baudrate)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.read()
+        except EOFError:
+            raise StopAsyncIteration
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def out_waiting(self):
+        """Number of bytes in the output buffer, not sent yet."""
+        return len(self._output)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            # The device is gone (eg pseudo-terminal closed on the other end)
+            self._shutdown()
+            return
+        messages = self._parser.feed(data)
+        if messages:
+            self._pending.extend(messages)
+            self._wake_up(self._readers)
+
+    def _on_writable(self):
+        try:
+            sent = os.write(self._fd, self._output)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            self._shutdown(error)
+            return
+        del self._output[:sent]
+        if not self._output:
+            self._loop.remove_writer(self._fd)
+            self._writing = False
+            if self._drained is not None:
+                self._wake_up([self._drained])
+                self._drained = None
+
+    def _wake_up(self, waiters, error=None):
+        for waiter in waiters:
+            if not waiter.done():
+                if error is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(error)
+        waiters.clear()
+
+    def _shutdown(self, error=None):
+        if self._closed:
+            return
+        self._closed = True
+        # The bytes not sent yet never will be.
+        self._error = error
+        self._output.clear()
+        self._loop.remove_reader(self._fd)
+        if self._writing:
+            self._loop.remove_writer(self._fd)
+            self._writing = False
+        self._wake_up(self._readers, EOFError('MIDI port closed.'))
+        if self._drained is not None:
+            self._wake_up([self._drained], error or EOFError(
+                'MIDI port closed.'))
+            self._drained = None
+        self._serial.close()
+
+    async def read(self, channel=None):
+        """Return the next MIDI message received.
+
+        If 'channel' is specified, return only message(s) received on the given
+        channel: messages received on other channels are discarded.
+
+        Raise EOFError once the connector is closed.
+        """
+        if channel is not None:
+            assert 1 <= channel <= 16, \
+                "'channel' parameter must be an integer from 1 to 16."
+
+        pending = self._pending
+        while True:
+            while pending:
+                message = pending.popleft()
+                if (channel is None or message.channel == channel
+                        or isinstance(message.type, SysEx)):
+                    return message
+            if self._closed:
+                raise EOFError('MIDI port closed.')
+            waiter = self._loop.create_future()
+            self._readers.append(waiter)
+            await waiter
+
+    def read_many(self, max_messages=None):
+        """Return the list of messages already received, without waiting."""
+        pending = self._pending
+        if max_messages is None or max_messages >= len(pending):
+            messages = list(pending)
+            pending.clear()
+        else:
+            messages = [pending.popleft() for _ in range(max_messages)]
+        return messages
+
+    async def write(self, message):
+        """Send MIDI message, and return the number of bytes transmitted.
+
+        Wait for the output buffer to drain below 'high_water' if needed.
+        Raise the OSError of a failed write, which closes the connector, and
+        EOFError once the connector is closed.
+        """
+        assert isinstance(message, Message), TypeError(
+            "Argument 'message' must be type Message ({} given).".format(
+                (type(message))))
+        return await self._send(self._encoder.encode(message))
+
+    async def write_many(self, messages):
+        """Send several MIDI messages at once, and return the number of bytes
+        transmitted."""
+        messages = list(messages)
+        for message in messages:
+            assert isinstance(message, Message), TypeError(
+                "Argument 'messages' must only contain Message objects "
+                "({} given).".format(type(message)))
+        return await self._send(self._encoder.encode_many(messages))
+
+    def _check_open(self):
+        if self._closed:
+            raise EOFError('MIDI port closed.') from self._error
+
+    async def _send(self, data):
+        self._check_open()
+        self._output.extend(data)
+        if not self._writing:
+            self._on_writable()
+            if self._closed:
+                # Writing failed: report why, rather than the bytes as sent.
+                raise self._error or EOFError('MIDI port closed.')
+            if self._output:
+                self._loop.add_writer(self._fd, self._on_writable)
+                self._writing = True
+        if len(self._output) > self.high_water:
+            await self.drain()
+        return len(data)
+
+    async def drain(self):
+        """Wait until every byte of the output buffer has been sent.
+
+        Raise EOFError if the connector is closed, or the error which closed
+        it while waiting.
+        """
+        self._check_open()
+        if not self._output:
+            return
+        if self._drained is None:
+            self._drained = self._loop.create_future()
+        await asyncio.shield(self._drained)
+
+    async def close(self):
+        """Send the remaining output bytes, then close the serial port."""
+        if not self._closed:
+            try:
+                await self.drain()
+            finally:
+                self._shutdown()
@@ -0,0 +1,344 @@
+# !/usr/bin/env python3
+
+from array import array
+from itertools import compress
+
+from .message import Message
+from .codec import (STATUS_CHANNELS, STATUS_LENGTHS,
+                    decode_channel_message, decode_system_common)
+from .filters import MessageFilter
+from .parser import REAL_TIME_BYTES, SYSEX_END, SYSEX_START
+from .types import SysEx
+
+# 1 for the status bytes a batch may hold, 0 for the other ones.
+_VALID_STATUSES = bytes(
+    1 if STATUS_LENGTHS[status] or status == SYSEX_START else 0
+    for status in range(256))
+
+# Length of the Channel messages, 0 for the other bytes.
+_CHANNEL_LENGTHS = bytes(
+    STATUS_LENGTHS[status] if STATUS_CHANNELS[status] else 0
+    for status in range(256))
+
+# 1 for the NoteOn status bytes, and for the data byte 0.
+_NOTE_ON_STATUSES = bytes(
+    1 if 0x90 <= status <= 0x9f else 0 for status in range(256))
+_ZERO = bytes([1]) + bytes(255)
+
+
+class MessageBatch:
+    """A compact, column-oriented container of many MIDI messages.
+
+    Each column is an array with one item per message:
+    - status: the status byte (0xf0 for SysEx).
+    - data1, data2: the data bytes (0 when unused).
+    - channel: from 1 to 16, 0 for SysEx and System Common messages.
+    - timestamp: an integer timestamp, eg in nanoseconds (0 when unknown).
+
+    SysEx payloads are stored back to back in 'sysex_data'. 'sysex_rows'
+    holds the index of every SysEx message, and 'sysex_offsets' the bounds of
+    their payload: the payload of the n-th SysEx is
+    sysex_data[sysex_offsets[n]:sysex_offsets[n + 1]]. 'data1' holds the
+    manufacturer ID.
+
+    Message objects are only built on demand, when indexing or iterating. Their
+    timestamp is the one of the 'timestamp' column, None if 0. They are built
+    without checking every value again: call validate() after filling the
+    columns by hand.
+
+    Example:
+    >>> batch = MessageBatch.from_bytes(raw_bytes)
+    >>> notes = batch.select(batch.mask(channels=[10], types=[NoteOn]))
+    >>> notes.to_bytes()
+    """
+    def __init__(self):
+        self.status = array('B')
+        self.data1 = array('B')
+        self.data2 = array('B')
+        self.channel = array('B')
+        self.timestamp = array('q')
+        self.sysex_data = bytearray()
+        self.sysex_rows = array('L')
+        self.sysex_offsets = array('L', [0])
+
+    def __repr__(self):
+        return 'MessageBatch({} messages)'.format(len(self))
+
+    def __len__(self):
+        return len(self.status)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        status = self.status[index]
+        timestamp = self.timestamp[index] or None
+        if status == SYSEX_START:
+            start, end = self._sysex_bounds(index)
+            return Message._trusted(
+                SysEx._from_data(self.data1[index],
+                                 bytes(self.sysex_data[start:end])),
+                timestamp=timestamp)
+        length = STATUS_LENGTHS[status]
+        data1 = self.data1[index] if length > 1 else None
+        data2 = self.data2[index] if length == 3 else None
+        if status > SYSEX_START:
+            message = decode_system_common(status, data1, data2)
+        else:
+            message = decode_channel_message(status, data1, data2)
+        message._timestamp = timestamp
+        return message
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _sysex_bounds(self, index):
+        # sysex_rows is sorted: find the rank of 'index' by bisection.
+        rows = self.sysex_rows
+        low, high = 0, len(rows)
+        while low < high:
+            middle = (low + high) // 2
+            if rows[middle] < index:
+                low = middle + 1
+            else:
+                high = middle
+        return self.sysex_offsets[low], self.sysex_offsets[low + 1]
+
+    def _append(self, status, data1, data2, timestamp):
+        self.status.append(status)
+        self.data1.append(data1)
+        self.data2.append(data2)
+        self.channel.append(STATUS_CHANNELS[status])
+        self.timestamp.append(timestamp)
+
+    def _append_sysex(self, data1, payload, timestamp):
+        self.sysex_rows.append(len(self.status))
+        self._append(SYSEX_START, data1, 0, timestamp)
+        self.sysex_data += payload
+        self.sysex_offsets.append(len(self.sysex_data))
+
+    def append(self, message, timestamp=None):
+        """Add a Message at the end of the batch.
+
+        'timestamp' defaults to the message's timestamp, or 0 if it has none.
+        """
+        if timestamp is None:
+            timestamp = message.timestamp or 0
+        if isinstance(message.type, SysEx):
+            self._append_sysex(message.type.data1, message.type.data,
+                               timestamp)
+        else:
+            content = message.content
+            self._append(content[0], content[1] if len(content) > 1 else 0,
+                         content[2] if len(content) == 3 else 0, timestamp)
+
+    @classmethod
+    def from_messages(cls, messages, timestamps=None):
+        """Build a batch from Message objects, and optional timestamps."""
+        batch = cls()
+        if timestamps is None:
+            for message in messages:
+                batch.append(message)
+        else:
+            for message, timestamp in zip(messages, timestamps):
+                batch.append(message, timestamp)
+        return batch
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """Decode a whole buffer of raw MIDI bytes.
+
+        Running status is supported, Real-time bytes are skipped, as well as
+        System Common messages and incomplete messages. Messages are decoded
+        as MidiParser would: an interrupted or unterminated SysEx is dropped,
+        and decoding resumes at the next status byte.
+
+        A buffer only holding Channel messages of the same length, all with
+        their status byte, is split into columns with slices, without any
+        loop over its bytes.
+        """
+        batch = cls()
+        # Real-time bytes may be interleaved anywhere: drop them all first.
+        buffer = bytes(buffer).translate(None, REAL_TIME_BYTES)
+        if batch._from_uniform_bytes(buffer):
+            return batch
+        # Running status and SysEx make the boundaries of a message depend on
+        # the bytes before it, so the general case is decoded byte by byte.
+        status_column, data1_column, data2_column = \
+            batch.status, batch.data1, batch.data2
+        lengths = STATUS_LENGTHS
+        size = len(buffer)
+        status = 0
+        position = 0
+        while position < size:
+            byte = buffer[position]
+            if byte >= 0x80:
+                if byte == SYSEX_START:
+                    status = 0
+                    end = buffer.find(SYSEX_END, position)
+                    payload = buffer[position + 1:end]
+                    if end != -1 and len(payload) >= 2 \
+                            and max(payload) < 0x80:
+                        batch._append_sysex(payload[0], payload[1:], 0)
+                        position = end + 1
+                    else:
+                        # Empty, interrupted or unterminated SysEx: resync
+                        # on the next status byte, as MidiParser does.
+                        position += 1
+                    continue
+                status = byte if byte < SYSEX_START else 0
+                position += 1
+                continue
+            length = lengths[status]
+            if not length:
+                # Data byte without status
+                position += 1
+                continue
+            if length == 2:
+                status_column.append(status)
+                data1_column.append(byte)
+                data2_column.append(0)
+                position += 1
+                continue
+            position += 1
+            if position < size and buffer[position] < 0x80:
+                status_column.append(status)
+                data1_column.append(byte)
+                data2_column.append(buffer[position])
+                position += 1
+            # else: incomplete message, resync on the next status byte.
+
+        batch.channel = array(
+            'B', bytes(status_column).translate(STATUS_CHANNELS))
+        batch.timestamp = array('q', [0]) * len(status_column)
+        return batch
+
+    def _from_uniform_bytes(self, buffer):
+        """Fill the columns with slices of 'buffer' and return True, if it
+        only holds Channel messages of the same length, all with their status
+        byte. Return False otherwise, leaving the batch empty."""
+        for length in (3, 2):
+            count, remainder = divmod(len(buffer), length)
+            if not count or remainder:
+                continue
+            statuses = buffer[0::length]
+            if statuses.translate(_CHANNEL_LENGTHS).count(length) != count:
+                continue
+            data1 = buffer[1::length]
+            data2 = buffer[2::3] if length == 3 else bytes(count)
+            if max(data1) >= 0x80 or max(data2) >= 0x80:
+                continue
+            self.status = array('B', statuses)
+            self.data1 = array('B', data1)
+            self.data2 = array('B', data2)
+            self.channel = array('B', statuses.translate(STATUS_CHANNELS))
+            self.timestamp = array('q', [0]) * count
+            return True
+        return False
+
+    def to_bytes(self):
+        """Encode every message of the batch into raw MIDI bytes."""
+        count = len(self)
+        if not self.sysex_rows and count:
+            # Fast path: if every message has the same length, interleave the
+            # columns with slice assignments.
+            lengths = set(bytes(self.status).translate(STATUS_LENGTHS))
+            if lengths == {3}:
+                buffer = bytearray(3 * count)
+                buffer[0::3] = self.status
+                buffer[1::3] = self.data1
+                buffer[2::3] = self.data2
+                return bytes(buffer)
+            elif lengths == {2}:
+                buffer = bytearray(2 * count)
+                buffer[0::2] = self.status
+                buffer[1::2] = self.data1
+                return bytes(buffer)
+
+        buffer = bytearray()
+        sysex_index = 0
+        for index in range(count):
+            status = self.status[index]
+            if status == SYSEX_START:
+                start = self.sysex_offsets[sysex_index]
+                end = self.sysex_offsets[sysex_index + 1]
+                sysex_index += 1
+                buffer.append(status)
+                buffer.append(self.data1[index])
+                buffer += self.sysex_data[start:end]
+                buffer.append(SYSEX_END)
+            elif STATUS_LENGTHS[status] == 3:
+                buffer += bytes((status, self.data1[index], self.data2[index]))
+            elif STATUS_LENGTHS[status] == 2:
+                buffer += bytes((status, self.data1[index]))
+            else:
+                buffer.append(status)
+        return bytes(buffer)
+
+    def validate(self):
+        """Check every column at once, and raise ValueError if a message of
+        the batch is not valid."""
+        count = len(self)
+        for name in ('data1', 'data2', 'channel', 'timestamp'):
+            if len(getattr(self, name)) != count:
+                raise ValueError(
+                    "Column '{}' has {} items, {} expected.".format(
+                        name, len(getattr(self, name)), count))
+        if 0 in bytes(self.status).translate(_VALID_STATUSES):
+            raise ValueError('Invalid status byte in batch.')
+        if (max(self.data1, default=0) >= 0x80
+                or max(self.data2, default=0) >= 0x80
+                or max(self.sysex_data, default=0) >= 0x80):
+            raise ValueError('Invalid data byte in batch.')
+        if bytes(self.channel) != bytes(self.status).translate(
+                STATUS_CHANNELS):
+            raise ValueError('Channels do not match the status bytes.')
+        sysex_rows = [row for row, status in enumerate(self.status)
+                      if status == SYSEX_START]
+        if (list(self.sysex_rows) != sysex_rows
+                or len(self.sysex_offsets) != len(sysex_rows) + 1
+                or self.sysex_offsets[-1] != len(self.sysex_data)):
+            raise ValueError('SysEx rows or offsets do not match the '
+                             'status bytes.')
+
+    def mask(self, channels=None, types=None):
+        """Return a bytes mask, with 1 for each message matching the given
+        channels and types, 0 otherwise.
+
+        SysEx messages, which have no channel, match any channels. See
+        midi.filters.MessageFilter. As when indexing, a NoteOn with a
+        velocity of 0 is a NoteOff.
+        """
+        statuses = bytes(self.status)
+        count = len(statuses)
+        # 1 for every NoteOn with a velocity of 0, whose status byte becomes
+        # the NoteOff one: 0x10 less. Big integers do it for every row at
+        # once.
+        note_offs = (
+            int.from_bytes(statuses.translate(_NOTE_ON_STATUSES), 'big')
+            & int.from_bytes(bytes(self.data2).translate(_ZERO), 'big'))
+        if note_offs:
+            statuses = (int.from_bytes(statuses, 'big')
+                        - (note_offs << 4)).to_bytes(count, 'big')
+        return MessageFilter(channels, types).mask(statuses)
+
+    def select(self, mask):
+        """Return a new batch, holding the messages for which 'mask' is true.
+        """
+        batch = self.__class__()
+        batch.status = array('B', compress(self.status, mask))
+        batch.data1 = array('B', compress(self.data1, mask))
+        batch.data2 = array('B', compress(self.data2, mask))
+        batch.channel = array('B', compress(self.channel, mask))
+        batch.timestamp = array('q', compress(self.timestamp, mask))
+        for sysex_index, row in enumerate(self.sysex_rows):
+            if mask[row]:
+                start = self.sysex_offsets[sysex_index]
+                end = self.sysex_offsets[sysex_index + 1]
+                batch.sysex_data += self.sysex_data[start:end]
+                batch.sysex_offsets.append(len(batch.sysex_data))
+        if len(batch.sysex_offsets) > 1:
+            batch.sysex_rows = array('L', (
+                row for row, status in enumerate(batch.status)
+                if status == SYSEX_START))
+        return batch
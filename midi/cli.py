@@ -0,0 +1,546 @@
+# !/usr/bin/env python3
+"""Command line tools to analyse and transcode corpora of MIDI files.
+
+Run with:
+    $ python -m midi stats captures/*.midj songs/*.mid
+    $ python -m midi filter --channels 10 --output-dir drums/ songs/*.mid
+    $ python -m midi stats --types NoteOn,NoteOff --scaling songs/*.mid
+    $ python -m midi transpose --semitones -12 --output-dir low/ songs/*.mid
+    $ python -m midi convert --to mid --channel 1 --output-dir out/ *.raw
+
+Inputs are Standard MIDI Files, capture journals (see midi.journal) and raw
+MIDI byte streams, recognized by their content. None is loaded in memory at
+once: MIDI files and journals are memory-mapped, and raw streams are read
+block by block.
+
+Files are processed by a pool of processes, in chunks of a few files: each
+worker returns the result of a whole chunk, which is merged as soon as it is
+done. The throughput is reported on the standard error. --scaling runs the
+command with 1, 2, 4... up to --jobs processes, and reports the speedup of
+each run.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from heapq import merge
+
+from . import types as midi_types
+from .filters import MessageFilter
+from .journal import MAGIC as JOURNAL_MAGIC
+from .journal import JournalReader, JournalWriter
+from .message import Message
+from .parser import MidiParser
+from .smf import (HEADER_CHUNK, SET_TEMPO, MetaEvent, MidiFile,
+                  write_midi_file)
+from .types import (ControlChange, MidiMessageType, NoteOff, NoteOn,
+                    PolyphonicAftertouch)
+
+# Size of the blocks raw streams are read by.
+BLOCK_SIZE = 1 << 20
+
+# Output formats, and the extension of their files.
+EXTENSIONS = {'mid': '.mid', 'raw': '.raw', 'journal': '.midj'}
+
+# Ticks per quarter note, and tempo in microseconds per quarter note (120
+# beats per minute), of the MIDI files written from timestamped messages.
+DIVISION = 480
+TEMPO = 500000
+
+_NOTE_TYPES = (NoteOn, NoteOff, PolyphonicAftertouch)
+
+
+def detect_format(path):
+    """Return the format of the file at 'path': 'mid', 'journal' or
+    'raw'."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic == HEADER_CHUNK:
+        return 'mid'
+    if magic == JOURNAL_MAGIC:
+        return 'journal'
+    return 'raw'
+
+
+def read_raw(path, message_filter=None):
+    """Yield the messages of a raw MIDI byte stream, read block by block."""
+    parser = MidiParser(filter=message_filter)
+    with open(path, 'rb') as f:
+        for block in iter(partial(f.read, BLOCK_SIZE), b''):
+            yield from parser.feed(block)
+
+
+def read_messages(path, message_filter=None):
+    """Yield every message of the file at 'path', whatever its format. The
+    tracks of a MIDI file are merged in time order."""
+    file_format = detect_format(path)
+    if file_format == 'raw':
+        yield from read_raw(path, message_filter)
+        return
+    if file_format == 'journal':
+        with JournalReader(path) as journal:
+            yield from journal.messages(filter=message_filter)
+        return
+    with MidiFile(path) as song:
+        tracks = [_absolute_ticks(track) for track in song.tracks]
+        for _, message in merge(*tracks, key=lambda event: event[0]):
+            if message_filter is None or message_filter.table[message.status]:
+                yield message
+
+
+def _absolute_ticks(track):
+    ticks = 0
+    for delta, event in track:
+        ticks += delta
+        if not isinstance(event, MetaEvent):
+            yield ticks, event
+
+
+class CorpusStats:
+    """Histograms of the messages of many files, mergeable across processes.
+
+    Attributes:
+    - files, messages: number of files read, and of messages decoded.
+    - failures: list of the (path, error message) of the files which could
+    not be read.
+    - types: number of messages, by type name.
+    - channels: number of Channel messages, by channel - 1.
+    - notes: number of NoteOn, by note number.
+    - controllers: number of ControlChange, by controller number.
+    """
+    def __init__(self):
+        self.files = self.messages = 0
+        self.failures = []
+        self.types = {}
+        self.channels = [0] * 16
+        self.notes = [0] * 128
+        self.controllers = [0] * 128
+
+    def __repr__(self):
+        return 'CorpusStats(files={}, messages={})'.format(
+            self.files, self.messages)
+
+    def add_file(self, messages):
+        """Count the messages of one file. If reading them fails, nothing is
+        counted."""
+        # Counted apart, and merged once the whole file is read.
+        counts = self.__class__()
+        types = counts.types
+        channels, notes, controllers = \
+            counts.channels, counts.notes, counts.controllers
+        count = 0
+        for message in messages:
+            count += 1
+            message_type = message.type
+            name = type(message_type).__name__
+            types[name] = types.get(name, 0) + 1
+            if message.channel:
+                channels[message.channel - 1] += 1
+            if name == 'NoteOn':
+                notes[message_type.data1] += 1
+            elif name == 'ControlChange':
+                controllers[message_type.data1] += 1
+        counts.files = 1
+        counts.messages = count
+        self.merge(counts)
+
+    def merge(self, other):
+        """Add the counts of 'other' to this one."""
+        self.files += other.files
+        self.messages += other.messages
+        self.failures += other.failures
+        for name, count in other.types.items():
+            self.types[name] = self.types.get(name, 0) + count
+        for mine, theirs in ((self.channels, other.channels),
+                             (self.notes, other.notes),
+                             (self.controllers, other.controllers)):
+            for index, count in enumerate(theirs):
+                mine[index] += count
+
+    def as_dict(self):
+        return {
+            'files': self.files, 'messages': self.messages,
+            'failures': self.failures, 'types': self.types,
+            'channels': self.channels, 'notes': self.notes,
+            'controllers': self.controllers,
+        }
+
+    def format(self):
+        """Return the statistics as text tables."""
+        lines = ['{} files, {} messages, {} errors'.format(
+            self.files, self.messages, len(self.failures)), '', 'Types:']
+        for name, count in sorted(self.types.items(),
+                                  key=lambda item: -item[1]):
+            lines.append('  {:<22} {:>12}'.format(name, count))
+        lines += ['', 'Channels:']
+        lines += ['  {:>2} {:>12}'.format(channel + 1, count)
+                  for channel, count in enumerate(self.channels) if count]
+        lines += ['', 'Notes:']
+        lines += ['  {:>3} {:>12}'.format(note, count)
+                  for note, count in enumerate(self.notes) if count]
+        lines += ['', 'Controllers:']
+        lines += ['  {:>3} {:>12}'.format(number, count)
+                  for number, count in enumerate(self.controllers) if count]
+        return '\n'.join(lines)
+
+
+def make_transform(channel=None, semitones=0):
+    """Return a function turning a Message into the one to write, or None to
+    drop it: channel moved to 'channel', notes transposed by 'semitones'.
+    Notes transposed out of the 0-127 range are dropped."""
+    def transform(message):
+        if not message.channel:
+            # SysEx and System Common messages
+            return message
+        message_type = message.type
+        if semitones and isinstance(message_type, _NOTE_TYPES):
+            note = message_type.data1 + semitones
+            if not 0 <= note <= 127:
+                return None
+            message_type = type(message_type)(note, message_type.data2)
+        return Message(message_type, channel or message.channel,
+                       message.timestamp)
+    if channel is None and not semitones:
+        return None
+    return transform
+
+
+def _transform_track(track, message_filter, transform):
+    """Yield the (delta, event) of a track, filtered and transformed. The
+    delta of the dropped events is added to the next one."""
+    pending = 0
+    for delta, event in track:
+        if not isinstance(event, MetaEvent):
+            if message_filter is not None and \
+                    not message_filter.table[event.status]:
+                pending += delta
+                continue
+            if transform is not None:
+                event = transform(event)
+                if event is None:
+                    pending += delta
+                    continue
+        yield pending + delta, event
+        pending = 0
+
+
+def _timed_events(messages, division=DIVISION, tempo=TEMPO):
+    """Yield the (delta ticks, event) of a MIDI file track playing
+    'messages' at their timestamps, in nanoseconds. Messages without a
+    timestamp, eg read from raw streams, are played at once."""
+    yield 0, MetaEvent(SET_TEMPO, tempo.to_bytes(3, 'big'))
+    nanoseconds_per_tick = tempo * 1000 / division
+    start = None
+    previous = 0
+    for message in messages:
+        timestamp = message.timestamp
+        if timestamp is None:
+            yield 0, message
+            continue
+        if start is None:
+            start = timestamp
+        # Ticks are counted from the start, so rounding errors never add up.
+        ticks = max(previous,
+                    round((timestamp - start) / nanoseconds_per_tick))
+        yield ticks - previous, message
+        previous = ticks
+
+
+def transcode(path, output, to=None, message_filter=None, transform=None):
+    """Write the messages of 'path' to 'output', filtered and transformed,
+    in the format 'to' (default to the format of 'path'). Return the number
+    of messages written."""
+    file_format = detect_format(path)
+    to = to or file_format
+    written = 0
+
+    if file_format == 'mid' and to == 'mid':
+        counts = []
+
+        def counted(events):
+            count = 0
+            for event in events:
+                count += not isinstance(event[1], MetaEvent)
+                yield event
+            counts.append(count)
+
+        with MidiFile(path) as song:
+            write_midi_file(output, (
+                counted(_transform_track(track, message_filter, transform))
+                for track in song.tracks), song.format, song.division)
+        return sum(counts)
+
+    messages = read_messages(path, message_filter)
+    if transform is not None:
+        messages = (message for message in map(transform, messages)
+                    if message is not None)
+    if to == 'raw':
+        with open(output, 'wb') as f:
+            buffer = bytearray()
+            for message in messages:
+                buffer += bytes(message)
+                written += 1
+                if len(buffer) >= BLOCK_SIZE:
+                    f.write(buffer)
+                    buffer.clear()
+            f.write(buffer)
+    elif to == 'journal':
+        if file_format != 'journal':
+            raise ValueError('Only journals can be converted to journals.')
+        with JournalWriter(output) as journal:
+            for message in messages:
+                journal.append(bytes(message), message.timestamp)
+                written += 1
+    else:
+        counts = []
+
+        def events():
+            count = 0
+            for event in _timed_events(messages):
+                count += not isinstance(event[1], MetaEvent)
+                yield event
+            counts.append(count)
+
+        write_midi_file(output, [events()], format=0, division=DIVISION)
+        written = counts[0]
+    return written
+
+
+def _output_path(path, output_dir, to):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, name + EXTENSIONS[to])
+
+
+def check_outputs(paths, output_dir, to=None):
+    """Raise ValueError if two of 'paths' would be written to the same file
+    of 'output_dir', or if a file would be written over one of 'paths'."""
+    inputs = {os.path.realpath(path) for path in paths}
+    outputs = {}
+    for path in paths:
+        try:
+            output = _output_path(path, output_dir, to or detect_format(path))
+        except OSError:
+            # Reported when the file is processed.
+            continue
+        real = os.path.realpath(output)
+        if real in inputs:
+            raise ValueError('{} would be written over an input file.'
+                             .format(output))
+        if real in outputs:
+            raise ValueError('{} and {} would both be written to {}.'.format(
+                outputs[real], path, output))
+        outputs[real] = path
+
+
+def process_chunk(command, paths, options):
+    """Run 'command' on a chunk of files, in a worker process. Return the
+    result of the chunk: a CorpusStats for 'stats', the list of the
+    (path, output, messages) written otherwise. Errors are returned as
+    (path, None, message)."""
+    message_filter = None
+    if options.get('channels') or options.get('types'):
+        message_filter = MessageFilter(
+            options.get('channels'),
+            [getattr(midi_types, name) for name in options['types']]
+            if options.get('types') else None)
+    if command == 'stats':
+        stats = CorpusStats()
+        for path in paths:
+            try:
+                stats.add_file(read_messages(path, message_filter))
+            except (OSError, ValueError) as error:
+                stats.failures.append((path, str(error)))
+        return stats
+
+    transform = make_transform(options.get('channel'),
+                               options.get('semitones', 0))
+    results = []
+    for path in paths:
+        try:
+            to = options.get('to') or detect_format(path)
+            output = _output_path(path, options['output_dir'], to)
+            written = transcode(path, output, to, message_filter, transform)
+        except (OSError, ValueError) as error:
+            results.append((path, None, str(error)))
+        else:
+            results.append((path, output, written))
+    return results
+
+
+def _chunks(paths, size):
+    return [paths[start:start + size] for start in range(0, len(paths), size)]
+
+
+def run(command, paths, options, jobs=1, chunk_size=None, on_result=None):
+    """Run 'command' on every file of 'paths', with 'jobs' processes, and
+    return the merged result. 'on_result' is called with the result of every
+    chunk, as soon as it is done. Raise ValueError if the files written would
+    overwrite each other or an input, see check_outputs()."""
+    if chunk_size is None:
+        # About 4 chunks per process, to balance files of different sizes.
+        chunk_size = max(1, len(paths) // (jobs * 4))
+    if command != 'stats':
+        check_outputs(paths, options['output_dir'], options.get('to'))
+    chunks = _chunks(paths, chunk_size)
+    merged = CorpusStats() if command == 'stats' else []
+
+    def collect(result):
+        if command == 'stats':
+            merged.merge(result)
+        else:
+            merged.extend(result)
+        if on_result is not None:
+            on_result(result)
+
+    if jobs == 1:
+        for chunk in chunks:
+            collect(process_chunk(command, chunk, options))
+        return merged
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(process_chunk, command, chunk, options)
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            collect(future.result())
+    return merged
+
+
+def _scaling_jobs(jobs):
+    counts = []
+    count = 1
+    while count < jobs:
+        counts.append(count)
+        count *= 2
+    return counts + [jobs]
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def _name_list(value):
+    return value.split(',')
+
+
+def _parse_arguments(argv):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('paths', nargs='+', help='files to process')
+    common.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of processes (default: every core)')
+    common.add_argument('--chunk-size', type=int, default=None,
+                        help='number of files given to a process at once')
+    common.add_argument('--scaling', action='store_true',
+                        help='run with 1, 2, 4... --jobs processes, and '
+                        'report the speedup')
+    common.add_argument('--channels', type=_int_list,
+                        help='only keep the messages of these channels, eg '
+                        '1,10')
+    common.add_argument('--types', type=_name_list,
+                        help='only keep the messages of these types, eg '
+                        'NoteOn,ControlChange')
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('-o', '--output-dir', required=True,
+                        help='directory of the files written')
+
+    parser = argparse.ArgumentParser(
+        prog='python -m midi', description='Analyse and transcode MIDI '
+        'files, capture journals and raw MIDI streams.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    stats = commands.add_parser('stats', parents=[common],
+                                help='count the messages, by type, '
+                                'channel, note and controller')
+    stats.add_argument('--json', action='store_true',
+                       help='print the statistics as JSON')
+    commands.add_parser('filter', parents=[common, output],
+                        help='keep the messages of some channels or types')
+    transpose = commands.add_parser('transpose', parents=[common, output],
+                                    help='transpose the notes')
+    transpose.add_argument('-s', '--semitones', type=int, required=True)
+    convert = commands.add_parser('convert', parents=[common, output],
+                                  help='convert to another format')
+    convert.add_argument('--to', choices=sorted(EXTENSIONS), required=True)
+    convert.add_argument('--channel', type=int,
+                         help='move every Channel message to this channel')
+    args = parser.parse_args(argv)
+
+    for name in args.types or ():
+        midi_type = getattr(midi_types, name, None)
+        if not (isinstance(midi_type, type)
+                and issubclass(midi_type, MidiMessageType)):
+            parser.error('Unknown message type: {}'.format(name))
+    for channel in (args.channels or []) + [getattr(args, 'channel', None)]:
+        if channel is not None and not 1 <= channel <= 16:
+            parser.error('Channels must be from 1 to 16.')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+    if args.command != 'stats':
+        try:
+            check_outputs(args.paths, args.output_dir,
+                          getattr(args, 'to', None))
+        except ValueError as error:
+            parser.error(str(error))
+    return args
+
+
+def _file_size(path):
+    # Unreadable files are reported as failures when they are processed.
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def main(argv=None):
+    args = _parse_arguments(argv)
+    options = {
+        'channels': args.channels, 'types': args.types,
+        'channel': getattr(args, 'channel', None),
+        'semitones': getattr(args, 'semitones', 0),
+        'to': getattr(args, 'to', None),
+        'output_dir': getattr(args, 'output_dir', None),
+    }
+    if options['output_dir'] is not None:
+        os.makedirs(options['output_dir'], exist_ok=True)
+    size = sum(_file_size(path) for path in args.paths)
+
+    def report(result):
+        if args.command != 'stats':
+            for path, output, written in result:
+                if output is not None:
+                    print('{} -> {} ({} messages)'.format(
+                        path, output, written))
+
+    timings = []
+    for jobs in _scaling_jobs(args.jobs) if args.scaling else [args.jobs]:
+        start = time.perf_counter()
+        result = run(args.command, args.paths, options, jobs,
+                     args.chunk_size, None if args.scaling else report)
+        elapsed = time.perf_counter() - start
+        timings.append((jobs, elapsed))
+        print('{} files, {:.1f} MB in {:.2f} s with {} process{}: '
+              '{:.1f} MB/s'.format(
+                  len(args.paths), size / 1e6, elapsed, jobs,
+                  'es' if jobs > 1 else '', size / 1e6 / elapsed),
+              file=sys.stderr)
+    if args.scaling:
+        baseline = timings[0][1]
+        print('Scaling:', file=sys.stderr)
+        for jobs, elapsed in timings:
+            print('  {:>3} processes: x{:.2f}'.format(
+                jobs, baseline / elapsed), file=sys.stderr)
+
+    if args.command == 'stats':
+        failures = result.failures
+        if args.json:
+            print(json.dumps(result.as_dict(), indent=2))
+        else:
+            print(result.format())
+    else:
+        failures = [(path, error) for path, output, error in result
+                    if output is None]
+    for path, error in failures:
+        print('{}: {}'.format(path, error), file=sys.stderr)
+    return 1 if failures else 0
@@ -0,0 +1,194 @@
+# !/usr/bin/env python3
+"""Lookup tables and caches used to decode MIDI messages quickly.
+
+Every table is indexed by the value of the status byte (0 to 255).
+"""
+
+from .message import Message
+from .types import NUMBERS_TYPE, SYSTEM_COMMON_TYPES, NoteOff, NoteOn, SysEx
+from .utils import (get_channel_from_status,
+                    get_message_type_number_from_status)
+
+# Number of data bytes following the status byte, indexed by type number.
+DATA_LENGTHS = {
+    0x8: 2, 0x9: 2, 0xa: 2, 0xb: 2, 0xc: 1, 0xd: 1, 0xe: 2
+}
+
+# Number of data bytes of the System Common messages, indexed by status byte.
+SYSTEM_COMMON_LENGTHS = {0xf1: 1, 0xf2: 2, 0xf3: 1, 0xf6: 0}
+
+_SYSTEM_COMMON_STATUSES = {
+    midi_type._status: midi_type for midi_type in SYSTEM_COMMON_TYPES}
+
+# Type of message (MidiMessageType child class), or None if the status byte
+# does not start a message known by the library.
+STATUS_TYPES = tuple(
+    NUMBERS_TYPE[get_message_type_number_from_status(status)]
+    if 0x80 <= status <= 0xf0 else _SYSTEM_COMMON_STATUSES.get(status)
+    for status in range(256))
+
+# Channel of a Channel message, from 1 to 16 (0 for the other messages).
+STATUS_CHANNELS = bytes(
+    get_channel_from_status(status) if 0x80 <= status < 0xf0 else 0
+    for status in range(256))
+
+# Number of data bytes of a Channel message (0 for the other messages).
+STATUS_DATA_LENGTHS = bytes(
+    DATA_LENGTHS.get(get_message_type_number_from_status(status), 0)
+    if status >= 0x80 else 0 for status in range(256))
+
+# Total number of bytes of a Channel or System Common message (0 for the
+# other messages).
+STATUS_LENGTHS = bytes(
+    STATUS_DATA_LENGTHS[status] + 1 if STATUS_DATA_LENGTHS[status]
+    else SYSTEM_COMMON_LENGTHS.get(status, -1) + 1
+    for status in range(256))
+
+SYSEX_START = 0xf0
+SYSEX_END = 0xf7
+
+# Bits of a packed message which must be 0, indexed by message length.
+_PACKED_UNUSED_MASKS = (0, 0xffff, 0xff, 0)
+
+_new = object.__new__
+_trusted_message = Message._trusted
+
+
+def decode_channel_message(status, data1, data2=None):
+    """Return the Message of a Channel message from its bytes values.
+
+    As for any decoded message, a NoteOn with a velocity of 0 is returned as
+    a NoteOff.
+
+    The values are trusted, not checked: they must come from a valid status
+    byte and data bytes, eg split by the parser. See decode_bytes() for
+    untrusted input.
+    """
+    midi_type = STATUS_TYPES[status]
+    if data2 == 0 and midi_type is NoteOn:
+        midi_type = NoteOff
+    message_type = _new(midi_type)
+    message_type._data1 = data1
+    message_type._data2 = data2
+    return _trusted_message(message_type, STATUS_CHANNELS[status])
+
+
+def decode_system_common(status, data1=None, data2=None):
+    """Return the Message of a System Common message from its bytes values.
+
+    As decode_channel_message(), the values are trusted, not checked.
+    """
+    message_type = _new(STATUS_TYPES[status])
+    message_type._data1 = data1
+    message_type._data2 = data2
+    return _trusted_message(message_type)
+
+
+def decode_bytes(data):
+    """Return the Message held by 'data', a bytes-like object holding exactly
+    one complete Channel, System Common or SysEx message, status byte
+    included.
+
+    The whole buffer is checked at once: raise ValueError if it is not a
+    valid message.
+    """
+    length = len(data)
+    if not length:
+        raise ValueError('Empty MIDI message.')
+    status = data[0]
+    if status == SYSEX_START:
+        # Manufacturer ID and at least one payload byte, as for MidiParser
+        # and the SysEx constructor.
+        if length < 4 or data[-1] != SYSEX_END or max(data[1:-1]) >= 0x80:
+            raise ValueError('Invalid SysEx message: {}.'.format(
+                bytes(data[:16]).hex()))
+        return _trusted_message(
+            SysEx._from_data(data[1], bytes(data[2:-1])))
+    if length != STATUS_LENGTHS[status]:
+        raise ValueError('Invalid MIDI message: {}.'.format(
+            bytes(data[:16]).hex()))
+    if length == 1:
+        return decode_system_common(status)
+    data1 = data[1]
+    data2 = data[2] if length == 3 else None
+    if (data1 | (data2 or 0)) & 0x80:
+        raise ValueError('Invalid data byte in MIDI message: {}.'.format(
+            bytes(data).hex()))
+    if status < SYSEX_START:
+        return decode_channel_message(status, data1, data2)
+    return decode_system_common(status, data1, data2)
+
+
+def decode_packed(packed):
+    """Return the Message packed into an integer by Message.to_packed():
+    status << 16 | data1 << 8 | data2.
+
+    Raise ValueError if 'packed' is not a valid Channel or System Common
+    message. The data bytes which the type does not use must be 0.
+    """
+    status = packed >> 16
+    length = STATUS_LENGTHS[status] if 0 <= status <= 0xff else 0
+    if (not length or packed & 0x8080
+            or packed & _PACKED_UNUSED_MASKS[length]):
+        raise ValueError('Invalid packed MIDI message: {:#x}.'.format(packed))
+    if length == 1:
+        return decode_system_common(status)
+    data1 = (packed >> 8) & 0x7f
+    data2 = packed & 0x7f if length == 3 else None
+    if status < SYSEX_START:
+        return decode_channel_message(status, data1, data2)
+    return decode_system_common(status, data1, data2)
+
+
+class MessageCache:
+    """A bounded cache of decoded Channel messages.
+
+    Messages are immutable, so the same Message instance can be returned for
+    every occurrence of the same bytes. This spares the allocation of new
+    objects for messages repeated often, eg NoteOn/NoteOff pairs or Control
+    Changes.
+
+    Args
+    ====
+    maxsize (int): maximum number of messages kept. When the cache is full,
+    the oldest entry is evicted.
+
+    Attributes:
+    - hits, misses: number of decodings served by, or missed by the cache.
+    """
+    def __init__(self, maxsize=4096):
+        assert maxsize >= 1, "'maxsize' must be a positive integer."
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._messages = {}
+
+    def __repr__(self):
+        return 'MessageCache(maxsize={}, hits={}, misses={})'.format(
+            self.maxsize, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def decode(self, status, data1, data2=None):
+        """Return the Message of a Channel message, from the cache if
+        possible. See decode_channel_message().
+
+        Messages are cached by their packed value, see Message.to_packed().
+        """
+        key = (status << 16) | (data1 << 8) | (data2 or 0)
+        message = self._messages.get(key)
+        if message is not None:
+            self.hits += 1
+            return message
+        self.misses += 1
+        message = decode_channel_message(status, data1, data2)
+        if len(self._messages) >= self.maxsize:
+            # Dicts keep insertion order: evict the oldest entry.
+            del self._messages[next(iter(self._messages))]
+        self._messages[key] = message
+        return message
+
+    def clear(self):
+        self._messages.clear()
+        self.hits = self.misses = 0
@@ -0,0 +1,320 @@
+# !/usr/bin/env python3
+"""Call handlers for incoming messages, routed by a precompiled table.
+
+Example:
+>>> dispatcher = Dispatcher()
+>>> @dispatcher.on(NoteOn, channel=3)
+... def play(message):
+...     print(message.note_number)
+>>> @dispatcher.on(ControlChange, control_number=64, batch=True)
+... def sustain(messages):
+...     print(messages[-1].value)
+>>> dispatcher.run(MidiConnector('/dev/serial0'))
+"""
+
+from .codec import STATUS_CHANNELS, STATUS_TYPES
+from .types import DataAttribute, MidiMessageType
+
+
+class Registration:
+    """A handler, and the messages it is called for. See Dispatcher.on()."""
+    def __init__(self, handler, types, channels=None, data=None, batch=False):
+        self.handler = handler
+        self.types = types
+        self.channels = channels
+        self.data = data
+        self.batch = batch
+
+    def __repr__(self):
+        return 'Registration({}, types={}, channels={}, data={})'.format(
+            getattr(self.handler, '__name__', self.handler),
+            sorted(t.__name__ for t in self.types),
+            sorted(self.channels) if self.channels is not None else None,
+            sorted(self.data) if self.data is not None else None)
+
+    def selects(self, status):
+        """Return whether the messages with this status byte are handled,
+        whatever their data bytes."""
+        if STATUS_TYPES[status] not in self.types:
+            return False
+        channel = STATUS_CHANNELS[status]
+        return (not channel or self.channels is None
+                or channel in self.channels)
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return frozenset((value,))
+    return frozenset(value)
+
+
+def _data_values(types, data):
+    """Return the set of the data1 values selected by the keyword argument
+    'data', eg {'control_number': 64}."""
+    (name, values), = data.items()
+    offset = 0
+    for midi_type in types:
+        assert midi_type._attributes[:1] == (name,), \
+            "{} has no first data byte named '{}'.".format(
+                midi_type.__name__, name)
+        attribute = getattr(midi_type, name)
+        if isinstance(attribute, DataAttribute):
+            offset = attribute.offset
+    values = frozenset(value - offset for value in _as_set(values))
+    assert all(0 <= value <= 127 for value in values), \
+        "'{}' values out of range.".format(name)
+    return values
+
+
+class _Handlers:
+    """The handlers of a table entry, in order, with their batch flag."""
+    __slots__ = ('handlers', 'batched', 'call')
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.batched = any(batch for _, batch in handlers)
+        if len(handlers) == 1:
+            # Called for each message, when there is no batch handler.
+            self.call = handlers[0][0]
+        else:
+            self.call = self._call
+
+    def _call(self, message):
+        for handler, _ in self.handlers:
+            handler(message)
+
+    def deliver(self, run):
+        for handler, batch in self.handlers:
+            if batch:
+                handler(run)
+            else:
+                for message in run:
+                    handler(message)
+
+
+class Dispatcher:
+    """Call the handlers registered for each message, without any isinstance
+    or channel check.
+
+    The registrations are compiled into a table indexed by the status byte,
+    giving the handlers of the messages with this status. When a registration
+    also selects the first data byte (eg the control number), the entry of its
+    status bytes is a second table, indexed by data1. Routing a message is
+    then one or two lookups, whatever the number of handlers.
+
+    Handlers are called in the order they were registered. A message matching
+    no registration goes to 'default', if any.
+
+    Args
+    ====
+    default (callable, optional): handler of the messages matching no
+    registration.
+
+    Attributes:
+    - registrations: list of the Registration objects, in order.
+    - handled, unhandled: number of messages dispatched to at least one
+    handler, the default one included, and to none.
+    """
+    def __init__(self, default=None):
+        self.default = default
+        self.registrations = []
+        self.handled = self.unhandled = 0
+        self._running = False
+        self._compile()
+
+    def __repr__(self):
+        return 'Dispatcher(registrations={})'.format(len(self.registrations))
+
+    def on(self, message_type, channel=None, batch=False, **data):
+        """Return a decorator registering a handler for the messages of
+        'message_type'.
+
+        Args
+        ====
+        message_type (MidiMessageType class, or tuple of them): types of the
+        messages to handle.
+
+        channel (int or iterable of int, optional): channels of the messages
+        to handle, from 1 to 16. By default, every channel. SysEx and System
+        Common messages, which have no channel, are handled whatever the
+        channels.
+
+        batch (bool, optional): if True, the handler is called with the list
+        of consecutive messages routed to the same handlers, rather than once
+        per message. See dispatch_many().
+
+        data (optional): a single keyword, named after the first data byte of
+        the types, eg control_number=64 or note_number=[36, 38], to only
+        handle the messages with these values.
+
+        Example:
+        >>> @dispatcher.on(NoteOn, channel=10, note_number=36)
+        ... def kick(message):
+        ...     pass
+        """
+        def decorator(handler):
+            self.add(handler, message_type, channel, batch, **data)
+            return handler
+        return decorator
+
+    def add(self, handler, message_type, channel=None, batch=False, **data):
+        """Register 'handler', see on(), and return its Registration."""
+        if isinstance(message_type, type):
+            message_type = (message_type,)
+        types = frozenset(message_type)
+        assert types and all(issubclass(t, MidiMessageType) for t in types), \
+            "'message_type' must be MidiMessageType classes."
+        channels = _as_set(channel)
+        if channels is not None:
+            assert all(1 <= channel <= 16 for channel in channels), \
+                "'channel' must be integers from 1 to 16."
+        assert len(data) <= 1, 'Only the first data byte can be selected.'
+        registration = Registration(
+            handler, types, channels,
+            _data_values(types, data) if data else None, batch)
+        self.registrations.append(registration)
+        self._compile()
+        return registration
+
+    def remove(self, handler):
+        """Unregister every registration of 'handler'."""
+        self.registrations = [registration for registration
+                              in self.registrations
+                              if registration.handler != handler]
+        self._compile()
+
+    def _compile(self):
+        # Identical lists of handlers share the same _Handlers, so that
+        # consecutive messages routed to the same handlers are found with an
+        # identity check.
+        shared = {}
+        default = ((self.default, False),) if self.default is not None else ()
+
+        def handlers(registrations, data1=None):
+            found = tuple(
+                (registration.handler, registration.batch)
+                for registration in registrations
+                if registration.data is None
+                or data1 in registration.data) or default
+            if not found:
+                return None
+            if found not in shared:
+                shared[found] = _Handlers(found)
+            return shared[found]
+
+        table = []
+        data_table = []
+        for status in range(256):
+            registrations = [registration for registration
+                             in self.registrations
+                             if registration.selects(status)]
+            if STATUS_TYPES[status] is None:
+                table.append(None)
+                data_table.append(None)
+            elif any(registration.data is not None
+                     for registration in registrations):
+                table.append(None)
+                data_table.append(tuple(
+                    handlers(registrations, data1) for data1 in range(128)))
+            else:
+                table.append(handlers(registrations))
+                data_table.append(None)
+        self._table = tuple(table)
+        self._data_table = tuple(data_table)
+
+    def handlers(self, message):
+        """Return the list of the handlers called for 'message'."""
+        handlers = self._route(message)
+        if handlers is None:
+            return []
+        return [handler for handler, _ in handlers.handlers]
+
+    def _route(self, message):
+        message_type = message._type
+        status = message_type._status
+        if status < 0xf0:
+            status += message._channel - 1
+        by_data = self._data_table[status]
+        if by_data is None:
+            return self._table[status]
+        return by_data[message_type._data1]
+
+    def dispatch(self, message):
+        """Call the handlers of a single message. Batch handlers are called
+        with a list of one message. Return whether any handler was called."""
+        handlers = self._route(message)
+        if handlers is None:
+            self.unhandled += 1
+            return False
+        self.handled += 1
+        handlers.deliver([message])
+        return True
+
+    def dispatch_many(self, messages):
+        """Call the handlers of 'messages', any iterable of Message, and
+        return the number of messages handled.
+
+        The consecutive messages routed to the same handlers, among which a
+        batch handler, form a run; the messages handled by nobody do not
+        interrupt it. Each handler of the run is called in turn: once with
+        the whole run if it is a batch handler, once per message otherwise.
+        So a batch handler eg receives every fader update of a burst at once,
+        and can only keep the latest one. Without any batch handler, the
+        handlers are called as soon as a message is routed.
+        """
+        table = self._table
+        data_table = self._data_table
+        run = None
+        run_handlers = None
+        handled = unhandled = 0
+        for message in messages:
+            message_type = message._type
+            status = message_type._status
+            if status < 0xf0:
+                status += message._channel - 1
+            by_data = data_table[status]
+            if by_data is None:
+                handlers = table[status]
+            else:
+                handlers = by_data[message_type._data1]
+            if handlers is None:
+                unhandled += 1
+                continue
+            handled += 1
+            if handlers is run_handlers:
+                run.append(message)
+            else:
+                if run_handlers is not None:
+                    run_handlers.deliver(run)
+                if handlers.batched:
+                    run_handlers = handlers
+                    run = [message]
+                else:
+                    run_handlers = None
+                    handlers.call(message)
+        if run_handlers is not None:
+            run_handlers.deliver(run)
+        self.handled += handled
+        self.unhandled += unhandled
+        return handled
+
+    def poll(self, connector, timeout=0):
+        """Read the messages received by 'connector', waiting at most
+        'timeout' seconds for one, and dispatch them. Return the number of
+        messages read."""
+        messages = connector.read_many(timeout=timeout)
+        self.dispatch_many(messages)
+        return len(messages)
+
+    def run(self, connector, poll_interval=0.1):
+        """Dispatch the messages received by 'connector' until stop() is
+        called, from a handler, another thread or a signal handler. stop()
+        takes effect within 'poll_interval' seconds."""
+        self._running = True
+        while self._running:
+            self.poll(connector, poll_interval)
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,52 @@
+# !/usr/bin/env python3
+
+from .parser import REAL_TIME_START, SYSEX_START
+
+
+class MidiEncoder:
+    """Turn messages into the bytes to send on a MIDI port.
+
+    Args
+    ====
+    running_status (bool, optional): if True, omit the status byte of a
+    message when it is the same as the one of the previous message.
+    Channel messages set the running status, System Common messages and SysEx
+    cancel it, whereas Real-time messages leave it untouched.
+    """
+    def __init__(self, running_status=False):
+        self.running_status = running_status
+        self.last_status = None
+
+    def __repr__(self):
+        return 'MidiEncoder(running_status={})'.format(self.running_status)
+
+    def reset(self):
+        """Forget the running status: the next status byte is always sent."""
+        self.last_status = None
+
+    def encode(self, message):
+        """Return the list of bytes values to send for 'message' (bytes for a
+        SysEx)."""
+        status = message.status
+        if status == SYSEX_START:
+            self.last_status = None
+            return bytes(message)
+        content = message.content
+        if status < SYSEX_START:
+            if self.running_status and status == self.last_status:
+                return content[1:]
+            self.last_status = status
+        elif status < REAL_TIME_START:
+            self.last_status = None
+        return content
+
+    def encode_many(self, messages):
+        """Return a bytearray holding all the encoded 'messages'."""
+        contents = [self.encode(message) for message in messages]
+        buffer = bytearray(sum(map(len, contents)))
+        offset = 0
+        for content in contents:
+            end = offset + len(content)
+            buffer[offset:end] = content
+            offset = end
+        return buffer
@@ -0,0 +1,79 @@
+# !/usr/bin/env python3
+
+from .codec import STATUS_CHANNELS, STATUS_TYPES
+
+
+class MessageFilter:
+    """A precompiled filter on the channel and the type of messages.
+
+    The filter is compiled into a 256-entry acceptance table, indexed by the
+    status byte, so checking a message only takes a single lookup, as soon
+    as its status byte is known.
+
+    Args
+    ====
+    channels (iterable of int, optional): channels to accept, from 1 to 16.
+    By default, accept every channel. SysEx messages, which have no channel,
+    are accepted whatever the channels.
+
+    types (iterable of MidiMessageType classes, optional): types of messages
+    to accept. By default, accept every type.
+
+    Example:
+    >>> drums = MessageFilter(channels=[10], types=[NoteOn, NoteOff])
+    >>> drums.accepts(0x99)
+    True
+    """
+    def __init__(self, channels=None, types=None):
+        if channels is not None:
+            channels = frozenset(channels)
+            assert all(1 <= channel <= 16 for channel in channels), \
+                "'channels' must be integers from 1 to 16."
+        if types is not None:
+            types = frozenset(types)
+        self.channels = channels
+        self.types = types
+        self.table = bytes(
+            self._accepts(status) for status in range(256))
+
+    def __repr__(self):
+        return 'MessageFilter(channels={}, types={})'.format(
+            sorted(self.channels) if self.channels is not None else None,
+            sorted(t.__name__ for t in self.types)
+            if self.types is not None else None)
+
+    def __and__(self, other):
+        """Return a filter accepting what both filters accept."""
+        combined = self.__class__.__new__(self.__class__)
+        combined.channels = _intersection(self.channels, other.channels)
+        combined.types = _intersection(self.types, other.types)
+        combined.table = bytes(
+            a & b for a, b in zip(self.table, other.table))
+        return combined
+
+    def _accepts(self, status):
+        midi_type = STATUS_TYPES[status]
+        if midi_type is None:
+            return False
+        if self.types is not None and midi_type not in self.types:
+            return False
+        channel = STATUS_CHANNELS[status]
+        return (not channel or self.channels is None
+                or channel in self.channels)
+
+    def accepts(self, status):
+        """Return whether messages with the given status byte are accepted."""
+        return bool(self.table[status])
+
+    def mask(self, statuses):
+        """Return a bytes mask, with 1 for each accepted status byte of
+        'statuses', 0 otherwise."""
+        return bytes(statuses).translate(self.table)
+
+
+def _intersection(first, second):
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return first & second
@@ -0,0 +1,343 @@
+# !/usr/bin/env python3
+"""Append-only journal of the raw bytes received from MIDI ports.
+
+A journal stores timestamped chunks of raw MIDI bytes, as read from a port,
+for audit and replay. The file is made of:
+
+- a header: the magic b'MIDJ' and the format version.
+- blocks, each one a BLOCK_HEADER (payload size, record count, first and last
+timestamps) followed by its records. A record is a RECORD_HEADER (time since
+the first record of the block, in nanoseconds, and length) followed by the
+bytes.
+- when the journal is closed, the index of the blocks, one INDEX_ENTRY (first
+timestamp, offset) per block, and a TRAILER pointing to it.
+
+Every integer is little-endian. Timestamps are integers in nanoseconds, by
+default time.time_ns() values.
+
+The reader maps the file in memory and only reads the trailer when opening:
+even a journal of many GB opens at once. Seeking to a timestamp is a binary
+search on the index. A journal left without index, eg by a crash, is
+recovered by scanning its block headers.
+
+Example:
+>>> with JournalWriter('capture.midj') as journal:
+...     conn = MidiConnector('/dev/serial0', journal=journal)
+...     ...
+>>> with JournalReader('capture.midj') as journal:
+...     journal.replay(MidiConnector('/dev/serial1'), start=journal.start_time)
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from .parser import MidiParser
+
+MAGIC = b'MIDJ'
+INDEX_MAGIC = b'MIDX'
+VERSION = 1
+
+FILE_HEADER = struct.Struct('<4sH2x')
+BLOCK_HEADER = struct.Struct('<IIqq')
+RECORD_HEADER = struct.Struct('<IH')
+INDEX_ENTRY = struct.Struct('<qQ')
+TRAILER = struct.Struct('<QQ4s')
+
+# Longest record, and longest time between the first and last records of a
+# block. Longer chunks are split into several records.
+MAX_RECORD = 0xffff
+MAX_DELTA = 0xffffffff
+
+
+class JournalError(ValueError):
+    """Raised when a file is not a valid journal."""
+
+
+class JournalWriter:
+    """Record raw MIDI bytes into a new journal file.
+
+    Records are grouped into blocks in memory, and every full block is
+    written with a single buffered write. The index is written by close():
+    use the writer as a context manager.
+
+    Timestamps must not decrease: a record older than the previous one is
+    stored with the timestamp of the previous one.
+
+    Args
+    ====
+    path (str): path of the journal, overwritten if it exists.
+
+    block_size (int, optional): maximum size of a block, in bytes. Smaller
+    blocks make seeking more precise, and the index bigger.
+
+    Attributes:
+    - records, bytes: number of records and MIDI bytes written.
+    """
+    def __init__(self, path, block_size=65536):
+        assert block_size > RECORD_HEADER.size, "'block_size' is too small."
+        self.path = path
+        self.block_size = block_size
+        self.records = 0
+        self.bytes = 0
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._offset = FILE_HEADER.size
+        self._index = bytearray()
+        self._block = bytearray()
+        self._count = 0
+        self._first = self._last = 0
+
+    def __repr__(self):
+        return "JournalWriter('{}', records={})".format(
+            self.path, self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def append(self, data, timestamp=None):
+        """Record 'data', raw bytes received at 'timestamp' (default to
+        time.time_ns())."""
+        if not data:
+            return
+        if timestamp is None:
+            timestamp = time.time_ns()
+        if self._count and timestamp < self._last:
+            timestamp = self._last
+        for start in range(0, len(data), MAX_RECORD):
+            chunk = data[start:start + MAX_RECORD]
+            if self._count and (
+                    timestamp - self._first > MAX_DELTA
+                    or len(self._block) + RECORD_HEADER.size + len(chunk)
+                    > self.block_size):
+                self._write_block()
+            if not self._count:
+                self._first = timestamp
+            self._block += RECORD_HEADER.pack(
+                timestamp - self._first, len(chunk))
+            self._block += chunk
+            self._count += 1
+            self._last = timestamp
+            self.records += 1
+        self.bytes += len(data)
+
+    def _write_block(self):
+        if not self._count:
+            return
+        self._index += INDEX_ENTRY.pack(self._first, self._offset)
+        self._file.write(BLOCK_HEADER.pack(
+            len(self._block), self._count, self._first, self._last))
+        self._file.write(self._block)
+        self._offset += BLOCK_HEADER.size + len(self._block)
+        self._block.clear()
+        self._count = 0
+
+    def flush(self):
+        """Write the current block, even if it is not full, and flush the
+        file. The records are then recoverable after a crash."""
+        self._write_block()
+        self._file.flush()
+
+    def close(self):
+        """Write the last block and the index, and close the file."""
+        if self._file.closed:
+            return
+        self._write_block()
+        self._file.write(self._index)
+        self._file.write(TRAILER.pack(
+            self._offset, len(self._index) // INDEX_ENTRY.size, INDEX_MAGIC))
+        self._file.close()
+
+
+class JournalReader:
+    """Read, seek into and replay a journal, mapped in memory.
+
+    Args
+    ====
+    path (str): path of the journal.
+
+    Attributes:
+    - recovered: True if the journal had no index, which was rebuilt by
+    scanning the blocks.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < FILE_HEADER.size:
+                raise JournalError("'{}' is not a journal.".format(path))
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, version = FILE_HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise JournalError("'{}' is not a journal.".format(path))
+            if version != VERSION:
+                raise JournalError(
+                    'Unsupported journal version {}.'.format(version))
+            self._open_index(size)
+        except BaseException:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return "JournalReader('{}', blocks={})".format(self.path, len(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """Return the number of blocks."""
+        return self._block_count
+
+    def _open_index(self, size):
+        self.recovered = False
+        if size >= FILE_HEADER.size + TRAILER.size:
+            offset, count, magic = TRAILER.unpack_from(
+                self._map, size - TRAILER.size)
+            if (magic == INDEX_MAGIC and offset + count * INDEX_ENTRY.size
+                    == size - TRAILER.size):
+                self._index = self._map
+                self._index_offset = offset
+                self._block_count = count
+                return
+        self.recovered = True
+        self._index = self._scan(size)
+        self._index_offset = 0
+        self._block_count = len(self._index) // INDEX_ENTRY.size
+
+    def _scan(self, size):
+        """Return the index of the complete blocks, read from their headers.
+        """
+        index = bytearray()
+        offset = FILE_HEADER.size
+        while offset + BLOCK_HEADER.size <= size:
+            payload, _, first, _ = BLOCK_HEADER.unpack_from(self._map, offset)
+            if offset + BLOCK_HEADER.size + payload > size:
+                # Truncated block
+                break
+            index += INDEX_ENTRY.pack(first, offset)
+            offset += BLOCK_HEADER.size + payload
+        return index
+
+    def _entry(self, block):
+        return INDEX_ENTRY.unpack_from(
+            self._index, self._index_offset + block * INDEX_ENTRY.size)
+
+    @property
+    def start_time(self):
+        """Timestamp of the first record, None if the journal is empty."""
+        if not self._block_count:
+            return None
+        return self._entry(0)[0]
+
+    @property
+    def end_time(self):
+        """Timestamp of the last record, None if the journal is empty."""
+        if not self._block_count:
+            return None
+        offset = self._entry(self._block_count - 1)[1]
+        return BLOCK_HEADER.unpack_from(self._map, offset)[3]
+
+    def seek(self, timestamp):
+        """Return the number of the first block holding records at or after
+        'timestamp', by binary search on the index."""
+        low, high = 0, self._block_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        # The previous block may end with records at or after 'timestamp'.
+        return max(low - 1, 0)
+
+    def records(self, start=None, end=None):
+        """Yield the (timestamp, bytes) records with start <= timestamp < end,
+        in order."""
+        data = self._map
+        for block in range(self.seek(start) if start is not None else 0,
+                           self._block_count):
+            offset = self._entry(block)[1]
+            _, count, first, _ = BLOCK_HEADER.unpack_from(data, offset)
+            if end is not None and first >= end:
+                return
+            position = offset + BLOCK_HEADER.size
+            for _ in range(count):
+                delta, length = RECORD_HEADER.unpack_from(data, position)
+                position += RECORD_HEADER.size
+                timestamp = first + delta
+                if end is not None and timestamp >= end:
+                    return
+                if start is None or timestamp >= start:
+                    yield timestamp, data[position:position + length]
+                position += length
+
+    def messages(self, start=None, end=None, **kwargs):
+        """Yield the Message objects decoded from the records, see records().
+        Each message is timestamped with the timestamp of its record.
+
+        The keyword arguments are passed to the MidiParser. When starting
+        after the beginning of the journal, the bytes of a message begun
+        before 'start' are dropped.
+        """
+        parser = MidiParser(**kwargs)
+        for timestamp, data in self.records(start, end):
+            yield from parser.feed(data, timestamp)
+
+    def replay(self, connector, start=None, end=None, speed=1.0,
+               chunk_size=4096):
+        """Send the recorded bytes to 'connector' (a MidiConnector) with
+        write_bytes(), and return the number of bytes sent.
+
+        Args
+        ====
+        start, end (int, optional): only replay the records with
+        start <= timestamp < end.
+
+        speed (float, optional): replay speed, relative to the original
+        timing. If None, send the records as fast as possible, grouped into
+        writes of about 'chunk_size' bytes.
+        """
+        sent = 0
+        if speed is None:
+            buffer = bytearray()
+            for _, data in self.records(start, end):
+                buffer += data
+                if len(buffer) >= chunk_size:
+                    sent += connector.write_bytes(bytes(buffer)) or 0
+                    buffer.clear()
+            if buffer:
+                sent += connector.write_bytes(bytes(buffer)) or 0
+            return sent
+
+        assert speed > 0, "'speed' must be positive."
+        origin = started = None
+        for timestamp, data in self.records(start, end):
+            if origin is None:
+                origin = timestamp
+                started = time.perf_counter_ns()
+            delay = ((timestamp - origin) / speed
+                     - (time.perf_counter_ns() - started))
+            if delay > 0:
+                time.sleep(delay / 1e9)
+            sent += connector.write_bytes(data) or 0
+        return sent
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._index = None
+            self._map.close()
+            self._map = None
+        self._file.close()
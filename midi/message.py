@@ -0,0 +1,209 @@
+# !/usr/bin/env python3
+
+from .types import SysEx, MidiMessageType, TYPES_ATTRIBUTES
+
+# midi.codec builds Message objects, so it imports this module: it is only
+# imported when first needed, by from_bytes() or from_packed(), so that the
+# imports stay acyclic.
+_codec = None
+
+
+def _load_codec():
+    global _codec
+    from . import codec as _codec
+    return _codec
+
+
+class MessageAttribute:
+    """A descriptor to access a message attributes directly."""
+    def __init__(self, name):
+        self.name = name
+
+    def __set__(self, instance, value):
+        raise TypeError('"{}" is a read-only attribute.'.format(self.name))
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance._type, self.name)
+
+
+class Message:
+    """A complete MIDI message object.
+
+    Args
+    ====
+    type (MidiMessageType): see types.py
+    channel (int): from 1 to 16. Only for Channel messages, ie neither SysEx
+    nor System Common messages.
+    timestamp (int, optional): time of the message, eg as returned by
+    time.monotonic_ns(). It is not taken into account when comparing
+    messages.
+
+    Example:
+    >>> from midi.types import NoteOn
+    >>> msg = Message(NoteOn(82, 127), 1)
+
+    Attributes:
+    - type: the type of message (ControlChange, NoteOn, , ProgramChange, etc...)
+    - channel: MIDI channel used for sending/reading messages (from 1 to 16)
+    - timestamp: for received messages, the time their first byte arrived at,
+    if the connector timestamps messages (None otherwise).
+
+    You can also access the attributes of the different message types, eg, for
+    ControlChange, you can call
+    >>> msg.velocity
+    or
+    >>> msg.value
+    (see help(midi.types) for more details)
+
+    Messages are immutable and hashable, so they can be used as dict keys.
+
+    Messages can also be decoded from raw bytes with Message.from_bytes(), or
+    from an integer with Message.from_packed(), see to_packed().
+    """
+    __slots__ = ('_type', '_channel', '_content', '_timestamp')
+
+    def __init__(self, message_type, channel=0, timestamp=None):
+        assert isinstance(message_type, MidiMessageType), TypeError(
+            'First parameter must be an instance of MidiMessageType.'
+        )
+        if message_type._status < 0xf0:
+            assert 1 <= channel <= 16, \
+                "'channel' parameter must be an integer from 1 to 16."
+        self._type = message_type
+        self._channel = channel
+        self._content = None
+        self._timestamp = timestamp
+
+    @classmethod
+    def _trusted(cls, message_type, channel=0, timestamp=None):
+        """Return a Message built from values known to be valid, eg just
+        decoded from a MIDI stream, without checking them again."""
+        self = object.__new__(cls)
+        self._type = message_type
+        self._channel = channel
+        self._content = None
+        self._timestamp = timestamp
+        return self
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Return the Message held by 'data', a bytes-like object holding
+        exactly one complete message, status byte included.
+
+        Raise ValueError if 'data' is not a valid message. The bytes are
+        checked at once, rather than by the constructor of every field. See
+        midi.codec.decode_bytes(), which this method calls.
+        """
+        return (_codec or _load_codec()).decode_bytes(data)
+
+    @classmethod
+    def from_packed(cls, packed):
+        """Return the Message packed into an integer by to_packed().
+
+        Raise ValueError if 'packed' is not a valid message. See
+        midi.codec.decode_packed().
+        """
+        return (_codec or _load_codec()).decode_packed(packed)
+
+    def to_packed(self):
+        """Return the message packed into an integer:
+        status << 16 | data1 << 8 | data2, with 0 for missing data bytes.
+
+        SysEx messages can't be packed, and raise ValueError.
+        """
+        message_type = self._type
+        if isinstance(message_type, SysEx):
+            raise ValueError('SysEx messages cannot be packed.')
+        return ((self.status << 16) | ((message_type._data1 or 0) << 8)
+                | (message_type._data2 or 0))
+
+    def __repr__(self):
+        return "Message({}, channel={})".format(self._type, self._channel)
+
+    def __len__(self):
+        if self._content is None and isinstance(self._type, SysEx):
+            return len(self._type.data) + 3
+        return len(self.content)
+
+    def __getitem__(self, index):
+        return self.content[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, Message):
+            return NotImplemented
+        return self._channel == other._channel and self._type == other._type
+
+    def __hash__(self):
+        return hash((self._type, self._channel))
+
+    def __bytes__(self):
+        if self._content is None and isinstance(self._type, SysEx):
+            # Spare the list of a big SysEx payload: join the bytes directly.
+            return b''.join((bytes((0xf0, self._type.data1)),
+                             self._type.data, b'\xf7'))
+        return bytes(self.content)
+
+    def _get_content(self):
+        message_type = self._type
+        content = [self._get_status_value()]
+        if isinstance(message_type, SysEx):
+            content.append(message_type.data1)
+            content.extend(message_type.data)
+            content.append(0xf7)  # End of SysEx message
+        elif message_type.data1 is not None:
+            content.append(message_type.data1)
+            if message_type.data2 is not None:
+                content.append(message_type.data2)
+
+        return content
+
+    def _get_status_value(self):
+        """Return the status value of the current message.
+
+        For Channel messages, the first four bits represent the MIDI message
+        type. The last 4 bits represents the channel number, from 0 to 15.
+        System messages have no channel.
+        """
+        status = self._type._status
+        if status >= 0xf0:
+            return status
+        return status + self._channel - 1
+
+    @property
+    def type(self):
+        return self._type
+
+    @property
+    def channel(self):
+        return self._channel
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self._get_content()
+        return self._content
+
+    @property
+    def bytes_content(self):
+        return [bytes([c]) for c in self.content]
+
+    @property
+    def status(self):
+        if self._content is None:
+            return self._get_status_value()
+        return self._content[0]
+
+
+# Link the attributes of every message type directly to Message, once and for
+# all. This allows, for instance, to access the 'velocity' attribute of a
+# NoteOn type message directly from the Message instance itself.
+for _attribute in {name for attributes in TYPES_ATTRIBUTES.values()
+                   for name in attributes}:
+    setattr(Message, _attribute, MessageAttribute(_attribute))
+del _attribute
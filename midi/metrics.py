@@ -0,0 +1,158 @@
+# !/usr/bin/env python3
+"""Metrics sinks, to instrument a MidiConnector.
+
+A sink receives counters and durations from the hot paths of the connector:
+
+Counters:
+- bytes_read, messages_read: bytes read from the port, and messages decoded
+from them.
+- messages_rejected: messages skipped by the connector's filter.
+- bytes_dropped: bytes discarded to resynchronize on the stream, eg data
+bytes without status, or incomplete messages interrupted by a status byte.
+- real_time_read: Real-time bytes read (Timing Clock, Start...).
+- bytes_written, messages_written: bytes and messages sent.
+
+Durations, in nanoseconds:
+- read: reading the serial port.
+- parse: decoding the bytes read, including building the Message objects.
+- encode: encoding the messages to send.
+- write: writing to the serial port.
+
+Example:
+>>> metrics = InMemoryMetrics()
+>>> conn = MidiConnector('/dev/serial0', metrics=metrics)
+>>> conn.read_many()
+>>> metrics.counters['messages_read']
+"""
+
+from .stats import Histogram
+
+COUNTERS = ('bytes_read', 'messages_read', 'messages_rejected',
+            'bytes_dropped', 'real_time_read', 'bytes_written',
+            'messages_written')
+
+STAGES = ('read', 'parse', 'encode', 'write')
+
+
+class MetricsSink:
+    """Base class of the metrics sinks, ignoring everything.
+
+    Subclass it and override increment() and observe() to forward the metrics
+    somewhere else, eg to a StatsD client. Both are called from the thread
+    reading or writing the port, so they should return quickly.
+    """
+    def __repr__(self):
+        return '{}()'.format(type(self).__name__)
+
+    def increment(self, name, value=1):
+        """Add 'value' to the counter 'name'."""
+
+    def observe(self, name, duration):
+        """Record the 'duration' of the stage 'name', in nanoseconds."""
+
+
+class InMemoryMetrics(MetricsSink):
+    """Keep the counters, and a Histogram of the durations of every stage.
+
+    Attributes:
+    - counters: dict of the counters, by name.
+    - histograms: dict of midi.stats.Histogram, by stage name.
+    """
+    def __init__(self, resolution=1000, buckets=32):
+        self._resolution = resolution
+        self._buckets = buckets
+        self.reset()
+
+    def __repr__(self):
+        return 'InMemoryMetrics({})'.format(self.counters)
+
+    def reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {
+            stage: Histogram(self._resolution, self._buckets)
+            for stage in STAGES}
+
+    def increment(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, duration):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(
+                self._resolution, self._buckets)
+        histogram.record(duration)
+
+    def snapshot(self):
+        """Return the counters and the summary of every histogram."""
+        return {
+            'counters': dict(self.counters),
+            'durations': {name: histogram.summary()
+                          for name, histogram in self.histograms.items()},
+        }
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    """In-memory metrics, rendered in the Prometheus text exposition format.
+
+    Counters are exported as '<namespace>_<name>_total', and durations as
+    '<namespace>_<stage>_duration_seconds' histograms.
+
+    Args
+    ====
+    namespace (str, optional): prefix of every metric name.
+
+    labels (dict, optional): labels added to every sample, eg
+    {'port': '/dev/serial0'}.
+
+    Example:
+    >>> metrics = PrometheusMetrics(labels={'port': '/dev/serial0'})
+    >>> print(metrics.render())
+    # TYPE midi_bytes_read_total counter
+    midi_bytes_read_total{port="/dev/serial0"} 0
+    ...
+    """
+    def __init__(self, namespace='midi', labels=None, resolution=1000,
+                 buckets=32):
+        super().__init__(resolution, buckets)
+        self.namespace = namespace
+        self.labels = dict(labels or {})
+
+    def __repr__(self):
+        return "PrometheusMetrics('{}', labels={})".format(
+            self.namespace, self.labels)
+
+    def _labels(self, **extra):
+        labels = dict(self.labels, **extra)
+        if not labels:
+            return ''
+        return '{' + ','.join(
+            '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                             .replace('"', '\\"').replace('\n', '\\n'))
+            for key, value in labels.items()) + '}'
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        labels = self._labels()
+        for name, value in self.counters.items():
+            metric = '{}_{}_total'.format(self.namespace, name)
+            lines.append('# TYPE {} counter'.format(metric))
+            lines.append('{}{} {}'.format(metric, labels, value))
+
+        for stage, histogram in self.histograms.items():
+            metric = '{}_{}_duration_seconds'.format(self.namespace, stage)
+            lines.append('# TYPE {} histogram'.format(metric))
+            cumulative = 0
+            # The last bucket has no upper bound: it is the '+Inf' one.
+            for index, count in enumerate(histogram.counts[:-1]):
+                cumulative += count
+                upper = histogram.bucket_bounds(index)[1] / 1e9
+                lines.append('{}_bucket{} {}'.format(
+                    metric, self._labels(le=repr(upper)), cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                metric, self._labels(le='+Inf'), histogram.count))
+            lines.append('{}_sum{} {!r}'.format(
+                metric, labels, histogram.total / 1e9))
+            lines.append('{}_count{} {}'.format(
+                metric, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
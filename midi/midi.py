@@ -1,124 +1,37 @@
 # !/usr/bin/env python3
 
-from serial import Serial
+import time
+from collections import deque
+from time import perf_counter_ns
 
-from .types import SysEx, MidiMessageType
-from .utils import (build_message_from_sequence, get_channel_from_status,
-                    get_message_type_number_from_status, get_status_value)
+from .encoder import MidiEncoder
+from .filters import MessageFilter
+from .message import Message
+from .parser import (SYSEX_CHUNK, SYSEX_COMPLETE, SYSEX_START, MidiParser,
+                     SysExError)
+from .stats import ReceiveStats
+from .types import SysEx
 
 
-class MessageAttribute:
-    """A descriptor to access a message attributes directly."""
-    def __init__(self, name):
-        self.name = name
+def __getattr__(name):
+    # pyserial is only imported when needed, eg when creating the first
+    # connector: encoding, decoding or reading files never need it.
+    if name == 'Serial':
+        return _load_serial()
+    raise AttributeError(
+        "module '{}' has no attribute '{}'".format(__name__, name))
 
-    def __set__(self, instance, value):
-        raise TypeError('"{}" is a read-only attribute.'.format(self.name))
 
-    def __get__(self, instance, owner):
-        if instance is None:
-            return self
-        return getattr(instance.type, self.name)
+def _load_serial():
+    global Serial
+    from serial import Serial
+    return Serial
 
 
-class Message:
-    """A complete MIDI message object.
-
-    Args
-    ====
-    type (MidiMessageType): see types.py
-    channel (int): from 1 to 16. Only if not SysEx message.
-
-    Example:
-    >>> from midi.types import NoteOn
-    >>> msg = Message(NoteOn(82, 127), 1)
-
-    Attributes:
-    - type: the type of message (ControlChange, NoteOn, , ProgramChange, etc...)
-    - channel: MIDI channel used for sending/reading messages (from 1 to 16)
-
-    You can also access the attributes of the different message types, eg, for
-    ControlChange, you can call
-    >>> msg.velocity
-    or
-    >>> msg.value
-    (see help(midi.types) for more details)
-    """
-    def __init__(self, message_type, channel=0):
-        assert isinstance(message_type, MidiMessageType), TypeError(
-            'First parameter must be an instance of MidiMessageType.'
-        )
-        if not isinstance(message_type, SysEx):
-            assert 1 <= channel <= 16, \
-                "'channel' parameter must be an integer from 1 to 16."
-        self.type = message_type
-        self.channel = channel
-        self._content = None
-        self._link_attributes()
-
-    def __repr__(self):
-        return "Message({}, channel={})".format(self.type, self.channel)
-
-    def __len__(self):
-        return len(self.content)
-
-    def __getitem__(self, index):
-        return self.content[index]
-
-    def _get_content(self):
-        status = self._get_status_value()
-        content = [status, self.type.data1]
-        if isinstance(self.type, SysEx):
-            content.extend([data for data in self.type.data])
-            content.append(0xf7)  # End of SysEx message
-        elif self.type.data2 is not None:
-            content.append(self.type.data2)
-
-        return content
-
-    def _get_status_value(self):
-        """Return the status value of the current message.
-
-        Except for SysEx, the first four bits represent the MIDI message
-        type. The last 4 bits represents the channel number, from 0 to 15.
-        """
-        if isinstance(self.type, SysEx):
-            status = 0xf0
-        else:
-            status = get_status_value(self.type.__class__, self._channel)
-        
-        return status
-
-    def _link_attributes(self):
-        """Link attributes of self.type directly to object.
-
-        This allows, for instance, to access the 'velocity' attribute of a
-        NoteOn type message directly from the Message instance itself.
-        """
-        from .utils import TYPES_ATTRIBUTES
-        attributes = {a for attr in TYPES_ATTRIBUTES.values()
-                      for a in attr if hasattr(self.type, a)}
-        for attr in attributes:
-            setattr(self.__class__, attr, MessageAttribute(attr))
-    
-    @property
-    def _channel(self):
-        """Internal channel value, from 0 to 15."""
-        return self.channel - 1
-
-    @property
-    def content(self):
-        if self._content is None:
-            self._content = self._get_content()
-        return self._content
-
-    @property
-    def bytes_content(self):
-        return [bytes([c]) for c in self.content]
-
-    @property
-    def status(self):
-        return self.content[0]
+def _serial_class():
+    """Return pyserial's Serial class, imported on first use. Patching
+    midi.midi.Serial replaces it for every connector."""
+    return globals().get('Serial') or _load_serial()
 
 
 class MidiConnector:
@@ -127,7 +40,7 @@ class MidiConnector:
     Args
     ====
     port (str): path to the machine's serial interface, eg '/dev/serial0'
-    on a RaspberryPi3
+    on a RaspberryPi3. Not needed if a 'transport' is given.
 
     baudrate (int): default to 31250, and should not be changed.
     This is the standard baudrate, used by all MIDI devices.
@@ -136,71 +49,327 @@ class MidiConnector:
     to block for ever when waiting for a message, use a timeout to set up a
     maximum duration of blocking. The timeout is only used for reading, not
     writing.
+
+    running_status (bool, optional): if True, omit the status byte of sent
+    messages when it is the same as the one of the previous message. This
+    saves up to a third of the bandwidth when sending a lot of messages of the
+    same type on the same channel. Received messages using running status are
+    always decoded, whatever this option.
+
+    cache (midi.codec.MessageCache, optional): decode incoming Channel
+    messages through this cache, see MidiParser.
+
+    timestamps (bool, optional): if True, every received message is
+    timestamped with the time.monotonic_ns() value its first byte arrived at.
+    When several bytes are read at once, the arrival time of each byte is
+    interpolated from the baudrate. Timing statistics are then available in
+    the 'stats' attribute (see midi.stats.ReceiveStats).
+
+    filter (midi.filters.MessageFilter, optional): only decode the messages
+    accepted by this filter. The other ones are skipped byte by byte, without
+    building any object.
+
+    on_real_time (callable, optional): called with the value of every
+    Real-time byte received (eg 0xf8 for a Timing Clock), as soon as it is
+    read. Real-time bytes are never turned into messages: they are only
+    counted in 'real_time_counts' otherwise.
+
+    max_sysex (int, optional): maximum size of a received SysEx payload, see
+    MidiParser. Bigger SysEx are skipped.
+
+    thinner (midi.thinning.OutputThinner, optional): coalesce the sent
+    ControlChange, PitchBend and ChannelAftertouch updates, so that fast
+    controllers don't saturate the output. Held updates are sent by the next
+    writes, or by write_pending(), which should then be called regularly.
+
+    metrics (midi.metrics.MetricsSink, optional): sink receiving counters
+    (bytes and messages read and written, rejected messages, dropped bytes)
+    and the durations of the read, parse, encode and write stages, see
+    midi.metrics. Without a sink, nothing is measured.
+
+    journal (midi.journal.JournalWriter, optional): record every byte read
+    from the port, as read, see midi.journal.
+
+    state (midi.state.ChannelState, optional): keep the state of the
+    channels (programs, controllers, held notes...) up to date with every
+    message read.
+
+    transport (optional): carry the bytes through this transport rather than
+    a serial port, eg a midi.transports.MemoryTransport or a
+    midi.rtpmidi.RtpMidiSession. The same parser and encoder are used
+    whatever the transport. Its timeout is set to 'timeout'.
     """
-    def __init__(self, port, baudrate=31250, timeout=None, **kwargs):
+    def __init__(self, port=None, baudrate=31250, timeout=None,
+                 running_status=False, cache=None, timestamps=False,
+                 filter=None, on_real_time=None, max_sysex=None,
+                 thinner=None, metrics=None, journal=None,
+                 state=None, transport=None, **kwargs):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
-        self.__connector = Serial(
-            port=self.port, baudrate=self.baudrate, timeout=self.timeout)
+        if transport is None:
+            assert port is not None, "A 'port' or a 'transport' is required."
+            transport = _serial_class()(
+                port=self.port, baudrate=self.baudrate, timeout=self.timeout)
+        else:
+            transport.timeout = timeout
+        self.__connector = transport
+        self.__parser = MidiParser(cache, filter, on_real_time, max_sysex)
+        self.filter = filter
+        self._channel_filters = {}
+        self.__encoder = MidiEncoder(running_status)
+        self.timestamps = timestamps
+        self.stats = ReceiveStats() if timestamps else None
+        # One byte is 10 bits long on the wire: start, 8 bits, stop.
+        self._byte_duration = 10 * 10 ** 9 // baudrate
+        self.__pending = deque()
+        self.thinner = thinner
+        self.metrics = metrics
+        self.journal = journal
+        self.state = state
 
         if kwargs.get('test', False):
             # We provide a fake read function when testing
-            self.__read_byte = kwargs.get('read_func')
+            self.__read_bytes = kwargs.get('read_func')
         else:
-            self.__read_byte = self.__connector.read
+            self.__read_bytes = self.__connector.read
 
     def __repr__(self):
+        if self.port is None:
+            return 'MidiConnector(transport={!r}, timeout={})'.format(
+                self.__connector, self.timeout)
         return "MidiConnector('{}', baudrate={}, timeout={})".format(
             self.port, self.baudrate, self.timeout)
 
+    def fileno(self):
+        """Return the file descriptor of the serial port, eg to watch it with
+        the selectors module."""
+        return self.__connector.fileno()
+
+    def read_bytes(self):
+        """Return the raw bytes waiting on the serial port, without decoding
+        them nor blocking. Return b'' if nothing is waiting."""
+        size = self.__connector.in_waiting
+        if not size:
+            return b''
+        data = self.__read_bytes(size)
+        if self.journal is not None:
+            self.journal.append(data)
+        return data
+
+    def write_bytes(self, data):
+        """Send raw bytes, and return the number of bytes transmitted.
+
+        'data' must hold complete messages, with their status byte: the
+        running status is reset.
+        """
+        self.__encoder.reset()
+        return self.__connector.write(data)
+
+    @property
+    def real_time_counts(self):
+        """Number of Real-time bytes received, indexed by byte - 0xf8."""
+        return self.__parser.real_time_counts
+
+    def _fill(self, block=True):
+        """Read every byte waiting on the serial port, and decode them.
+
+        If 'block' is True and nothing is waiting, wait for at least one byte
+        (or for the timeout). Return False if nothing could be read.
+        """
+        if self.metrics is not None:
+            return self._fill_measured(block)
+        size = self.__connector.in_waiting
+        if not size:
+            if not block:
+                return False
+            size = 1
+        data = self.__read_bytes(size)
+        if not data:
+            return False
+        self._decode(data)
+        return True
+
+    def _fill_measured(self, block):
+        """Same as _fill(), reporting to the metrics sink."""
+        metrics = self.metrics
+        parser = self.__parser
+        size = self.__connector.in_waiting
+        if not size:
+            if not block:
+                return False
+            size = 1
+        start = perf_counter_ns()
+        data = self.__read_bytes(size)
+        read_at = perf_counter_ns()
+        # The duration includes the time waiting for data, when blocking.
+        metrics.observe('read', read_at - start)
+        if not data:
+            return False
+
+        rejected, dropped = parser.rejected, parser.dropped
+        real_time = sum(parser.real_time_counts)
+        count = self._decode(data)
+        metrics.observe('parse', perf_counter_ns() - read_at)
+        metrics.increment('bytes_read', len(data))
+        metrics.increment('messages_read', count)
+        if parser.rejected != rejected:
+            metrics.increment('messages_rejected', parser.rejected - rejected)
+        if parser.dropped != dropped:
+            metrics.increment('bytes_dropped', parser.dropped - dropped)
+        real_time = sum(parser.real_time_counts) - real_time
+        if real_time:
+            metrics.increment('real_time_read', real_time)
+        return True
+
+    def _decode(self, data):
+        """Decode 'data' into the pending messages, and return their
+        number."""
+        if self.journal is not None:
+            self.journal.append(data)
+        if self.timestamps:
+            received_at = time.monotonic_ns()
+            messages = self.__parser.feed(
+                data, received_at, self._byte_duration)
+            self.stats.record(messages, time.monotonic_ns())
+        else:
+            messages = self.__parser.feed(data)
+        if self.state is not None:
+            self.state.update_many(messages)
+        self.__pending.extend(messages)
+        return len(messages)
+
+    def _channel_filter(self, channel):
+        """Return the filter used when reading only on 'channel'."""
+        message_filter = self._channel_filters.get(channel)
+        if message_filter is None:
+            message_filter = MessageFilter(channels=[channel])
+            if self.filter is not None:
+                message_filter = self.filter & message_filter
+            self._channel_filters[channel] = message_filter
+        return message_filter
+
     def read(self, channel=None):
         """Return a MIDI message from the bytes it reads.
 
         If 'channel' is specified, return only message(s) received on the given
-        channel. Otherwise, read in "omni" mode and return any MIDI message
-        received.
+        channel: messages received on other channels are discarded, without
+        even being decoded. Otherwise, read in "omni" mode and return any MIDI
+        message received. With a 'state', every message is still decoded, so
+        that the state stays up to date, and the other ones are discarded
+        afterwards.
 
         If self.timeout is not None, return nothing if the timeout is reached
         before receiving a message. By default, self.timeout is None, so
         self.read() will block as long as necessary, until receiving a message.
+        A message interrupted by the timeout is completed by the next call.
         """
-        if channel is None:
-            omni = True
-        else:
+        if channel is not None:
             assert 1 <= channel <= 16, \
                 "'channel' parameter must be an integer from 1 to 16."
-            omni = False
-
-        msg = [None, None, None]
-        sysex = False
-        for i in range(len(msg)):
-            raw_byte = self.__read_byte()
-            if not raw_byte:
-                return
-            byte_value = ord(raw_byte)
-            msg[i] = byte_value
-            if msg[1] is not None:
-                type_number = get_message_type_number_from_status(msg[0])
-                if type_number in (0xc, 0xd):
-                    # either a PC message or Channel Aftertouch:
-                    # they carry only 2 bytes, not 3
-                    break
-                elif type_number == 0xf:  # SysEx message
-                    sysex = True
-                    msg[2] = []
-                    while True:
-                        raw_byte = self.__read_byte()
-                        byte_value = ord(raw_byte)
-                        if byte_value != 0xf7:
-                            msg[2].append(byte_value)
-                        else:  # end of SysEx data
-                            break
-                    break
-
-        from_channel = get_channel_from_status(msg[0])
-        if omni or channel == from_channel or sysex:
-            return build_message_from_sequence(msg)
+
+        pending = self.__pending
+        while pending:
+            message = pending.popleft()
+            if (channel is None or message.channel == channel
+                    or isinstance(message.type, SysEx)):
+                return message
+
+        if channel is None:
+            while not pending:
+                if not self._fill():
+                    return
+            return pending.popleft()
+
+        if self.state is not None:
+            while True:
+                if not self._fill():
+                    return
+                while pending:
+                    message = pending.popleft()
+                    if (message.channel == channel
+                            or isinstance(message.type, SysEx)):
+                        return message
+
+        self.__parser.filter = self._channel_filter(channel)
+        try:
+            while not pending:
+                if not self._fill():
+                    return
+        finally:
+            self.__parser.filter = self.filter
+        return pending.popleft()
+
+    def read_many(self, max_messages=None, timeout=0):
+        """Return the list of messages already received, without blocking.
+
+        Args
+        ====
+        max_messages (int, optional): maximum number of messages to return.
+        The remaining ones are kept for the next calls.
+
+        timeout (float, optional): if no message is available yet, wait at
+        most 'timeout' seconds for one. By default, never wait.
+        """
+        self._fill(block=False)
+        if not self.__pending and timeout:
+            self.__connector.timeout = timeout
+            try:
+                self._fill()
+                self._fill(block=False)
+            finally:
+                self.__connector.timeout = self.timeout
+
+        pending = self.__pending
+        if max_messages is None or max_messages >= len(pending):
+            messages = list(pending)
+            pending.clear()
+        else:
+            messages = [pending.popleft() for _ in range(max_messages)]
+        return messages
+
+    def read_sysex(self):
+        """Yield the payload of the next SysEx received, chunk by chunk, as it
+        arrives, without holding it all in memory.
+
+        The first chunk starts with the manufacturer ID. The other messages
+        received meanwhile are kept for read().
+
+        Raise SysExError if the SysEx is interrupted by another message, or
+        bigger than 'max_sysex', and TimeoutError if the timeout is reached in
+        the middle of the SysEx. If it is reached before, yield nothing.
+
+        Example:
+        >>> with open('dump.syx', 'wb') as f:
+        ...     for chunk in conn.read_sysex():
+        ...         f.write(chunk)
+        """
+        parser = self.__parser
+        events = deque()
+        parser.on_sysex = lambda chunk, state: events.append(
+            (bytes(chunk), state))
+        try:
+            started = parser._status == SYSEX_START
+            if started and parser._data:
+                # Start of the SysEx, already received
+                events.append((bytes(parser._data), SYSEX_CHUNK))
+                parser._data.clear()
+            while True:
+                while events:
+                    chunk, state = events.popleft()
+                    if state == SYSEX_CHUNK:
+                        started = True
+                        yield chunk
+                    elif state == SYSEX_COMPLETE:
+                        return
+                    else:
+                        raise SysExError('SysEx interrupted, or too big.')
+                if not self._fill():
+                    if started or parser._status == SYSEX_START:
+                        raise TimeoutError('Timeout in the middle of a SysEx.')
+                    return
+        finally:
+            parser.on_sysex = None
 
     def write(self, message):
         """Send MIDI message, and return the number of bytes transmitted.
@@ -213,7 +382,112 @@ class MidiConnector:
             "Argument 'message' must be type Message ({} given).".format(
                 (type(message))))
 
-        for byte in message.bytes_content:
-            self.__connector.write(byte)
+        if self.thinner is not None:
+            return self.write_many([message])
+        if self.metrics is None:
+            return self.__connector.write(
+                bytes(self.__encoder.encode(message)))
+        start = perf_counter_ns()
+        return self._send_measured(
+            bytes(self.__encoder.encode(message)), 1, start)
 
-        return len(message)
+    def write_many(self, messages):
+        """Send several MIDI messages at once, and return the number of bytes
+        transmitted.
+
+        All messages are encoded into a single buffer, which is then flushed
+        to the serial port in one call.
+
+        Args
+        ====
+        messages (iterable of midi.Message): messages to send via MIDI port.
+        """
+        messages = list(messages)
+        for message in messages:
+            assert isinstance(message, Message), TypeError(
+                "Argument 'messages' must only contain Message objects "
+                "({} given).".format(type(message)))
+
+        if self.thinner is not None:
+            thinner = self.thinner
+            now = time.monotonic()
+            # Held updates are older: send them first.
+            thinned = thinner.due(now)
+            for message in messages:
+                thinned += thinner.add(message, now)
+            messages = thinned
+        return self._send_messages(messages)
+
+    def _send_messages(self, messages):
+        """Encode 'messages' into a single buffer, and send it."""
+        measured = self.metrics is not None
+        if measured:
+            start = perf_counter_ns()
+        buffer = self.__encoder.encode_many(messages)
+        if not buffer:
+            return 0
+        if measured:
+            return self._send_measured(buffer, len(messages), start)
+        return self.__connector.write(buffer)
+
+    def write_pending(self):
+        """Send the updates held by the thinner which are due, and return the
+        number of bytes transmitted."""
+        if self.thinner is None:
+            return 0
+        return self._send_messages(self.thinner.due())
+
+    def flush_pending(self):
+        """Send every update held by the thinner, due or not, and return the
+        number of bytes transmitted."""
+        if self.thinner is None:
+            return 0
+        return self._send_messages(self.thinner.flush())
+
+    def write_paced(self, messages, delay=0.02, chunk_size=None):
+        """Send messages one packet at a time, waiting 'delay' seconds between
+        two packets, so as not to overflow slow devices. Return the number of
+        bytes transmitted.
+
+        A packet is a message, or, if 'chunk_size' is given, at most
+        'chunk_size' bytes of a message: big SysEx dumps are then split into
+        several packets. Every packet is fully transmitted before waiting.
+
+        Args
+        ====
+        messages (iterable of midi.Message): messages to send via MIDI port.
+
+        delay (float, optional): pause between two packets, in seconds.
+
+        chunk_size (int, optional): maximum size of a packet, in bytes.
+        """
+        assert chunk_size is None or chunk_size >= 1, \
+            "'chunk_size' must be a positive integer."
+        connector = self.__connector
+        sent = 0
+        first = True
+        for message in messages:
+            assert isinstance(message, Message), TypeError(
+                "Argument 'messages' must only contain Message objects "
+                "({} given).".format(type(message)))
+            data = memoryview(bytes(self.__encoder.encode(message)))
+            size = chunk_size or len(data)
+            for start in range(0, len(data), size):
+                if not first:
+                    time.sleep(delay)
+                first = False
+                sent += connector.write(data[start:start + size])
+                connector.flush()
+        return sent
+
+    def _send_measured(self, data, count, start):
+        """Send 'data', holding 'count' messages whose encoding started at
+        'start', and report to the metrics sink."""
+        metrics = self.metrics
+        encoded_at = perf_counter_ns()
+        metrics.observe('encode', encoded_at - start)
+        sent = self.__connector.write(data)
+        metrics.observe('write', perf_counter_ns() - encoded_at)
+        metrics.increment('bytes_written', sent or 0)
+        metrics.increment('messages_written', count)
+        return sent
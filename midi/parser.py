@@ -0,0 +1,353 @@
+# !/usr/bin/env python3
+
+from .codec import (STATUS_DATA_LENGTHS, STATUS_TYPES, SYSEX_END, SYSEX_START,
+                    SYSTEM_COMMON_LENGTHS, decode_channel_message,
+                    decode_system_common)
+from .message import Message
+from .types import SysEx
+
+REAL_TIME_START = 0xf8
+
+# Real-time messages
+TIMING_CLOCK = 0xf8
+START = 0xfa
+CONTINUE = 0xfb
+STOP = 0xfc
+ACTIVE_SENSING = 0xfe
+SYSTEM_RESET = 0xff
+
+REAL_TIME_BYTES = bytes(range(REAL_TIME_START, 256))
+
+# 1 for the status bytes, 0 for the data bytes
+STATUS_MARKS = bytes(byte >> 7 for byte in range(256))
+
+
+class SysExError(ValueError):
+    """Raised when a streamed SysEx is interrupted, or too big."""
+
+
+# States passed to the 'on_sysex' callback of MidiParser
+SYSEX_CHUNK = 'chunk'
+SYSEX_COMPLETE = 'complete'
+SYSEX_ABORTED = 'aborted'
+
+
+class MidiParser:
+    """Incremental decoder turning a stream of bytes into MIDI messages.
+
+    The parser keeps the state of a partially received message between two
+    calls to feed(), so a message may be split across several chunks of data.
+
+    Running status is supported: once a Channel message has been received,
+    its status byte may be omitted by the sender for the following messages.
+    Real-time messages don't affect the running status, whereas System
+    Common messages and SysEx cancel it.
+
+    Real-time bytes (eg Timing Clock) may be interleaved anywhere, even in the
+    middle of another message or of a SysEx. They are not turned into
+    Message objects: they are counted in 'real_time_counts' (indexed by
+    byte - 0xf8), and passed to the 'on_real_time' callback if any.
+
+    Messages can be timestamped with the time their first byte arrived at,
+    see feed().
+
+    Args
+    ====
+    cache (midi.codec.MessageCache, optional): if given, Channel messages are
+    decoded through this cache. Timestamped messages are never cached, as
+    their timestamp differs.
+
+    filter (midi.filters.MessageFilter, optional): if given, only the
+    messages accepted by the filter are decoded. The other ones are skipped
+    as soon as their status byte is read, without building any object, and
+    counted in the 'rejected' attribute.
+
+    Bytes discarded to resynchronize on the stream (data bytes without
+    status, incomplete messages interrupted by a new status byte) are counted
+    in the 'dropped' attribute.
+
+    on_real_time (callable, optional): called with the value of every
+    Real-time byte received, eg 0xf8 for a Timing Clock.
+
+    max_sysex (int, optional): maximum size of a SysEx payload, manufacturer
+    ID included. Bigger SysEx are skipped up to their end, and counted in the
+    'oversized' attribute. By default, the size is not limited.
+
+    on_sysex (callable, optional): stream the SysEx payloads instead of
+    returning SysEx messages. Called with (chunk, state) as the payload
+    arrives: chunk is a bytes-like object, only valid during the call (copy
+    it to keep it), starting with the manufacturer ID, and state is:
+    - SYSEX_CHUNK: more chunks will follow.
+    - SYSEX_COMPLETE: the end of the SysEx was received (chunk is empty).
+    - SYSEX_ABORTED: the SysEx was interrupted by another message, or is
+    bigger than 'max_sysex' (chunk is empty).
+
+    Example:
+    >>> parser = MidiParser()
+    >>> parser.feed(b'\\x90\\x3c')
+    []
+    >>> parser.feed(b'\\x64')
+    [Message(NoteOn(60, 100), channel=1)]
+    """
+    def __init__(self, cache=None, filter=None, on_real_time=None,
+                 max_sysex=None, on_sysex=None):
+        self.cache = cache
+        self._decode = decode_channel_message if cache is None \
+            else cache.decode
+        self.on_real_time = on_real_time
+        self.max_sysex = max_sysex
+        self.on_sysex = on_sysex
+        self.real_time_counts = [0] * 8
+        self.rejected = 0
+        self.dropped = 0
+        self.oversized = 0
+        self.reset()
+        self.filter = filter
+
+    def __repr__(self):
+        return 'MidiParser()'
+
+    @property
+    def filter(self):
+        return self._filter
+
+    @filter.setter
+    def filter(self, message_filter):
+        self._filter = message_filter
+        self._table = None if message_filter is None else message_filter.table
+        if self._status is not None:
+            self._accepted = self._table is None or self._table[self._status]
+
+    def reset(self):
+        """Drop any partially received message, and the running status."""
+        self._status = None
+        self._expected = 0
+        self._data = bytearray()
+        self._sysex_size = 0
+        self._accepted = True
+        self._skipping = False
+        self._start_time = None
+
+    def feed(self, data, timestamp=None, byte_duration=0):
+        """Decode 'data' and return the list of completed messages.
+
+        Args
+        ====
+        data (bytes-like): raw bytes received from a MIDI port.
+
+        timestamp (int, optional): time the last byte of 'data' arrived at,
+        eg as returned by time.monotonic_ns(). If given, every message is
+        timestamped with the time its first byte arrived at.
+
+        byte_duration (int, optional): time needed to transmit one byte, in
+        the unit of 'timestamp'. The arrival time of every byte of 'data' is
+        interpolated from it.
+        """
+        if timestamp is not None or self.on_real_time is not None:
+            return self._feed_timed(data, timestamp, byte_duration)
+
+        data = bytes(data)
+        stripped = data.translate(None, REAL_TIME_BYTES)
+        if len(stripped) != len(data):
+            # Count the Real-time bytes all at once, and never look at them
+            # again.
+            counts = self.real_time_counts
+            for index, byte in enumerate(REAL_TIME_BYTES):
+                counts[index] += data.count(byte)
+            data = stripped
+
+        messages = []
+        if self._status == SYSEX_START or SYSEX_START in data:
+            self._feed_sysex(data, messages)
+        else:
+            self._feed_bytes(data, messages)
+        return messages
+
+    def _feed_sysex(self, data, messages):
+        """Decode 'data', holding SysEx bytes, without any Real-time byte.
+
+        The SysEx payloads are copied by slices, up to the next status byte,
+        instead of byte by byte.
+        """
+        view = memoryview(data)
+        marks = data.translate(STATUS_MARKS)
+        position = 0
+        end = len(data)
+        while position < end:
+            if self._status == SYSEX_START:
+                stop = marks.find(1, position)
+                if stop < 0:
+                    stop = end
+                if stop > position:
+                    self._add_sysex(view[position:stop])
+                if stop < end:
+                    self._handle_status(data[stop], messages)
+                position = stop + 1
+            else:
+                start = data.find(SYSEX_START, position)
+                if start < 0:
+                    start = end
+                self._feed_bytes(view[position:start], messages)
+                if start < end:
+                    self._handle_status(SYSEX_START, messages)
+                position = start + 1
+
+    def _feed_bytes(self, data, messages):
+        for byte in data:
+            if byte >= 0x80:
+                self._handle_status(byte, messages)
+            elif self._status is not None:
+                data_bytes = self._data
+                data_bytes.append(byte)
+                if len(data_bytes) == self._expected:
+                    status = self._status
+                    if self._accepted:
+                        messages.append(self._build(status, data_bytes))
+                    else:
+                        self.rejected += 1
+                    data_bytes.clear()
+                    if status > SYSEX_START:
+                        # System Common messages cancel the running status.
+                        self._status = None
+            elif not self._skipping:
+                # Data byte without any status
+                self.dropped += 1
+
+    def _feed_timed(self, data, timestamp, byte_duration):
+        timed = timestamp is not None
+        on_real_time = self.on_real_time
+        messages = []
+        last = len(data) - 1
+        for index, byte in enumerate(data):
+            if byte >= REAL_TIME_START:
+                self.real_time_counts[byte - REAL_TIME_START] += 1
+                if on_real_time is not None:
+                    on_real_time(byte)
+            elif byte == SYSEX_END:
+                start_time = self._start_time
+                count = len(messages)
+                self._handle_status(byte, messages)
+                if timed and len(messages) > count:
+                    messages[-1]._timestamp = start_time
+            elif byte >= 0x80:
+                if timed:
+                    self._start_time = \
+                        timestamp - (last - index) * byte_duration
+                count = len(messages)
+                self._handle_status(byte, messages)
+                if timed and len(messages) > count:
+                    # Message without data byte
+                    messages[-1]._timestamp = self._start_time
+            elif self._status == SYSEX_START:
+                self._add_sysex(data[index:index + 1])
+            elif self._status is not None:
+                if timed and not self._data and self._start_time is None:
+                    # Message sent with running status
+                    self._start_time = \
+                        timestamp - (last - index) * byte_duration
+                data_bytes = self._data
+                data_bytes.append(byte)
+                if len(data_bytes) == self._expected:
+                    status = self._status
+                    if self._accepted:
+                        message = self._build(status, data_bytes, timed)
+                        if timed:
+                            # Only uncached messages are built when timed:
+                            # shared instances are never modified.
+                            message._timestamp = self._start_time
+                        messages.append(message)
+                    else:
+                        self.rejected += 1
+                    data_bytes.clear()
+                    self._start_time = None
+                    if status > SYSEX_START:
+                        self._status = None
+            elif not self._skipping:
+                self.dropped += 1
+        return messages
+
+    def _handle_status(self, byte, messages):
+        if byte >= REAL_TIME_START:
+            self.real_time_counts[byte - REAL_TIME_START] += 1
+            return
+
+        if byte == SYSEX_END:
+            if self._status != SYSEX_START:
+                if not self._skipping:
+                    self.dropped += len(self._data) + 1
+            elif self.on_sysex is not None:
+                self.on_sysex(b'', SYSEX_COMPLETE)
+            elif len(self._data) >= 2:
+                messages.append(self._build(self._status, self._data))
+            else:
+                self.dropped += len(self._data) + 1
+            self.reset()
+            return
+
+        # Any other status byte starts a new message, and aborts the
+        # current one if it was incomplete.
+        if self._status == SYSEX_START and self.on_sysex is not None:
+            self.on_sysex(b'', SYSEX_ABORTED)
+        if self._data:
+            self.dropped += len(self._data)
+            self._data.clear()
+        self._skipping = False
+        table = self._table
+        accepted = table is None or table[byte]
+        if byte < SYSEX_START:
+            self._status = byte
+            self._expected = STATUS_DATA_LENGTHS[byte]
+            self._accepted = accepted
+        elif byte == SYSEX_START:
+            if accepted:
+                self._status = byte
+                self._expected = None
+                self._sysex_size = 0
+            else:
+                # Skip the whole payload
+                self.rejected += 1
+                self._status = None
+                self._skipping = True
+        elif STATUS_TYPES[byte] is None:
+            # Undefined System Common message: skip its data bytes.
+            self._status = None
+        elif SYSTEM_COMMON_LENGTHS[byte]:
+            self._status = byte
+            self._expected = SYSTEM_COMMON_LENGTHS[byte]
+            self._accepted = accepted
+        else:
+            # System Common message without data (Tune Request)
+            self._status = None
+            if accepted:
+                messages.append(decode_system_common(byte))
+            else:
+                self.rejected += 1
+
+    def _add_sysex(self, chunk):
+        """Add 'chunk' to the payload of the SysEx being received."""
+        size = self._sysex_size + len(chunk)
+        if self.max_sysex is not None and size > self.max_sysex:
+            # Skip the rest of the payload
+            self.oversized += 1
+            if self.on_sysex is not None:
+                self.on_sysex(b'', SYSEX_ABORTED)
+            self._data.clear()
+            self._status = None
+            self._skipping = True
+            return
+        self._sysex_size = size
+        if self.on_sysex is not None:
+            self.on_sysex(chunk, SYSEX_CHUNK)
+        else:
+            self._data += chunk
+
+    def _build(self, status, data, uncached=False):
+        if status >= SYSEX_START:
+            if status == SYSEX_START:
+                payload = bytes(memoryview(data)[1:])
+                return Message._trusted(SysEx._from_data(data[0], payload))
+            return decode_system_common(status, *data)
+        decode = decode_channel_message if uncached else self._decode
+        if len(data) == 2:
+            return decode(status, data[0], data[1])
+        return decode(status, data[0])
@@ -0,0 +1,326 @@
+# !/usr/bin/env python3
+"""Route and merge MIDI streams between many ports, from a single thread.
+
+Example:
+>>> router = MidiRouter()
+>>> router.add_port('keyboard', MidiConnector('/dev/ttyUSB0'))
+>>> router.add_port('synth', MidiConnector('/dev/ttyUSB1'))
+>>> router.add_port('drums', MidiConnector('/dev/ttyUSB2'))
+>>> router.add_route('keyboard', ['synth'], channels=[1], transpose=12)
+>>> router.add_route('keyboard', ['drums'], channels=[2], remap={2: 10})
+>>> router.run()
+"""
+
+import selectors
+import time
+
+from .codec import STATUS_LENGTHS
+from .filters import MessageFilter
+from .parser import REAL_TIME_START, SYSEX_END, SYSEX_START
+
+# Frames of the one-byte messages (Real-time, Tune Request), built once.
+SINGLE_BYTE_FRAMES = tuple(bytes((byte,)) for byte in range(256))
+
+IDENTITY = bytes(range(256))
+
+
+class MidiFramer:
+    """Split a stream of bytes into the raw frames of complete messages,
+    without decoding them.
+
+    Every frame holds the status byte of its message, even when the sender
+    used running status. Real-time bytes are returned as frames of their own,
+    as soon as they are received, even in the middle of another message.
+
+    Attributes:
+    - dropped: number of bytes discarded to resynchronize on the stream.
+    """
+    def __init__(self):
+        self.dropped = 0
+        self._buffer = bytearray()
+        self._status = None
+        self._length = 0
+
+    def __repr__(self):
+        return 'MidiFramer()'
+
+    def reset(self):
+        self._buffer.clear()
+        self._status = None
+
+    def feed(self, data):
+        """Return the list of the frames (bytes) completed by 'data'."""
+        frames = []
+        buffer = self._buffer
+        for byte in data:
+            if byte < 0x80:
+                if self._status is None:
+                    self.dropped += 1
+                    continue
+                buffer.append(byte)
+                if len(buffer) == self._length:
+                    frames.append(bytes(buffer))
+                    if self._status > SYSEX_START:
+                        # System Common messages cancel the running status.
+                        self._status = None
+                        buffer.clear()
+                    else:
+                        del buffer[1:]
+            elif byte >= REAL_TIME_START:
+                frames.append(SINGLE_BYTE_FRAMES[byte])
+            elif byte == SYSEX_END:
+                if self._status == SYSEX_START:
+                    buffer.append(byte)
+                    frames.append(bytes(buffer))
+                else:
+                    self.dropped += len(buffer) + 1
+                self._status = None
+                buffer.clear()
+            else:
+                if len(buffer) > 1:
+                    # Incomplete message
+                    self.dropped += len(buffer) - 1
+                buffer.clear()
+                length = STATUS_LENGTHS[byte]
+                if byte == SYSEX_START:
+                    self._status = byte
+                    self._length = -1
+                    buffer.append(byte)
+                elif length == 1:
+                    # Tune Request
+                    self._status = None
+                    frames.append(SINGLE_BYTE_FRAMES[byte])
+                elif length:
+                    self._status = byte
+                    self._length = length
+                    buffer.append(byte)
+                else:
+                    # Undefined System Common message
+                    self._status = None
+        return frames
+
+
+def _status_map(remap):
+    """Return the translation table of the status bytes, for a channel
+    remapping."""
+    table = bytearray(IDENTITY)
+    if remap is None:
+        return bytes(table)
+    if isinstance(remap, int):
+        remap = {channel: remap for channel in range(1, 17)}
+    for source, destination in remap.items():
+        assert 1 <= source <= 16 and 1 <= destination <= 16, \
+            "'remap' channels must be integers from 1 to 16."
+        for type_nibble in range(0x80, 0xf0, 0x10):
+            table[type_nibble | (source - 1)] = type_nibble | (destination - 1)
+    return bytes(table)
+
+
+class Route:
+    """A routing rule, from a source port to one or more destination ports.
+
+    Args
+    ====
+    source (str): name of the source port.
+
+    destinations (iterable of str): names of the destination ports.
+
+    channels, types (optional): only route the messages with these channels
+    and types, see midi.filters.MessageFilter. By default, route every
+    Channel, System Common and SysEx message.
+
+    remap (int or dict, optional): channel of the routed Channel messages,
+    either a single channel for every message, or a {source channel:
+    destination channel} dict. Channels not in the dict are kept.
+
+    transpose (int, optional): number of semitones added to the note number
+    of the NoteOn, NoteOff and PolyphonicAftertouch messages. The notes
+    transposed out of the 0-127 range are dropped.
+
+    real_time (bool, optional): also route the Real-time messages, eg the
+    Timing Clock.
+
+    Attributes:
+    - messages, bytes: number of messages and bytes routed.
+    - dropped: number of messages dropped by the transposition.
+    """
+    def __init__(self, source, destinations, channels=None, types=None,
+                 remap=None, transpose=0, real_time=False):
+        self.source = source
+        self.destinations = tuple(destinations)
+        self.filter = MessageFilter(channels, types)
+        table = bytearray(self.filter.table)
+        if real_time:
+            table[REAL_TIME_START:] = bytes([1]) * (256 - REAL_TIME_START)
+        self.table = bytes(table)
+        self.remap = remap
+        self.transpose = transpose
+        self.real_time = real_time
+        self.status_map = _status_map(remap)
+        self._identity = self.status_map == IDENTITY and not transpose
+        self.reset_stats()
+
+    def __repr__(self):
+        return "Route('{}' -> {}, {!r}, remap={}, transpose={})".format(
+            self.source, list(self.destinations), self.filter, self.remap,
+            self.transpose)
+
+    def reset_stats(self):
+        self.messages = self.bytes = self.dropped = 0
+        self.started = time.monotonic()
+
+    def transform(self, frame):
+        """Return the remapped and transposed frame, or None if it must be
+        dropped."""
+        if self._identity or frame[0] >= SYSEX_START:
+            return frame
+        status = frame[0]
+        frame = bytearray(frame)
+        frame[0] = self.status_map[status]
+        if self.transpose and status < 0xb0:
+            note = frame[1] + self.transpose
+            if not 0 <= note <= 127:
+                self.dropped += 1
+                return None
+            frame[1] = note
+        return frame
+
+    def throughput(self):
+        """Return the number of messages and bytes routed, and their rate per
+        second since the creation of the route, or its last reset_stats()."""
+        elapsed = time.monotonic() - self.started
+        return {
+            'messages': self.messages, 'bytes': self.bytes,
+            'dropped': self.dropped,
+            'messages_per_second': self.messages / elapsed if elapsed else 0,
+            'bytes_per_second': self.bytes / elapsed if elapsed else 0,
+        }
+
+
+class MidiRouter:
+    """Merge and route MIDI messages between many ports, from a single thread.
+
+    Every port is watched by one selector (epoll on Linux). Incoming bytes are
+    only split into frames and forwarded as raw bytes: no Message object is
+    ever built. The frames of a port are sent to each matching route, in the
+    order they were received. Everything routed to a destination during a
+    poll is sent with a single write.
+
+    The ports must be MidiConnector objects, read only by the router.
+    """
+    def __init__(self):
+        self.ports = {}
+        self.routes = []
+        self._framers = {}
+        self._source_routes = {}
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+
+    def __repr__(self):
+        return 'MidiRouter(ports={}, routes={})'.format(
+            list(self.ports), len(self.routes))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_port(self, name, connector):
+        """Register 'connector' under 'name'."""
+        assert name not in self.ports, "Port '{}' already added.".format(name)
+        self.ports[name] = connector
+        self._framers[name] = MidiFramer()
+        self._source_routes[name] = []
+        self._selector.register(connector.fileno(), selectors.EVENT_READ,
+                                name)
+
+    def remove_port(self, name):
+        """Unregister a port, and remove the routes from or to it."""
+        connector = self.ports.pop(name)
+        try:
+            self._selector.unregister(connector.fileno())
+        except (KeyError, ValueError):
+            pass
+        for route in list(self.routes):
+            if route.source == name or name in route.destinations:
+                self.remove_route(route)
+        del self._framers[name]
+        del self._source_routes[name]
+
+    def add_route(self, source, destinations, **kwargs):
+        """Add a Route from 'source' to 'destinations', and return it. See
+        Route for the other arguments."""
+        route = Route(source, destinations, **kwargs)
+        for name in (source,) + route.destinations:
+            assert name in self.ports, "Unknown port '{}'.".format(name)
+        self.routes.append(route)
+        self._source_routes[source].append(route)
+        return route
+
+    def remove_route(self, route):
+        self.routes.remove(route)
+        self._source_routes[route.source].remove(route)
+
+    def route(self, source, data):
+        """Route raw bytes received from the port 'source'. Return a dict of
+        the bytes to send, by destination port name."""
+        outputs = {}
+        frames = self._framers[source].feed(data)
+        routes = self._source_routes[source]
+        for frame in frames:
+            status = frame[0]
+            for route in routes:
+                if not route.table[status]:
+                    continue
+                routed = route.transform(frame)
+                if routed is None:
+                    continue
+                route.messages += 1
+                route.bytes += len(routed)
+                for destination in route.destinations:
+                    output = outputs.get(destination)
+                    if output is None:
+                        output = outputs[destination] = bytearray()
+                    output += routed
+        return outputs
+
+    def poll(self, timeout=0):
+        """Wait at most 'timeout' seconds for incoming bytes, and route them.
+        Return the number of bytes sent."""
+        outputs = {}
+        for key, _ in self._selector.select(timeout):
+            name = key.data
+            data = self.ports[name].read_bytes()
+            if not data:
+                # Readable without any byte waiting: the port is gone.
+                self._selector.unregister(key.fileobj)
+                continue
+            for destination, output in self.route(name, data).items():
+                if destination in outputs:
+                    outputs[destination] += output
+                else:
+                    outputs[destination] = output
+        sent = 0
+        for destination, output in outputs.items():
+            sent += self.ports[destination].write_bytes(output) or 0
+        return sent
+
+    def run(self, poll_interval=0.1):
+        """Route messages until stop() is called, from another thread or a
+        signal handler. stop() takes effect within 'poll_interval' seconds.
+        """
+        self._running = True
+        while self._running:
+            self.poll(poll_interval)
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        """Return the throughput of every route, see Route.throughput()."""
+        return [(route, route.throughput()) for route in self.routes]
+
+    def close(self):
+        """Stop watching the ports. The connectors are left open."""
+        self._selector.close()
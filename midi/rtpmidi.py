@@ -0,0 +1,550 @@
+# !/usr/bin/env python3
+"""RTP-MIDI (RFC 6295) network transport, with AppleMIDI sessions.
+
+An RtpMidiSession is a transport for MidiConnector (see midi.transports)
+carrying MIDI between hosts over UDP. It speaks the AppleMIDI session
+protocol, as used by macOS, iOS and rtpMIDI on Windows: invitations on a
+control port, clock synchronization and RTP packets on the data port (control
+port + 1).
+
+Everything written in one call is packed into as few RTP packets as
+possible, and every datagram waiting is read at once.
+
+Loss recovery: every packet carries, after its MIDI commands, the commands of
+the previous packets not acknowledged yet by the receivers (see 'journal_depth').
+A receiver noticing a gap in the sequence numbers replays the missing commands
+from the journal of the next packet. This is a simplified redundancy scheme,
+not the chapters of the RFC 6295 recovery journal: its header announces an
+empty RFC journal, so other implementations ignore it, and only this library
+uses its content.
+
+Example:
+>>> session = RtpMidiSession(5004, name='stage-left')
+>>> session.invite('192.168.1.20', 5004)
+>>> conn = MidiConnector(transport=session, timeout=1)
+>>> conn.write(Message(NoteOn(60, 100), 1))
+"""
+
+import random
+import select
+import socket
+import struct
+import time
+from collections import deque
+
+from .codec import STATUS_LENGTHS, SYSEX_END, SYSEX_START
+from .router import MidiFramer
+
+SIGNATURE = b'\xff\xff'
+PROTOCOL_VERSION = 2
+PAYLOAD_TYPE = 0x61
+# AppleMIDI timestamps are in units of 100 microseconds.
+CLOCK_RATE = 10000
+
+INVITATION = struct.Struct('>2s2sIII')
+CLOCK_SYNC = struct.Struct('>2s2sIB3xQQQ')
+FEEDBACK = struct.Struct('>2s2sIH2x')
+RTP_HEADER = struct.Struct('>BBHII')
+JOURNAL_HEADER = struct.Struct('>BH')
+JOURNAL_ENTRY = struct.Struct('>HH')
+
+# Maximum size of the MIDI commands, and of the journal, of a packet: both
+# fit in a datagram not fragmented on usual networks.
+MAX_COMMANDS = 1024
+MAX_JOURNAL = 256
+
+# Number of packets received from a peer before acknowledging them.
+FEEDBACK_INTERVAL = 8
+
+
+def _bind_pair(host, port):
+    """Return the control and data UDP sockets, bound to 'port' and
+    port + 1. If 'port' is 0, pick two free consecutive ports."""
+    for _ in range(100):
+        control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        data = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            control.bind((host, port))
+            data.bind((host, control.getsockname()[1] + 1))
+        except OSError:
+            control.close()
+            data.close()
+            if port:
+                raise
+            continue
+        control.setblocking(False)
+        data.setblocking(False)
+        return control, data
+    raise OSError('No free pair of consecutive UDP ports.')
+
+
+def _sysex_end(commands, position):
+    """Return the position of the byte ending the SysEx (segment) starting at
+    'position', or -1."""
+    ends = [end for end in (commands.find(SYSEX_END, position + 1),
+                            commands.find(SYSEX_START, position + 1))
+            if end != -1]
+    return min(ends) if ends else -1
+
+
+class Peer:
+    """A remote participant of a session.
+
+    Attributes:
+    - ssrc, name: identifier and name of the participant.
+    - control, data: its control and data (host, port) addresses.
+    - latency: one-way latency in seconds, measured by the last clock
+    synchronization, None before the first one.
+    """
+    def __init__(self, ssrc, name, control):
+        self.ssrc = ssrc
+        self.name = name
+        self.control = control
+        self.data = (control[0], control[1] + 1)
+        self.latency = None
+        self._expected = None
+        self._acknowledged = None
+        self._unacknowledged = 0
+
+    def __repr__(self):
+        return "Peer('{}', {}:{})".format(self.name, *self.control)
+
+
+class RtpMidiSession:
+    """An AppleMIDI session, and the transport of its MIDI bytes.
+
+    The session accepts every invitation it receives, and sends the bytes
+    written to every peer. Control packets are handled whenever the session
+    is read.
+
+    Args
+    ====
+    port (int, optional): control port, the data port being port + 1. If 0,
+    pick two free ports.
+
+    name (str, optional): name of the session, shown to the peers.
+
+    host (str, optional): address to listen on.
+
+    timeout (float, optional): read timeout, in seconds.
+
+    journal_depth (int, optional): maximum number of previous packets
+    repeated in the journal of every packet. 0 disables the journal.
+
+    Attributes:
+    - peers: dict of the Peer objects, by SSRC.
+    - packets_sent, packets_received: number of RTP packets.
+    - recovered, lost: number of lost packets whose commands were recovered
+    from the journal, or not.
+    - malformed: number of RTP packets from a peer dropped because they are
+    truncated or malformed.
+    """
+    def __init__(self, port=5004, name='py-midi', host='0.0.0.0',
+                 timeout=None, journal_depth=16):
+        self.name = name
+        self.timeout = timeout
+        self.journal_depth = journal_depth
+        self.ssrc = random.getrandbits(32)
+        self._control, self._data = _bind_pair(host, port)
+        self.port = self._control.getsockname()[1]
+        self.peers = {}
+        self.packets_sent = self.packets_received = 0
+        self.recovered = self.lost = 0
+        self.malformed = 0
+        self._buffer = bytearray()
+        self._framer = MidiFramer()
+        self._sequence = random.getrandbits(16)
+        self._history = deque(maxlen=max(journal_depth, 1))
+        self._replies = {}
+        self._started = time.monotonic()
+
+    def __repr__(self):
+        return "RtpMidiSession('{}', port={}, peers={})".format(
+            self.name, self.port, list(self.peers.values()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _clock(self):
+        return int((time.monotonic() - self._started) * CLOCK_RATE)
+
+    def _invitation(self, command, token):
+        return (INVITATION.pack(SIGNATURE, command, PROTOCOL_VERSION, token,
+                                self.ssrc)
+                + self.name.encode('utf-8') + b'\0')
+
+    # Session
+
+    def invite(self, host, port=5004, timeout=5):
+        """Invite the session listening on 'host':'port', synchronize the
+        clocks, and return the new Peer.
+
+        Raise ConnectionRefusedError if the invitation is rejected, and
+        TimeoutError if it is not answered within 'timeout' seconds.
+        """
+        token = random.getrandbits(32)
+        deadline = time.monotonic() + timeout
+        for sock, address in ((self._control, (host, port)),
+                              (self._data, (host, port + 1))):
+            # Invitations are sent again every second, as UDP may lose them.
+            while token not in self._replies:
+                sock.sendto(self._invitation(b'IN', token), address)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        'No answer from {}:{}.'.format(host, port))
+                self._wait(lambda: token in self._replies,
+                           min(remaining, 1))
+            reply = self._replies.pop(token)
+            if reply is None:
+                raise ConnectionRefusedError(
+                    'Invitation rejected by {}:{}.'.format(host, port))
+            ssrc, name = reply
+            if sock is self._control:
+                peer = self.peers[ssrc] = Peer(ssrc, name, address)
+            else:
+                peer.data = address
+        self.synchronize(peer)
+        if not self._wait(lambda: peer.latency is not None,
+                          max(deadline - time.monotonic(), 0)):
+            raise TimeoutError(
+                'No clock synchronization with {}:{}.'.format(host, port))
+        return peer
+
+    def synchronize(self, peer):
+        """Start a clock synchronization with 'peer'. It is completed, and
+        peer.latency updated, when the session is read. Sessions should be
+        synchronized every few seconds."""
+        self._data.sendto(CLOCK_SYNC.pack(
+            SIGNATURE, b'CK', self.ssrc, 0, self._clock(), 0, 0), peer.data)
+
+    def _handle_control(self, packet, address, sock):
+        command = packet[2:4]
+        if command in (b'IN', b'OK', b'NO', b'BY'):
+            if len(packet) < INVITATION.size:
+                return
+            _, _, version, token, ssrc = INVITATION.unpack_from(packet)
+            name = packet[INVITATION.size:].split(b'\0', 1)[0].decode(
+                'utf-8', 'replace')
+            if command == b'IN':
+                if version != PROTOCOL_VERSION:
+                    sock.sendto(self._invitation(b'NO', token), address)
+                    return
+                if sock is self._control:
+                    self.peers[ssrc] = Peer(ssrc, name, address)
+                elif ssrc in self.peers:
+                    self.peers[ssrc].data = address
+                sock.sendto(self._invitation(b'OK', token), address)
+            elif command == b'OK':
+                self._replies[token] = (ssrc, name)
+            elif command == b'NO':
+                self._replies[token] = None
+            else:
+                self.peers.pop(ssrc, None)
+        elif command == b'CK' and len(packet) >= CLOCK_SYNC.size:
+            _, _, ssrc, count, sent, replied, _ = CLOCK_SYNC.unpack_from(
+                packet)
+            now = self._clock()
+            peer = self.peers.get(ssrc)
+            if count == 0:
+                sock.sendto(CLOCK_SYNC.pack(
+                    SIGNATURE, b'CK', self.ssrc, 1, sent, now, 0), address)
+            elif count == 1:
+                sock.sendto(CLOCK_SYNC.pack(
+                    SIGNATURE, b'CK', self.ssrc, 2, sent, replied, now),
+                    address)
+                if peer is not None:
+                    peer.latency = (now - sent) / 2 / CLOCK_RATE
+            elif count == 2 and peer is not None:
+                peer.latency = (now - replied) / 2 / CLOCK_RATE
+        elif command == b'RS' and len(packet) >= FEEDBACK.size:
+            _, _, ssrc, sequence = FEEDBACK.unpack_from(packet)
+            peer = self.peers.get(ssrc)
+            if peer is not None:
+                peer._acknowledged = sequence
+                self._trim_history()
+
+    def _trim_history(self):
+        """Forget the packets acknowledged by every peer."""
+        acknowledged = [peer._acknowledged for peer in self.peers.values()]
+        if None in acknowledged or not acknowledged:
+            return
+        history = self._history
+        while history and all(
+                (sequence - history[0][0]) & 0xffff < 0x8000
+                for sequence in acknowledged):
+            history.popleft()
+
+    # Receiving
+
+    def _receive(self):
+        """Handle every datagram waiting on both sockets."""
+        for sock in (self._control, self._data):
+            while True:
+                try:
+                    packet, address = sock.recvfrom(65536)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except ConnectionError:
+                    # ICMP port unreachable, from a peer gone.
+                    continue
+                if packet[:2] == SIGNATURE:
+                    self._handle_control(packet, address, sock)
+                elif sock is self._data:
+                    self._handle_rtp(packet)
+
+    def _wait(self, predicate, timeout):
+        """Handle the incoming datagrams until predicate() is true, or for
+        'timeout' seconds (for ever if None). Return predicate()."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        sockets = [self._control, self._data]
+        while True:
+            self._receive()
+            if predicate():
+                return True
+            if deadline is None:
+                select.select(sockets, [], [])
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return bool(predicate())
+                select.select(sockets, [], [], remaining)
+
+    def _handle_rtp(self, packet):
+        if len(packet) < RTP_HEADER.size + 1:
+            return
+        first, payload_type, sequence, _, ssrc = RTP_HEADER.unpack_from(
+            packet)
+        peer = self.peers.get(ssrc)
+        if (first >> 6 != 2 or payload_type & 0x7f != PAYLOAD_TYPE
+                or peer is None):
+            return
+        # CSRC list, then the header of the MIDI command section: 1 byte, or
+        # 2 with a 12 bits length.
+        position = RTP_HEADER.size + 4 * (first & 0xf)
+        if position >= len(packet):
+            self.malformed += 1
+            return
+        flags = packet[position]
+        if flags & 0x80:
+            if position + 1 >= len(packet):
+                self.malformed += 1
+                return
+            length = ((flags & 0xf) << 8) | packet[position + 1]
+            position += 2
+        else:
+            length = flags & 0xf
+            position += 1
+        if position + length > len(packet):
+            self.malformed += 1
+            return
+        commands = packet[position:position + length]
+
+        if peer._expected is not None:
+            gap = (sequence - peer._expected) & 0xffff
+            if gap >= 0x8000:
+                # Late or duplicated packet
+                return
+            if gap:
+                journal = (self._read_journal(packet, position + length)
+                           if flags & 0x40 else {})
+                for missing in range(gap):
+                    recovered = journal.get((peer._expected + missing) & 0xffff)
+                    if recovered is None:
+                        self.lost += 1
+                    else:
+                        self._add_commands(recovered, False)
+                        self.recovered += 1
+        self._add_commands(commands, flags & 0x20)
+        self.packets_received += 1
+        peer._expected = (sequence + 1) & 0xffff
+        peer._unacknowledged += 1
+        if peer._unacknowledged >= FEEDBACK_INTERVAL:
+            peer._unacknowledged = 0
+            self._control.sendto(FEEDBACK.pack(
+                SIGNATURE, b'RS', self.ssrc, sequence), peer.control)
+
+    @staticmethod
+    def _read_journal(packet, position):
+        """Return the MIDI commands held by the journal, by sequence
+        number."""
+        journal = {}
+        position += JOURNAL_HEADER.size
+        while position + JOURNAL_ENTRY.size <= len(packet):
+            sequence, length = JOURNAL_ENTRY.unpack_from(packet, position)
+            position += JOURNAL_ENTRY.size
+            if position + length > len(packet):
+                # Truncated entry: its commands are not recovered.
+                break
+            journal[sequence] = packet[position:position + length]
+            position += length
+        return journal
+
+    def _add_commands(self, commands, delta_first):
+        """Append the raw bytes of a MIDI command list to the read buffer.
+        Delta times are dropped, and running status is expanded."""
+        buffer = self._buffer
+        size = len(commands)
+        position = 0
+        status = None
+        has_delta = delta_first
+        while position < size:
+            if has_delta:
+                # Delta time: up to 4 bytes, all but the last one >= 0x80.
+                for _ in range(4):
+                    position += 1
+                    if position >= size or commands[position - 1] < 0x80:
+                        break
+                if position >= size:
+                    break
+            has_delta = True
+            byte = commands[position]
+            if byte == SYSEX_START or byte == SYSEX_END:
+                end = _sysex_end(commands, position)
+                if end == -1:
+                    break
+                # Segmented SysEx: F0 ... F0, then F7 ... F0, then F7 ... F7
+                start = position + 1 if byte == SYSEX_END else position
+                buffer += commands[start:end]
+                if commands[end] == SYSEX_END:
+                    buffer.append(SYSEX_END)
+                position = end + 1
+                status = None
+            elif byte >= 0x80:
+                length = STATUS_LENGTHS[byte] or 1
+                buffer += commands[position:position + length]
+                position += length
+                if byte < SYSEX_START:
+                    status = byte
+                elif byte < 0xf8:
+                    status = None
+            elif status is not None:
+                length = STATUS_LENGTHS[status] - 1
+                buffer.append(status)
+                buffer += commands[position:position + length]
+                position += length
+            else:
+                # Data byte without status: drop the rest of the list.
+                break
+
+    def poll(self, timeout=0):
+        """Wait at most 'timeout' seconds for incoming datagrams, and handle
+        them. A session only sending should be polled regularly, to answer
+        invitations and clock synchronizations."""
+        select.select([self._control, self._data], [], [], timeout)
+        self._receive()
+
+    @property
+    def in_waiting(self):
+        self._receive()
+        return len(self._buffer)
+
+    def read(self, size=1):
+        if not self._buffer:
+            self._wait(lambda: self._buffer, self.timeout)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    # Sending
+
+    def write(self, data):
+        """Send the complete messages held by 'data' to every peer, and
+        return len(data)."""
+        commands = bytearray()
+        for frame in self._framer.feed(data):
+            if len(frame) + 1 > MAX_COMMANDS:
+                if commands:
+                    self._send(commands)
+                    commands = bytearray()
+                self._send_segmented(frame)
+                continue
+            if len(commands) + len(frame) + 1 > MAX_COMMANDS:
+                self._send(commands)
+                commands = bytearray()
+            if commands:
+                # Delta time of 0: every message is sent at once.
+                commands.append(0)
+            commands += frame
+        if commands:
+            self._send(commands)
+        return len(data)
+
+    def _send_segmented(self, frame):
+        """Send a SysEx too big for one packet, in segments."""
+        payload = frame[1:-1]
+        step = MAX_COMMANDS - 2
+        for start in range(0, len(payload), step):
+            first = SYSEX_START if start == 0 else SYSEX_END
+            last = SYSEX_END if start + step >= len(payload) else SYSEX_START
+            self._send(bytes((first,)) + payload[start:start + step]
+                       + bytes((last,)))
+
+    def _send(self, commands):
+        self._sequence = sequence = (self._sequence + 1) & 0xffff
+        length = len(commands)
+        journal = self._journal() if self.journal_depth else b''
+        flags = 0x40 if journal else 0
+        if length > 15:
+            section = struct.pack('>H', 0x8000 | (flags << 8) | length)
+        else:
+            section = bytes((flags | length,))
+        packet = b''.join((
+            RTP_HEADER.pack(0x80, PAYLOAD_TYPE, sequence,
+                            self._clock() & 0xffffffff, self.ssrc),
+            section, commands, journal))
+        for peer in self.peers.values():
+            self._data.sendto(packet, peer.data)
+        self.packets_sent += 1
+        if self.journal_depth:
+            self._history.append((sequence, bytes(commands)))
+
+    def _journal(self):
+        """Return the journal of the next packet: the commands of the most
+        recent unacknowledged packets fitting in MAX_JOURNAL bytes."""
+        entries = []
+        size = 0
+        for sequence, commands in reversed(self._history):
+            size += JOURNAL_ENTRY.size + len(commands)
+            if size > MAX_JOURNAL:
+                break
+            entries.append(JOURNAL_ENTRY.pack(sequence, len(commands))
+                           + commands)
+        if not entries:
+            return b''
+        entries.reverse()
+        # Checkpoint: the oldest packet in the journal.
+        checkpoint = JOURNAL_ENTRY.unpack_from(entries[0])[0]
+        return JOURNAL_HEADER.pack(0, checkpoint) + b''.join(entries)
+
+    def fileno(self):
+        """Return the file descriptor of the data socket.
+
+        Invitations and clock synchronizations arrive on the control socket,
+        which does not wake a selector watching this descriptor only: watch
+        both filenos(), or call poll() regularly, eg from a timer.
+        """
+        return self._data.fileno()
+
+    def filenos(self):
+        """Return the file descriptors of the control and data sockets."""
+        return self._control.fileno(), self._data.fileno()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Leave the session, and close the sockets."""
+        if self._control.fileno() == -1:
+            return
+        for peer in self.peers.values():
+            try:
+                self._control.sendto(self._invitation(b'BY', 0), peer.control)
+            except OSError:
+                pass
+        self.peers.clear()
+        self._control.close()
+        self._data.close()
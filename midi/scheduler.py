@@ -0,0 +1,171 @@
+# !/usr/bin/env python3
+
+import heapq
+import itertools
+import threading
+import time
+
+from .stats import Histogram
+
+
+class ScheduledEvent:
+    """A message scheduled by a MidiScheduler. Use cancel() to unschedule it.
+    """
+    __slots__ = ('at', 'message', 'cancelled', '_sequence')
+
+    def __init__(self, at, message, sequence):
+        self.at = at
+        self.message = message
+        self.cancelled = False
+        self._sequence = sequence
+
+    def __repr__(self):
+        return 'ScheduledEvent(at={}, message={})'.format(
+            self.at, self.message)
+
+    def __lt__(self, other):
+        return (self.at, self._sequence) < (other.at, other._sequence)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class MidiScheduler:
+    """Send messages at precise times, from a dedicated thread.
+
+    The thread sleeps until shortly before the next event is due, then spins
+    until it is actually due, which avoids the jitter of the OS scheduler.
+    All the events due at the same time are sent with a single call to the
+    connector's write_many().
+
+    Args
+    ====
+    connector (MidiConnector): where to send the messages.
+
+    spin (float, optional): how long before an event the thread stops
+    sleeping and starts spinning, in seconds.
+
+    tempo (float, optional): tempo in beats per minute, used by
+    schedule_ticks().
+
+    ppq (int, optional): pulses (ticks) per quarter note.
+
+    Attributes:
+    - lateness: Histogram of the delays between the scheduled and actual
+    times of the sent events, in nanoseconds.
+
+    Example:
+    >>> scheduler = MidiScheduler(conn)
+    >>> scheduler.start()
+    >>> scheduler.schedule_relative(Message(NoteOn(60, 100), 1), 0.5)
+    >>> scheduler.schedule_ticks(Message(NoteOff(60, 0), 1), 480)
+    """
+    def __init__(self, connector, spin=0.002, tempo=120, ppq=480):
+        self.connector = connector
+        self.spin_ns = int(spin * 1e9)
+        self.ppq = ppq
+        self.tempo = tempo
+        self.origin = time.monotonic_ns()
+        self.lateness = Histogram()
+        self.error = None
+        self._events = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __repr__(self):
+        return 'MidiScheduler({!r}, tempo={}, ppq={})'.format(
+            self.connector, self.tempo, self.ppq)
+
+    def __len__(self):
+        return sum(1 for event in self._events if not event.cancelled)
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        """Start the sending thread. Ticks are counted from now on."""
+        if self._running:
+            return
+        self._running = True
+        self.origin = time.monotonic_ns()
+        self._thread = threading.Thread(
+            target=self._run, name='midi-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sending thread. Pending events are kept."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def clear(self):
+        """Cancel every pending event."""
+        with self._condition:
+            for event in self._events:
+                event.cancel()
+            self._events.clear()
+
+    def schedule(self, message, at):
+        """Schedule 'message' to be sent at the time 'at', as returned by
+        time.monotonic_ns(). Return a ScheduledEvent."""
+        event = ScheduledEvent(int(at), message, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._events, event)
+            if self._events[0] is event:
+                # The thread may be sleeping until a later event.
+                self._condition.notify()
+        return event
+
+    def schedule_relative(self, message, delay):
+        """Schedule 'message' to be sent in 'delay' seconds."""
+        return self.schedule(message, time.monotonic_ns() + delay * 1e9)
+
+    def ticks_to_ns(self, ticks):
+        """Return the duration of 'ticks' at the current tempo, in
+        nanoseconds."""
+        return int(ticks * 60e9 / (self.tempo * self.ppq))
+
+    def schedule_ticks(self, message, ticks):
+        """Schedule 'message' to be sent 'ticks' ticks after the start of the
+        scheduler, at the current tempo."""
+        return self.schedule(message, self.origin + self.ticks_to_ns(ticks))
+
+    def _run(self):
+        condition = self._condition
+        events = self._events
+        try:
+            while True:
+                with condition:
+                    while self._running and not events:
+                        condition.wait()
+                    if not self._running:
+                        return
+                    delay = events[0].at - time.monotonic_ns() - self.spin_ns
+                    if delay > 0:
+                        condition.wait(delay / 1e9)
+                        # An earlier event may have been scheduled meanwhile.
+                        continue
+                    due = events[0].at
+
+                while time.monotonic_ns() < due:
+                    pass
+
+                with condition:
+                    now = time.monotonic_ns()
+                    messages = []
+                    while events and events[0].at <= now:
+                        event = heapq.heappop(events)
+                        if not event.cancelled:
+                            messages.append(event.message)
+                            self.lateness.record(now - event.at)
+                if messages:
+                    self.connector.write_many(messages)
+        except Exception as error:
+            self.error = error
+            self._running = False
@@ -0,0 +1,307 @@
+# !/usr/bin/env python3
+"""Read and write Standard MIDI Files (.mid).
+
+Files are memory-mapped: opening a file only indexes the offsets of its track
+chunks, and the events of a track are decoded lazily, while iterating over it.
+
+Example:
+>>> with MidiFile('song.mid') as song:
+...     for delta_ticks, event in song.tracks[0]:
+...         print(delta_ticks, event)
+"""
+
+import mmap
+import os
+import struct
+
+from .message import Message
+from .codec import STATUS_DATA_LENGTHS, decode_channel_message
+from .parser import SYSEX_END, SYSEX_START
+from .types import SysEx
+
+HEADER_CHUNK = b'MThd'
+TRACK_CHUNK = b'MTrk'
+META_EVENT = 0xff
+
+# Meta event types
+SEQUENCE_NUMBER = 0x00
+TEXT = 0x01
+COPYRIGHT = 0x02
+TRACK_NAME = 0x03
+INSTRUMENT_NAME = 0x04
+LYRIC = 0x05
+MARKER = 0x06
+CUE_POINT = 0x07
+CHANNEL_PREFIX = 0x20
+END_OF_TRACK = 0x2f
+SET_TEMPO = 0x51
+SMPTE_OFFSET = 0x54
+TIME_SIGNATURE = 0x58
+KEY_SIGNATURE = 0x59
+SEQUENCER_SPECIFIC = 0x7f
+
+
+class SMFError(ValueError):
+    """Raised when a Standard MIDI File is malformed."""
+
+
+class MetaEvent:
+    """A meta event, only found in MIDI files.
+
+    Args
+    ====
+    type (int): the meta event type, eg SET_TEMPO (0x51).
+    data (bytes): the raw data of the event.
+    """
+    __slots__ = ('type', 'data')
+
+    def __init__(self, type, data=b''):
+        assert 0 <= type <= 127
+        self.type = type
+        self.data = bytes(data)
+
+    def __repr__(self):
+        return 'MetaEvent(0x{:02x}, {!r})'.format(self.type, self.data)
+
+    def __eq__(self, other):
+        if not isinstance(other, MetaEvent):
+            return NotImplemented
+        return self.type == other.type and self.data == other.data
+
+    def __hash__(self):
+        return hash((self.type, self.data))
+
+    @property
+    def tempo(self):
+        """Microseconds per quarter note of a SET_TEMPO event."""
+        assert self.type == SET_TEMPO, 'Not a SET_TEMPO meta event.'
+        return int.from_bytes(self.data[:3], 'big')
+
+    @classmethod
+    def set_tempo(cls, microseconds_per_quarter):
+        return cls(SET_TEMPO, microseconds_per_quarter.to_bytes(3, 'big'))
+
+
+def read_variable_length(buffer, position):
+    """Return the variable-length quantity starting at 'position', and the
+    position following it."""
+    value = 0
+    for _ in range(4):
+        byte = buffer[position]
+        position += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, position
+    raise SMFError('Variable-length quantity longer than 4 bytes.')
+
+
+def encode_variable_length(value):
+    """Return the bytes of 'value' as a variable-length quantity."""
+    assert 0 <= value <= 0x0fffffff, 'Value too big for a MIDI file.'
+    result = bytearray([value & 0x7f])
+    value >>= 7
+    while value:
+        result.insert(0, 0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(result)
+
+
+class Track:
+    """A track chunk of a MIDI file.
+
+    Iterate over the track to decode its events lazily, as
+    (delta_ticks, event) tuples, where event is a Message or a MetaEvent.
+    SysEx escape events (0xf7) are skipped.
+    """
+    def __init__(self, buffer, offset, length):
+        self._buffer = buffer
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return 'Track(offset={}, length={})'.format(self.offset, self.length)
+
+    def __iter__(self):
+        buffer = self._buffer
+        position = self.offset
+        end = self.offset + self.length
+        status = None
+        try:
+            while position < end:
+                delta, position = read_variable_length(buffer, position)
+                byte = buffer[position]
+                if byte == META_EVENT:
+                    meta_type = buffer[position + 1]
+                    if meta_type >= 0x80:
+                        raise SMFError(
+                            'Invalid meta event type 0x{:02x} at offset '
+                            '{}.'.format(meta_type, position + 1))
+                    length, position = read_variable_length(
+                        buffer, position + 2)
+                    event = MetaEvent(meta_type,
+                                      buffer[position:position + length])
+                    position += length
+                    status = None
+                    yield delta, event
+                    if meta_type == END_OF_TRACK:
+                        return
+                elif byte == SYSEX_START or byte == SYSEX_END:
+                    length, position = read_variable_length(
+                        buffer, position + 1)
+                    payload = buffer[position:position + length]
+                    position += length
+                    status = None
+                    if payload.endswith(bytes([SYSEX_END])):
+                        payload = payload[:-1]
+                    if byte == SYSEX_START and len(payload) >= 2:
+                        yield delta, Message(
+                            SysEx.from_payload(payload[0], payload[1:]))
+                else:
+                    if byte >= 0x80:
+                        status = byte
+                        position += 1
+                    elif status is None:
+                        raise SMFError(
+                            'Data byte without status at offset {}.'.format(
+                                position))
+                    length = STATUS_DATA_LENGTHS[status]
+                    if not length:
+                        raise SMFError(
+                            'Unexpected status byte 0x{:02x} at offset '
+                            '{}.'.format(status, position - 1))
+                    data1 = buffer[position]
+                    data2 = buffer[position + 1] if length == 2 else None
+                    position += length
+                    yield delta, decode_channel_message(status, data1, data2)
+        except IndexError:
+            raise SMFError('Track truncated at offset {}.'.format(position))
+
+
+class MidiFile:
+    """A Standard MIDI File, opened for reading.
+
+    Args
+    ====
+    path (str): path to the .mid file.
+
+    Attributes:
+    - format: 0 (single track), 1 (simultaneous tracks) or 2 (independent
+    tracks).
+    - division: ticks per quarter note, or SMPTE division if negative.
+    - tracks: list of Track objects.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                # mmap cannot map an empty file.
+                raise SMFError('Not a Standard MIDI File.')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return "MidiFile('{}', format={}, tracks={})".format(
+            self.path, self.format, len(self.tracks))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_header(self):
+        buffer = self._mmap
+        if buffer[:4] != HEADER_CHUNK or len(buffer) < 14:
+            raise SMFError('Not a Standard MIDI File.')
+        length, self.format, track_count, division = struct.unpack(
+            '>LHHh', buffer[4:14])
+        if self.format not in (0, 1, 2):
+            raise SMFError('Unknown MIDI file format {}.'.format(self.format))
+        self.division = division
+
+        self.tracks = []
+        position = 8 + length
+        size = len(buffer)
+        while position + 8 <= size and len(self.tracks) < track_count:
+            chunk_type = buffer[position:position + 4]
+            length = struct.unpack('>L', buffer[position + 4:position + 8])[0]
+            if chunk_type == TRACK_CHUNK:
+                self.tracks.append(Track(buffer, position + 8, length))
+            # Unknown chunks must be ignored.
+            position += 8 + length
+
+    def close(self):
+        self._mmap.close()
+
+
+def write_midi_file(path, tracks, format=1, division=480,
+                    running_status=True):
+    """Write a Standard MIDI File.
+
+    Args
+    ====
+    path (str): path of the file to write.
+
+    tracks (iterable): one iterable of (delta_ticks, event) per track, where
+    event is a Message or a MetaEvent. An END_OF_TRACK meta event is added
+    to the tracks not ending with one. Tracks are consumed lazily.
+
+    format (int): 0, 1 or 2. A format 0 file must have exactly one track.
+
+    division (int): ticks per quarter note.
+
+    running_status (bool): omit repeated status bytes.
+    """
+    assert format in (0, 1, 2), "'format' must be 0, 1 or 2."
+    # Only the list of tracks is built, their events are still consumed
+    # lazily.
+    tracks = list(tracks)
+    if format == 0 and len(tracks) != 1:
+        raise ValueError('A format 0 MIDI file has exactly one track.')
+    with open(path, 'wb') as f:
+        f.write(HEADER_CHUNK + struct.pack('>LHHh', 6, format, len(tracks),
+                                           division))
+        for track in tracks:
+            _write_track(f, track, running_status)
+
+
+def _write_track(f, events, running_status):
+    start = f.tell()
+    f.write(TRACK_CHUNK + bytes(4))
+    status = None
+    ended = False
+    for delta, event in events:
+        if ended:
+            raise ValueError('Event found after the end of the track.')
+        chunk = bytearray(encode_variable_length(delta))
+        if isinstance(event, MetaEvent):
+            chunk.append(META_EVENT)
+            chunk.append(event.type)
+            chunk += encode_variable_length(len(event.data))
+            chunk += event.data
+            status = None
+            ended = event.type == END_OF_TRACK
+        elif isinstance(event.type, SysEx):
+            content = memoryview(bytes(event))[1:]
+            chunk.append(SYSEX_START)
+            chunk += encode_variable_length(len(content))
+            chunk += content
+            status = None
+        else:
+            content = event.content
+            if running_status and content[0] == status:
+                chunk += bytes(content[1:])
+            else:
+                chunk += bytes(content)
+            status = content[0]
+        f.write(chunk)
+    if not ended:
+        f.write(bytes([0, META_EVENT, END_OF_TRACK, 0]))
+    end = f.tell()
+    f.seek(start + 4)
+    f.write(struct.pack('>L', end - start - 8))
+    f.seek(end)
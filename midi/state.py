@@ -0,0 +1,254 @@
+# !/usr/bin/env python3
+"""Running state of the 16 MIDI channels, fed from decoded messages.
+
+Example:
+>>> state = ChannelState()
+>>> conn = MidiConnector('/dev/serial0', state=state)
+>>> conn.read_many()
+>>> state.controller(1, 7)  # current volume of channel 1
+>>> other.write_many(state.chase())  # bring another device to this state
+"""
+
+from array import array
+
+from .message import Message
+from .types import (ChannelAftertouch, ControlChange, NoteOff, NoteOn,
+                    PitchBend, ProgramChange)
+
+# Value of the state not known yet, eg controllers never received.
+UNKNOWN = 0xff
+UNKNOWN_BEND = 0xffff
+
+# Controllers sent before the Program Change when chasing: Bank Select.
+BANK_SELECT = (0, 32)
+
+# Channel Mode messages: controllers 120 to 127. They are not values to
+# restore, but they may release the notes, or reset the controllers.
+CHANNEL_MODE = 120
+ALL_SOUND_OFF = 120
+RESET_ALL_CONTROLLERS = 121
+LOCAL_CONTROL = 122
+
+
+class ChannelState:
+    """Current program, controllers, pitch bend, aftertouch and held notes of
+    the 16 channels.
+
+    The state lives in fixed-size byte arrays, indexed by
+    (channel - 1) * 128 + number: every update is a single store, and
+    snapshot() a copy of about 4 KB. Values never received are UNKNOWN, and
+    are not restored by chase().
+
+    SysEx and System Common messages are ignored. Channel Mode messages are
+    not stored: All Sound Off, All Notes Off, and the Omni and Mono/Poly
+    messages release the notes of their channel, and Reset All Controllers
+    forgets its controllers and centers its pitch bend.
+
+    Attributes:
+    - controllers: bytearray of the Control Change values.
+    - velocities: bytearray of the velocity of the held notes, 0 if
+    released.
+    - programs: bytearray of the program numbers, from 0 to 127, by
+    channel - 1.
+    - bends: array of the pitch bend values, from 0 to 16383, by
+    channel - 1.
+    - pressures: bytearray of the Channel Aftertouch values, by channel - 1.
+    """
+    def __init__(self):
+        self.controllers = bytearray([UNKNOWN]) * 2048
+        self.velocities = bytearray(2048)
+        self.programs = bytearray([UNKNOWN]) * 16
+        self.bends = array('H', [UNKNOWN_BEND]) * 16
+        self.pressures = bytearray([UNKNOWN]) * 16
+        self._held = set()
+        self._bind_updates()
+
+    def __repr__(self):
+        return 'ChannelState(held_notes={})'.format(len(self._held))
+
+    def __eq__(self, other):
+        if not isinstance(other, ChannelState):
+            return NotImplemented
+        return (self.controllers == other.controllers
+                and self.velocities == other.velocities
+                and self.programs == other.programs
+                and self.bends == other.bends
+                and self.pressures == other.pressures)
+
+    __hash__ = None
+
+    def _bind_updates(self):
+        # Update functions, indexed by the high nibble of the status byte.
+        self._updates = (None,) * 8 + (
+            self._note_off, self._note_on, None, self._control_change,
+            self._program_change, self._channel_aftertouch,
+            self._pitch_bend, None)
+
+    # Updates
+
+    def update(self, message):
+        """Update the state with a decoded Message."""
+        message_type = message._type
+        update = self._updates[message_type._status >> 4]
+        if update is not None:
+            update(message._channel - 1, message_type._data1,
+                   message_type._data2)
+
+    def update_many(self, messages):
+        """Update the state with every Message of 'messages', in order."""
+        updates = self._updates
+        for message in messages:
+            message_type = message._type
+            update = updates[message_type._status >> 4]
+            if update is not None:
+                update(message._channel - 1, message_type._data1,
+                       message_type._data2)
+
+    def _note_on(self, channel, note, velocity):
+        index = (channel << 7) | note
+        self.velocities[index] = velocity
+        if velocity:
+            self._held.add(index)
+        else:
+            self._held.discard(index)
+
+    def _note_off(self, channel, note, velocity):
+        index = (channel << 7) | note
+        self.velocities[index] = 0
+        self._held.discard(index)
+
+    def _control_change(self, channel, number, value):
+        if number < CHANNEL_MODE:
+            self.controllers[(channel << 7) | number] = value
+        elif number == RESET_ALL_CONTROLLERS:
+            start = channel << 7
+            self.controllers[start:start + 128] = bytes([UNKNOWN]) * 128
+            self.bends[channel] = 8192
+            self.pressures[channel] = 0
+        elif number != LOCAL_CONTROL:
+            self._release(channel)
+
+    def _program_change(self, channel, program, _):
+        self.programs[channel] = program
+
+    def _channel_aftertouch(self, channel, pressure, _):
+        self.pressures[channel] = pressure
+
+    def _pitch_bend(self, channel, lsbyte, msbyte):
+        self.bends[channel] = (msbyte << 7) | lsbyte
+
+    def _release(self, channel):
+        start = channel << 7
+        self.velocities[start:start + 128] = bytes(128)
+        self._held = {index for index in self._held if index >> 7 != channel}
+
+    def reset(self):
+        """Forget everything, as after a reconnection."""
+        self.__init__()
+
+    # Queries
+
+    def program(self, channel):
+        """Return the program number (1 to 128) of 'channel', None if
+        unknown."""
+        program = self.programs[channel - 1]
+        return None if program == UNKNOWN else program + 1
+
+    def controller(self, channel, number):
+        """Return the value of the controller 'number' of 'channel', None if
+        unknown."""
+        value = self.controllers[((channel - 1) << 7) | number]
+        return None if value == UNKNOWN else value
+
+    def pitch_bend(self, channel):
+        """Return the pitch bend (0 to 16383, 8192 when centered) of
+        'channel', None if unknown."""
+        bend = self.bends[channel - 1]
+        return None if bend == UNKNOWN_BEND else bend
+
+    def velocity(self, channel, note):
+        """Return the velocity of a held note, 0 if it is released."""
+        return self.velocities[((channel - 1) << 7) | note]
+
+    def held_notes(self, channel=None):
+        """Return the sorted list of the (channel, note) held."""
+        return [((index >> 7) + 1, index & 0x7f)
+                for index in sorted(self._held)
+                if channel is None or index >> 7 == channel - 1]
+
+    def snapshot(self):
+        """Return a copy of the state."""
+        copy = self.__class__.__new__(self.__class__)
+        copy.controllers = self.controllers[:]
+        copy.velocities = self.velocities[:]
+        copy.programs = self.programs[:]
+        copy.bends = self.bends[:]
+        copy.pressures = self.pressures[:]
+        copy._held = set(self._held)
+        copy._bind_updates()
+        return copy
+
+    # Output
+
+    def chase(self, current=None, notes=False):
+        """Return the shortest list of messages bringing a device from the
+        'current' state (default to a state where nothing is known) to this
+        one.
+
+        Only the known values different from the current ones are sent, Bank
+        Select before Program Change. If 'notes' is True, the notes held here
+        and not in 'current' are started, and the other way round, released.
+        """
+        if current is None:
+            current = ChannelState()
+        messages = []
+        for channel in range(16):
+            start = channel << 7
+            controllers = self.controllers[start:start + 128]
+            changed = controllers != current.controllers[start:start + 128]
+            numbers = [number for number, value in enumerate(controllers)
+                       if value != UNKNOWN
+                       and value != current.controllers[start + number]
+                       ] if changed else []
+            for number in BANK_SELECT:
+                if number in numbers:
+                    messages.append(Message(
+                        ControlChange(number, controllers[number]),
+                        channel + 1))
+            program = self.programs[channel]
+            if program != UNKNOWN and program != current.programs[channel]:
+                messages.append(Message(
+                    ProgramChange(program, internal=True), channel + 1))
+            for number in numbers:
+                if number not in BANK_SELECT:
+                    messages.append(Message(
+                        ControlChange(number, controllers[number]),
+                        channel + 1))
+            bend = self.bends[channel]
+            if bend != UNKNOWN_BEND and bend != current.bends[channel]:
+                messages.append(Message(
+                    PitchBend(bend & 0x7f, bend >> 7), channel + 1))
+            pressure = self.pressures[channel]
+            if pressure != UNKNOWN and pressure != current.pressures[channel]:
+                messages.append(Message(ChannelAftertouch(pressure),
+                                        channel + 1))
+        if notes:
+            for index in sorted(current._held - self._held):
+                messages.append(Message(NoteOff(index & 0x7f, 0),
+                                        (index >> 7) + 1))
+            for index in sorted(self._held - current._held):
+                messages.append(Message(
+                    NoteOn(index & 0x7f, self.velocities[index]),
+                    (index >> 7) + 1))
+        return messages
+
+    def panic(self):
+        """Return the NoteOff messages releasing every held note, and
+        release them. The cost only depends on the number of held notes."""
+        messages = [Message(NoteOff(index & 0x7f, 0), (index >> 7) + 1)
+                    for index in sorted(self._held)]
+        velocities = self.velocities
+        for index in self._held:
+            velocities[index] = 0
+        self._held = set()
+        return messages
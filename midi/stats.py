@@ -0,0 +1,174 @@
+# !/usr/bin/env python3
+
+from collections import deque
+
+
+class Histogram:
+    """A histogram of durations, in nanoseconds, with logarithmic buckets.
+
+    Bucket n counts the values v such that 2**(n-1) <= v / resolution < 2**n
+    (bucket 0 counts values below 'resolution'). Recording a value is O(1),
+    and the memory used does not depend on the number of values.
+
+    Args
+    ====
+    resolution (int): width of the first bucket, in nanoseconds. Default to
+    1 microsecond.
+
+    buckets (int): number of buckets. Bigger values land in the last one.
+    """
+    def __init__(self, resolution=1000, buckets=32):
+        self.resolution = resolution
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def __repr__(self):
+        return 'Histogram(count={}, mean={}, max={})'.format(
+            self.count, self.mean, self.max)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, value):
+        """Add a duration, in nanoseconds. Negative values count as 0."""
+        if value < 0:
+            value = 0
+        index = (value // self.resolution).bit_length()
+        counts = self.counts
+        if index >= len(counts):
+            index = len(counts) - 1
+        counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def clear(self):
+        self.counts = [0] * len(self.counts)
+        self.count = self.total = 0
+        self.min = self.max = None
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def bucket_bounds(self, index):
+        """Return the (lower, upper) bounds of a bucket, in nanoseconds."""
+        if index == 0:
+            return 0, self.resolution
+        return self.resolution << (index - 1), self.resolution << index
+
+    def percentile(self, percent):
+        """Return an upper bound of the given percentile, in nanoseconds."""
+        assert 0 <= percent <= 100, "'percent' must be from 0 to 100."
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if index == len(self.counts) - 1:
+                    # Last bucket: no upper bound
+                    return self.max
+                return min(self.bucket_bounds(index)[1], self.max)
+        return self.max
+
+    def summary(self):
+        """Return a dict with the main statistics, in nanoseconds."""
+        return {
+            'count': self.count, 'mean': self.mean, 'min': self.min,
+            'max': self.max, 'p50': self.percentile(50),
+            'p90': self.percentile(90), 'p99': self.percentile(99),
+        }
+
+
+class RollingStats:
+    """Statistics over the last 'window' recorded values.
+
+    Args
+    ====
+    window (int): number of values kept.
+    """
+    def __init__(self, window=1024):
+        self._values = deque(maxlen=window)
+        self.count = 0
+
+    def __repr__(self):
+        return 'RollingStats(count={}, window={})'.format(
+            self.count, self._values.maxlen)
+
+    def __len__(self):
+        return len(self._values)
+
+    def record(self, value):
+        self._values.append(value)
+        self.count += 1
+
+    def clear(self):
+        self._values.clear()
+        self.count = 0
+
+    @property
+    def mean(self):
+        values = self._values
+        return sum(values) / len(values) if values else None
+
+    def percentile(self, percent):
+        """Return the given percentile of the values in the window."""
+        assert 0 <= percent <= 100, "'percent' must be from 0 to 100."
+        if not self._values:
+            return None
+        values = sorted(self._values)
+        return values[min(len(values) - 1, int(percent / 100 * len(values)))]
+
+    def summary(self):
+        """Return a dict with the main statistics of the window."""
+        values = sorted(self._values)
+        if not values:
+            return {'count': self.count}
+        return {
+            'count': self.count, 'mean': sum(values) / len(values),
+            'min': values[0], 'max': values[-1],
+            'p50': values[int(0.5 * len(values))],
+            'p90': values[int(0.9 * len(values))],
+            'p99': values[int(0.99 * len(values))],
+        }
+
+
+class ReceiveStats:
+    """Timing statistics of the messages received by a connector.
+
+    Attributes:
+    - inter_arrival: RollingStats of the durations between the first bytes of
+    two consecutive messages, in nanoseconds.
+    - decode_latency: RollingStats of the durations between the arrival of the
+    first byte of a message and the end of its decoding, in nanoseconds.
+    """
+    def __init__(self, window=1024):
+        self.inter_arrival = RollingStats(window)
+        self.decode_latency = RollingStats(window)
+        self._last_timestamp = None
+
+    def __repr__(self):
+        return 'ReceiveStats(count={})'.format(self.decode_latency.count)
+
+    def record(self, messages, decoded_at):
+        """Record the timestamps of 'messages', decoded at 'decoded_at'."""
+        last = self._last_timestamp
+        for message in messages:
+            timestamp = message.timestamp
+            if last is not None:
+                self.inter_arrival.record(timestamp - last)
+            self.decode_latency.record(decoded_at - timestamp)
+            last = timestamp
+        self._last_timestamp = last
+
+    def summary(self):
+        return {'inter_arrival': self.inter_arrival.summary(),
+                'decode_latency': self.decode_latency.summary()}
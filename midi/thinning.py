@@ -0,0 +1,167 @@
+# !/usr/bin/env python3
+"""Output thinning of continuous controllers, to save bandwidth.
+
+At 31250 bauds, a MIDI cable carries about 1000 messages of 3 bytes per
+second. Faders and pitch wheels easily produce more updates than that, and
+sending them all only delays the following messages. An OutputThinner keeps
+at most one update per stream and per time interval: the other ones are
+coalesced, and only the latest value is sent.
+"""
+
+import time
+
+from .codec import STATUS_CHANNELS
+from .types import ChannelAftertouch, ControlChange, PitchBend
+
+# Controllers never coalesced: Bank Select, Data Entry, RPN/NRPN, switches
+# (Sustain, Portamento...) and Channel Mode messages. Their every value is
+# meaningful.
+DISCRETE_CONTROLLERS = frozenset(
+    [0, 6, 32, 38] + list(range(64, 70)) + list(range(96, 102))
+    + list(range(120, 128)))
+
+_THINNED_STATUSES = frozenset(
+    midi_type._status for midi_type in
+    (ControlChange, PitchBend, ChannelAftertouch))
+
+
+class OutputThinner:
+    """Coalesce ControlChange, PitchBend and ChannelAftertouch updates.
+
+    Each (channel, controller) pair, and the pitch bend and aftertouch of
+    each channel, is a stream. A stream sends at most 'rate' updates per
+    second: an update arriving too early is held, and replaced by any newer
+    update of the same stream. Held updates are sent once their stream is
+    allowed to send again, see due().
+
+    Every other message (notes, program changes, SysEx...) is passed through
+    immediately, in order. Notes are never dropped.
+
+    Args
+    ====
+    rate (float, optional): maximum number of updates per second of a stream.
+
+    rates (dict, optional): rate of specific streams, by controller number, or
+    by type (PitchBend or ChannelAftertouch), eg {7: 20, PitchBend: 500}.
+
+    discrete (iterable of int, optional): controllers never coalesced.
+    Default to DISCRETE_CONTROLLERS.
+
+    Attributes:
+    - coalesced: number of updates replaced by a newer one, and never sent.
+
+    Example:
+    >>> conn = MidiConnector('/dev/serial0', thinner=OutputThinner(rate=50))
+    """
+    def __init__(self, rate=100, rates=None, discrete=DISCRETE_CONTROLLERS):
+        assert rate > 0, "'rate' must be positive."
+        self.rate = rate
+        self.rates = dict(rates or {})
+        self.discrete = frozenset(discrete)
+        self.coalesced = 0
+        self._coalesced_streams = {}
+        self._intervals = {}
+        self._last_sent = {}
+        self._pending = {}
+
+    def __repr__(self):
+        return 'OutputThinner(rate={}, pending={}, coalesced={})'.format(
+            self.rate, len(self._pending), self.coalesced)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _stream(self, message):
+        """Return the stream key of 'message', or None if it must not be
+        thinned."""
+        status = message.status
+        if status & 0xf0 not in _THINNED_STATUSES:
+            return None
+        if isinstance(message.type, ControlChange):
+            controller = message.type.data1
+            if controller in self.discrete:
+                return None
+            return (status << 8) | controller
+        return status << 8
+
+    def _interval(self, key, message):
+        interval = self._intervals.get(key)
+        if interval is None:
+            if isinstance(message.type, ControlChange):
+                rate = self.rates.get(message.type.data1, self.rate)
+            else:
+                rate = self.rates.get(type(message.type), self.rate)
+            interval = self._intervals[key] = 1 / rate
+        return interval
+
+    def add(self, message, now=None):
+        """Return the list of messages to send now for 'message': either
+        [message], or [] if it is held."""
+        key = self._stream(message)
+        if key is None:
+            return [message]
+        if now is None:
+            now = time.monotonic()
+        pending = self._pending
+        if key in pending:
+            pending[key] = message
+            self.coalesced += 1
+            self._coalesced_streams[key] = \
+                self._coalesced_streams.get(key, 0) + 1
+            return []
+        last = self._last_sent.get(key)
+        if last is None or now - last >= self._interval(key, message):
+            self._last_sent[key] = now
+            return [message]
+        pending[key] = message
+        return []
+
+    def due(self, now=None):
+        """Return the held updates which can be sent now, and forget
+        them."""
+        if not self._pending:
+            return []
+        if now is None:
+            now = time.monotonic()
+        messages = []
+        last_sent = self._last_sent
+        for key, message in list(self._pending.items()):
+            if now - last_sent[key] >= self._interval(key, message):
+                messages.append(message)
+                last_sent[key] = now
+                del self._pending[key]
+        return messages
+
+    def next_due(self):
+        """Return the time.monotonic() time when the next held update can be
+        sent, or None if there is none."""
+        if not self._pending:
+            return None
+        return min(self._last_sent[key] + self._interval(key, message)
+                   for key, message in self._pending.items())
+
+    def flush(self):
+        """Return every held update, and forget them."""
+        messages = list(self._pending.values())
+        self._pending.clear()
+        now = time.monotonic()
+        for message in messages:
+            self._last_sent[self._stream(message)] = now
+        return messages
+
+    def stats(self):
+        """Return the number of coalesced updates, by (channel, type name,
+        controller) stream. The controller is None for PitchBend and
+        ChannelAftertouch."""
+        stats = {}
+        for key, count in self._coalesced_streams.items():
+            status = key >> 8
+            if status & 0xf0 == ControlChange._status:
+                stream = (STATUS_CHANNELS[status], 'ControlChange',
+                          key & 0xff)
+            elif status & 0xf0 == PitchBend._status:
+                stream = (STATUS_CHANNELS[status], 'PitchBend', None)
+            else:
+                stream = (STATUS_CHANNELS[status], 'ChannelAftertouch', None)
+            stats[stream] = count
+        return stats
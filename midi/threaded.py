@@ -0,0 +1,335 @@
+# !/usr/bin/env python3
+
+import threading
+import time
+
+from .midi import MidiConnector
+from .types import SysEx
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+BLOCK = 'block'
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class RingBuffer:
+    """A fixed-size, thread-safe FIFO of messages.
+
+    Args
+    ====
+    size (int): maximum number of items held by the buffer.
+
+    overflow (str): what to do when putting an item into a full buffer:
+    - 'drop-oldest': forget the oldest item to make room for the new one.
+    - 'drop-newest': forget the new item.
+    - 'block': wait until a consumer makes room.
+    """
+    def __init__(self, size, overflow=DROP_OLDEST):
+        assert size >= 1, "'size' must be a positive integer."
+        assert overflow in OVERFLOW_POLICIES, \
+            "'overflow' must be one of {}.".format(OVERFLOW_POLICIES)
+        self.size = size
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+        self._items = [None] * size
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __repr__(self):
+        return '{}(size={}, overflow={!r})'.format(
+            self.__class__.__name__, self.size, self.overflow)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def depth(self):
+        """Number of items waiting in the buffer."""
+        return self._count
+
+    def put(self, item):
+        """Add 'item' to the buffer, and return whether it was stored."""
+        with self._lock:
+            if self._count == self.size:
+                if self.overflow == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                elif self.overflow == DROP_OLDEST:
+                    self._items[self._head] = None
+                    self._head = (self._head + 1) % self.size
+                    self._count -= 1
+                    self.dropped += 1
+                else:
+                    while self._count == self.size and not self.closed:
+                        self._not_full.wait()
+            if self.closed:
+                return False
+            self._items[(self._head + self._count) % self.size] = item
+            self._count += 1
+            self._not_empty.notify()
+            return True
+
+    def _pop(self):
+        item = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % self.size
+        self._count -= 1
+        return item
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item.
+
+        Wait for an item if the buffer is empty. Return None if 'timeout'
+        seconds went by without receiving any, or if the buffer is closed.
+        """
+        with self._lock:
+            if not self._count:
+                if timeout is None:
+                    while not self._count and not self.closed:
+                        self._not_empty.wait()
+                else:
+                    deadline = time.monotonic() + timeout
+                    while not self._count and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._not_empty.wait(remaining)
+                if not self._count:
+                    return
+            item = self._pop()
+            self._not_full.notify()
+            return item
+
+    def get_many(self, max_items=None):
+        """Remove and return the list of items waiting, without blocking."""
+        with self._lock:
+            count = self._count
+            if max_items is not None:
+                count = min(count, max_items)
+            items = [self._pop() for _ in range(count)]
+            self._not_full.notify_all()
+            return items
+
+    def close(self):
+        """Wake up every waiting producer and consumer."""
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def reopen(self):
+        """Accept items again after close(). The items still waiting are
+        kept."""
+        with self._lock:
+            self.closed = False
+
+
+class Subscription(RingBuffer):
+    """A consumer queue, fed with the messages matching its filters.
+
+    Args
+    ====
+    channels (iterable of int, optional): channels to receive messages from.
+    SysEx messages, which have no channel, are always received.
+
+    types (iterable of MidiMessageType classes, optional): types of messages
+    to receive.
+
+    See RingBuffer for the other arguments.
+    """
+    def __init__(self, size, overflow=DROP_OLDEST, channels=None, types=None):
+        super().__init__(size, overflow)
+        if channels is not None:
+            channels = frozenset(channels)
+            assert all(1 <= channel <= 16 for channel in channels), \
+                "'channels' must be integers from 1 to 16."
+        self.channels = channels
+        self.types = tuple(types) if types is not None else None
+
+    def __iter__(self):
+        while True:
+            message = self.get()
+            if message is None:
+                return
+            yield message
+
+    def accepts(self, message):
+        if self.types is not None and not isinstance(message.type, self.types):
+            return False
+        return (self.channels is None or message.channel in self.channels
+                or isinstance(message.type, SysEx))
+
+
+class ThreadedMidiConnector(MidiConnector):
+    """A MidiConnector whose serial port is read by a background thread.
+
+    The reader thread decodes the incoming bytes as soon as they arrive, and
+    stores the messages into a ring buffer, so a slow consumer never delays
+    the reading of the serial port. Several consumers can share the same port
+    by calling subscribe(): each subscription gets its own queue.
+
+    The ring buffer read by read() and read_many() is only fed while no
+    subscription exists, or once read() or read_many() has been called: a
+    connector only consumed through subscriptions never fills it, and never
+    blocks on it. stop() wakes up every consumer; start() can then be called
+    again, and the same subscriptions keep receiving messages.
+
+    Args
+    ====
+    buffer_size (int, optional): size of the ring buffer read by read() and
+    read_many().
+
+    overflow (str, optional): overflow policy of the ring buffer, see
+    RingBuffer.
+
+    poll_interval (float, optional): maximum duration the reader thread
+    blocks on the serial port, ie the maximum delay for stop() to return.
+
+    See MidiConnector for the other arguments.
+
+    Example:
+    >>> conn = ThreadedMidiConnector('/dev/serial0')
+    >>> drums = conn.subscribe(channels=[10], types=[NoteOn])
+    >>> conn.start()
+    >>> for msg in drums:
+    ...     print(msg)
+    """
+    def __init__(self, port, baudrate=31250, timeout=None, buffer_size=1024,
+                 overflow=DROP_OLDEST, poll_interval=0.1, **kwargs):
+        super().__init__(port, baudrate, timeout=poll_interval, **kwargs)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.buffer = RingBuffer(buffer_size, overflow)
+        self.error = None
+        self._buffered = False
+        self._subscriptions = []
+        self._subscriptions_lock = threading.Lock()
+        self._running = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    @property
+    def dropped(self):
+        """Number of messages dropped by the ring buffer."""
+        return self.buffer.dropped
+
+    @property
+    def depth(self):
+        """Number of messages waiting in the ring buffer."""
+        return self.buffer.depth
+
+    def start(self):
+        """Start the reader thread, or restart it after stop()."""
+        if self.running:
+            return
+        self.error = None
+        self.buffer.reopen()
+        for subscription in self.subscriptions:
+            subscription.reopen()
+        self._running.set()
+        self._thread = threading.Thread(
+            target=self._run, name='midi-reader-{}'.format(self.port),
+            daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reader thread, and wait for it to exit."""
+        self._running.clear()
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.buffer.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        try:
+            while self._running.is_set():
+                if not self._fill():
+                    continue
+                self._dispatch(MidiConnector.read_many(self))
+        except Exception as error:
+            self.error = error
+            self._running.clear()
+            self.buffer.close()
+            for subscription in self.subscriptions:
+                subscription.close()
+
+    def _dispatch(self, messages):
+        subscriptions = self._subscriptions
+        buffered = self._buffered or not subscriptions
+        for message in messages:
+            if buffered:
+                self.buffer.put(message)
+            for subscription in subscriptions:
+                if subscription.accepts(message):
+                    subscription.put(message)
+
+    @property
+    def subscriptions(self):
+        return list(self._subscriptions)
+
+    def subscribe(self, channels=None, types=None, size=None, overflow=None):
+        """Return a new Subscription, receiving the messages matching the
+        given channels and types.
+
+        'size' and 'overflow' default to the ones of the connector's ring
+        buffer.
+        """
+        subscription = Subscription(
+            size or self.buffer.size, overflow or self.buffer.overflow,
+            channels=channels, types=types)
+        with self._subscriptions_lock:
+            # Copy on write: the reader thread iterates without locking.
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._subscriptions_lock:
+            self._subscriptions = [
+                sub for sub in self._subscriptions if sub is not subscription]
+        subscription.close()
+
+    def read(self, channel=None):
+        """Return a MIDI message from the ring buffer.
+
+        Behave as MidiConnector.read(), but never touch the serial port.
+        """
+        if channel is not None:
+            assert 1 <= channel <= 16, \
+                "'channel' parameter must be an integer from 1 to 16."
+        self._buffered = True
+
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        while True:
+            if self.timeout is None:
+                message = self.buffer.get()
+            else:
+                message = self.buffer.get(
+                    max(0, deadline - time.monotonic()))
+            if message is None:
+                return
+            if (channel is None or message.channel == channel
+                    or isinstance(message.type, SysEx)):
+                return message
+
+    def read_many(self, max_messages=None, timeout=0):
+        """Return the list of messages waiting in the ring buffer."""
+        self._buffered = True
+        messages = self.buffer.get_many(max_messages)
+        if not messages and timeout:
+            message = self.buffer.get(timeout)
+            if message is not None:
+                messages = [message]
+                if max_messages is None or max_messages > 1:
+                    messages += self.buffer.get_many(
+                        None if max_messages is None else max_messages - 1)
+        return messages
@@ -0,0 +1,96 @@
+# !/usr/bin/env python3
+"""Transports carrying the raw bytes of a MidiConnector.
+
+A transport is any object with the interface of serial.Serial used by the
+connector:
+
+- read(size=1): return at most 'size' bytes. If nothing is waiting, wait for
+at least one byte, at most 'timeout' seconds (for ever if None), and return
+b'' on timeout.
+- write(data): send 'data', and return the number of bytes sent.
+- in_waiting: number of bytes which can be read without waiting.
+- timeout: read timeout, in seconds, set by the connector.
+- flush(), close(), and fileno() for the transports which can be watched by
+a selector.
+
+serial.Serial itself is the serial transport, used by default. This module
+provides an in-memory transport, see midi.rtpmidi for the network one.
+
+Example:
+>>> local, remote = MemoryTransport.pair()
+>>> conn = MidiConnector(transport=local)
+"""
+
+import io
+import threading
+
+
+class MemoryTransport:
+    """A transport keeping the bytes in memory, eg for tests or to measure
+    the software throughput without the 31250 bauds limit.
+
+    A transport alone is a loopback: the bytes written can be read back. Use
+    pair() to get two transports connected to each other.
+
+    Args
+    ====
+    timeout (float, optional): read timeout, in seconds.
+
+    Attributes:
+    - peer: the transport receiving the bytes written.
+    - bytes_written: number of bytes written.
+    """
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.peer = self
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __repr__(self):
+        return 'MemoryTransport(in_waiting={})'.format(len(self._buffer))
+
+    @classmethod
+    def pair(cls, timeout=None):
+        """Return two transports, each one reading what the other writes."""
+        first, second = cls(timeout), cls(timeout)
+        first.peer, second.peer = second, first
+        return first, second
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def fileno(self):
+        raise io.UnsupportedOperation('MemoryTransport has no file descriptor.')
+
+    def receive(self, data):
+        """Make 'data' available to read(), as if it was received."""
+        with self._condition:
+            self._buffer += data
+            self._condition.notify_all()
+
+    def read(self, size=1):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._buffer or self._closed, self.timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return data
+
+    def write(self, data):
+        if self._closed:
+            raise ValueError('Write on a closed transport.')
+        self.peer.receive(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Close the transport: pending and later read() return at once."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
@@ -1,53 +1,75 @@
 # !/usr/bin/env python3
 
 
+class DataAttribute:
+    """A read-only descriptor giving a meaningful name to data1 or data2."""
+    def __init__(self, name, slot, offset=0):
+        self.name = name
+        self.slot = slot
+        self.offset = offset
+
+    def __set__(self, instance, value):
+        raise TypeError('"{}" is a read-only attribute.'.format(self.name))
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.offset:
+            return self.slot.__get__(instance, owner) + self.offset
+        return self.slot.__get__(instance, owner)
+
+
 class MidiMessageType:
-    """Parent class to inherit all message types from."""
-    def __new__(cls, *args, **kwargs):
-        if cls.__name__ == 'MidiMessageType':
-            raise RuntimeError('You must instanciate children classes.')
-        instance = super().__new__(cls)
-        return instance
+    """Parent class to inherit all message types from.
 
-    def __init__(self, data1, data2=None, internal=False):
-        self._internal = internal
-        self._type = self.__class__.__name__
-        self._build(data1, data2)
-
-        if self._type == 'ProgramChange' and not internal:
-            # MIDI standard numbers the PCs from 1 to 128.
-            # Therefore, we need to decrement the number in order
-            # to have the actual 7 bits value. When the message
-            # is built with internal builder – ie from connector.read() –
-            # the actual number is already correct.
-            assert 1 <= data1 <= 128
-            self._data1 = data1 - 1
-        else:
-            assert 0 <= data1 <= 127
-            self._data1 = data1
+    Message types are immutable and hashable. Each child class lists the names
+    of its data bytes in '_attributes', eg ('note_number', 'velocity'), which
+    become read-only attributes when the class is defined, and its status byte
+    value on channel 1 in '_status'.
+    """
+    __slots__ = ('_data1', '_data2')
+    _attributes = ()
+    _status = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = (MidiMessageType._data1, MidiMessageType._data2)
+        for name, slot in zip(cls._attributes, slots):
+            if name not in cls.__dict__:
+                setattr(cls, name, DataAttribute(name, slot))
+
+    def __init__(self, data1, data2=None, internal=False):
+        if type(self) is MidiMessageType:
+            raise RuntimeError('You must instanciate children classes.')
+        assert 0 <= data1 <= 127
         if data2 is not None:
-            if self._type == 'SysEx':
-                assert all(0 <= data <= 255 for data in data2)
-            else:
-                assert 0 <= data2 <= 127
+            assert 0 <= data2 <= 127
+        self._data1 = data1
         self._data2 = data2
 
-    def _build(self, *args):
-        from .utils import TYPES_ATTRIBUTES
-        for index, attr in enumerate(TYPES_ATTRIBUTES[self.__class__]):
-            setattr(self, attr, args[index])
+    @classmethod
+    def _from_data(cls, data1, data2=None):
+        """Return an instance holding data bytes known to be valid, eg just
+        decoded from a MIDI stream, without checking them again."""
+        self = object.__new__(cls)
+        self._data1 = data1
+        self._data2 = data2
+        return self
 
     def __repr__(self):
         name = self.__class__.__name__
         if self._data2 is not None:
             return '{}({}, {})'.format(name, self._data1, self._data2)
-        elif name == 'ProgramChange':
-            # Increment data_1 to have the MIDI program number, from
-            # 1 to 128.
-            return '{}({})'.format(name, self._data1 + 1)
         return '{}({})'.format(name, self._data1)
 
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self._data1 == other._data1 and self._data2 == other._data2
+
+    def __hash__(self):
+        return hash((self.__class__, self._data1, self._data2))
+
     @property
     def data1(self):
         return self._data1
@@ -59,10 +81,16 @@ class MidiMessageType:
 
 class NoteOff(MidiMessageType):
     """MIDI message type Note Off"""
+    __slots__ = ()
+    _attributes = ('note_number', 'velocity')
+    _status = 0x80
 
 
 class NoteOn(MidiMessageType):
     """MIDI message type Note On."""
+    __slots__ = ()
+    _attributes = ('note_number', 'velocity')
+    _status = 0x90
 
 
 class PolyphonicAftertouch(MidiMessageType):
@@ -73,22 +101,53 @@ class PolyphonicAftertouch(MidiMessageType):
     Often, Channel Aftertouch is prefered, as it sets a global pressure level
     for every key.
     """
+    __slots__ = ()
+    _attributes = ('note_number', 'pressure')
+    _status = 0xa0
 
 
 class ChannelAftertouch(MidiMessageType):
     """MIDI message type Channel Aftertouch."""
+    __slots__ = ()
+    _attributes = ('pressure',)
+    _status = 0xd0
 
 
 class ControlChange(MidiMessageType):
     """MIDI message type Control Change."""
+    __slots__ = ()
+    _attributes = ('control_number', 'value')
+    _status = 0xb0
 
 
 class ProgramChange(MidiMessageType):
-    """MIDI message type Program Change."""
+    """MIDI message type Program Change.
+
+    MIDI standard numbers the programs from 1 to 128, so 'program_number' is
+    data1 + 1. When the message is built with the internal builder – ie from
+    connector.read() – data1 is given as the actual 7 bits value.
+    """
+    __slots__ = ()
+    _attributes = ('program_number',)
+    _status = 0xc0
+    program_number = DataAttribute(
+        'program_number', MidiMessageType._data1, offset=1)
+
+    def __init__(self, program_number, internal=False):
+        if not internal:
+            assert 1 <= program_number <= 128
+            program_number -= 1
+        super().__init__(program_number)
+
+    def __repr__(self):
+        return 'ProgramChange({})'.format(self._data1 + 1)
 
 
 class PitchBend(MidiMessageType):
     """MIDI message type Pitch Wheel."""
+    __slots__ = ()
+    _attributes = ('lsbyte', 'msbyte')
+    _status = 0xe0
 
 
 class SysEx(MidiMessageType):
@@ -103,14 +162,124 @@ class SysEx(MidiMessageType):
     Once you specified the ID, you can add as many data as you need to the
     message.
 
+    The data is stored as bytes. To build a SysEx from a bytes-like payload
+    (eg a patch-bank dump read from a file), use SysEx.from_payload(), which
+    does not unpack the payload into as many arguments.
+
     Example
     =======
     Build a message specific to Yamaha devices, with data [255, 0, 127, 54]
     (in this order)
     >>> sysex = SysEx(43, 255, 0, 127, 54) 
+    >>> dump = SysEx.from_payload(43, open('bank.syx', 'rb').read())
     """
+    __slots__ = ()
+    _attributes = ('manufacturer_id', 'data')
+    _status = 0xf0
+
     def __init__(self, manufacturer_id, *args):
         if not args:
             raise TypeError('Missing data args to build SysEx.')
-        self.data = list(args)
-        super().__init__(manufacturer_id, self.data)
+        assert 0 <= manufacturer_id <= 127
+        self._data1 = manufacturer_id
+        # bytes() checks the range of every value at once.
+        self._data2 = bytes(args)
+
+    @classmethod
+    def from_payload(cls, manufacturer_id, payload):
+        """Return a SysEx holding the bytes-like 'payload', after the
+        manufacturer ID."""
+        if not len(payload):
+            raise TypeError('Missing data args to build SysEx.')
+        assert 0 <= manufacturer_id <= 127
+        sysex = cls.__new__(cls)
+        sysex._data1 = manufacturer_id
+        sysex._data2 = bytes(payload)
+        return sysex
+
+    def __repr__(self):
+        if len(self._data2) > 16:
+            return 'SysEx({}, <{} bytes>)'.format(
+                self._data1, len(self._data2))
+        return 'SysEx({})'.format(
+            ', '.join(str(value) for value in (self._data1, *self._data2)))
+
+
+class TimeCodeQuarterFrame(MidiMessageType):
+    """MIDI message type Time Code Quarter Frame (System Common).
+
+    The data byte holds a piece type (0 to 7) in its 3 high bits, and a 4
+    bits value. It has no channel.
+    """
+    __slots__ = ()
+    _attributes = ('frame_data',)
+    _status = 0xf1
+
+    def __init__(self, frame_data, internal=False):
+        super().__init__(frame_data)
+
+    @property
+    def piece_type(self):
+        return self._data1 >> 4
+
+    @property
+    def piece_value(self):
+        return self._data1 & 0xf
+
+
+class SongPosition(MidiMessageType):
+    """MIDI message type Song Position Pointer (System Common).
+
+    The position is the number of MIDI beats (sixteenth notes) since the
+    start of the song, as a 14 bits value. It has no channel.
+    """
+    __slots__ = ()
+    _attributes = ('lsbyte', 'msbyte')
+    _status = 0xf2
+
+    @property
+    def position(self):
+        return (self._data2 << 7) | self._data1
+
+
+class SongSelect(MidiMessageType):
+    """MIDI message type Song Select (System Common). It has no channel."""
+    __slots__ = ()
+    _attributes = ('song_number',)
+    _status = 0xf3
+
+    def __init__(self, song_number, internal=False):
+        super().__init__(song_number)
+
+
+class TuneRequest(MidiMessageType):
+    """MIDI message type Tune Request (System Common).
+
+    It carries no data, and has no channel.
+    """
+    __slots__ = ()
+    _status = 0xf6
+
+    def __init__(self, internal=False):
+        self._data1 = None
+        self._data2 = None
+
+    def __repr__(self):
+        return 'TuneRequest()'
+
+
+TYPES_NUMBER = {
+    midi_type: midi_type._status >> 4 for midi_type in (
+        NoteOff, NoteOn, PolyphonicAftertouch, ControlChange, ProgramChange,
+        ChannelAftertouch, PitchBend, SysEx)
+}
+
+NUMBERS_TYPE = {v: k for k, v in TYPES_NUMBER.items()}
+
+SYSTEM_COMMON_TYPES = (
+    TimeCodeQuarterFrame, SongPosition, SongSelect, TuneRequest)
+
+TYPES_ATTRIBUTES = {
+    midi_type: list(midi_type._attributes)
+    for midi_type in tuple(TYPES_NUMBER) + SYSTEM_COMMON_TYPES
+}
@@ -1,24 +1,8 @@
-from .types import (NoteOff, NoteOn, PolyphonicAftertouch,
-                    ControlChange, ProgramChange, ChannelAftertouch, PitchBend,
-                    SysEx)
-
-TYPES_NUMBER = {
-    NoteOff: 0x8, NoteOn: 0x9, PolyphonicAftertouch: 0xa, ControlChange: 0xb,
-    ProgramChange: 0xc, ChannelAftertouch: 0xd, PitchBend: 0xe, SysEx: 0xf
-}
-
-NUMBERS_TYPE = {v: k for k, v in TYPES_NUMBER.items()}
-
-TYPES_ATTRIBUTES = {
-    NoteOff: ['note_number', 'velocity'],
-    NoteOn: ['note_number', 'velocity'],
-    PolyphonicAftertouch: ['note_number', 'pressure'],
-    ControlChange: ['control_number', 'value'],
-    ProgramChange: ['program_number'],
-    ChannelAftertouch: ['pressure'],
-    PitchBend: ['lsbyte', 'msbyte'],
-    SysEx: ['manufacturer_id', 'data']
-}
+from .message import Message
+from .types import (NoteOff, NoteOn, SysEx,
+                    # Kept here for compatibility
+                    TYPES_NUMBER, NUMBERS_TYPE, SYSTEM_COMMON_TYPES,
+                    TYPES_ATTRIBUTES)
 
 
 class MessageBuilder:
@@ -45,10 +29,10 @@ class MessageBuilder:
         return self._message
 
     def _build(self):
-        from .midi import Message
-
         midi_type = NUMBERS_TYPE[self.type_number]
-        if self.data2 is not None:
+        if midi_type is SysEx:
+            message_type = SysEx(self.data1, *self.data2)
+        elif self.data2 is not None:
             message_type = midi_type(self.data1, self.data2, internal=True)
         else:
             message_type = midi_type(self.data1, internal=True)
@@ -57,6 +41,8 @@ class MessageBuilder:
             # NoteOn with velocity = 0 are in fact NoteOff
             message_type = NoteOff(message_type.data1, message_type.data2)
 
+        if midi_type is SysEx:
+            return Message(message_type)
         return Message(message_type, self.channel)
 
 
@@ -81,9 +67,7 @@ def get_status_value(message_type, channel):
     The first 4 bits represent the message type, the 4 last represent the
     channel.
     """
-    type_number = TYPES_NUMBER[message_type]
-    first_nibble = type_number << 4
-    return first_nibble + channel
+    return message_type._status + channel
 
 
 def build_message_from_sequence(sequence):
@@ -0,0 +1,133 @@
+import asyncio
+import errno
+import os
+from unittest.mock import patch
+
+import pytest
+
+from midi.aio import AsyncMidiConnector
+from midi.midi import Message
+from midi.types import ControlChange, NoteOn
+
+
+@pytest.fixture
+def pty():
+    """A pseudo-terminal pair: the slave end stands in for the serial port."""
+    master, slave = os.openpty()
+    yield master, os.ttyname(slave)
+    os.close(slave)
+    try:
+        os.close(master)
+    except OSError:
+        pass
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_serial_class_patched(pty):
+    from serial import Serial
+    _, port = pty
+
+    async def main():
+        with patch('midi.midi.Serial', side_effect=Serial) as mock_serial:
+            conn = AsyncMidiConnector(port)
+        await conn.close()
+        return mock_serial
+
+    run(main()).assert_called_once_with(port=port, baudrate=31250, timeout=0)
+
+
+def test_read(pty):
+    master, port = pty
+
+    async def main():
+        conn = AsyncMidiConnector(port)
+        os.write(master, bytes([0x90, 60]))
+        await asyncio.sleep(0.01)
+        os.write(master, bytes([100, 0xb1, 7, 90]))
+        first = await conn.read()
+        second = await conn.read(channel=2)
+        await conn.close()
+        return first, second
+
+    first, second = run(main())
+
+    assert isinstance(first.type, NoteOn)
+    assert first.note_number == 60
+    assert first.velocity == 100
+    assert isinstance(second.type, ControlChange)
+    assert second.channel == 2
+
+
+def test_async_iteration(pty):
+    master, port = pty
+
+    async def main():
+        received = []
+        async with AsyncMidiConnector(port) as conn:
+            os.write(master, bytes([0x90, 60, 100, 61, 100, 62, 100]))
+            async for message in conn:
+                received.append(message.note_number)
+                if len(received) == 3:
+                    break
+        return received
+
+    assert run(main()) == [60, 61, 62]
+
+
+def test_write(pty):
+    master, port = pty
+    message = Message(NoteOn(60, 100), 1)
+
+    async def main():
+        async with AsyncMidiConnector(port, running_status=True) as conn:
+            sent = [await conn.write(message),
+                    await conn.write_many([message, message])]
+        return sent
+
+    assert run(main()) == [3, 4]
+    assert os.read(master, 100) == bytes([0x90, 60, 100, 60, 100, 60, 100])
+
+
+def test_write_backpressure(pty):
+    master, port = pty
+    message = Message(NoteOn(60, 100), 1)
+    received = bytearray()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        loop.add_reader(master, lambda: received.extend(os.read(master, 512)))
+        conn = AsyncMidiConnector(port, high_water=30)
+        for _ in range(5000):
+            await conn.write(message)
+            assert conn.out_waiting <= 30 + len(message)
+        await conn.close()
+        await asyncio.sleep(0.05)
+        loop.remove_reader(master)
+
+    run(main())
+
+    assert len(received) == 15000
+
+
+@pytest.mark.parametrize('high_water', [1, 4096])
+def test_write_error(pty, high_water):
+    _, port = pty
+    message = Message(NoteOn(60, 100), 1)
+
+    async def main():
+        conn = AsyncMidiConnector(port, high_water=high_water)
+        with patch('os.write', side_effect=OSError(errno.EIO, 'I/O error')):
+            with pytest.raises(OSError) as error:
+                await conn.write(message)
+        assert error.value.errno == errno.EIO
+        assert conn.closed and conn.out_waiting == 0
+        with pytest.raises(EOFError):
+            await conn.write(message)
+        with pytest.raises(EOFError):
+            await conn.drain()
+        await conn.close()
+
+    run(main())
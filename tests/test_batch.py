@@ -0,0 +1,139 @@
+import random
+
+import pytest
+
+from midi.batch import MessageBatch
+from midi.midi import Message
+from midi.parser import MidiParser
+from midi.types import (ChannelAftertouch, ControlChange, NoteOff, NoteOn,
+                        ProgramChange, SongPosition, SongSelect, SysEx,
+                        TuneRequest)
+
+
+@pytest.fixture
+def messages():
+    return [
+        Message(NoteOn(60, 100), 1),
+        Message(ControlChange(7, 90), 2),
+        Message(SysEx(35, 1, 2, 3)),
+        Message(ProgramChange(5), 10),
+        Message(NoteOff(60, 0), 1),
+    ]
+
+
+@pytest.fixture
+def raw(messages):
+    return b''.join(bytes(message) for message in messages)
+
+
+def test_from_bytes(messages, raw):
+    batch = MessageBatch.from_bytes(raw)
+
+    assert len(batch) == 5
+    assert list(batch.status) == [0x90, 0xb1, 0xf0, 0xc9, 0x80]
+    assert list(batch.channel) == [1, 2, 0, 10, 1]
+    assert bytes(batch.sysex_data) == bytes([1, 2, 3])
+    assert list(batch) == messages
+    assert batch[-1] == messages[-1]
+
+
+def test_from_bytes_running_status_and_real_time():
+    raw = bytes([0x90, 60, 0xf8, 100, 62, 100, 0xf0, 35, 0xfe, 1, 2, 0xf7,
+                 64, 100, 0xb0, 7])
+
+    batch = MessageBatch.from_bytes(raw)
+
+    assert [msg.note_number for msg in list(batch)[:2]] == [60, 62]
+    assert batch[2].type == SysEx(35, 1, 2)
+    assert len(batch) == 3
+
+
+def test_from_bytes_unterminated_sysex():
+    raw = bytes([0x90, 60, 100, 0xf0, 67, 1, 0x90, 61, 100, 0x80, 60, 0])
+
+    assert list(MessageBatch.from_bytes(raw)) == MidiParser().feed(raw)
+    assert len(MessageBatch.from_bytes(raw)) == 3
+
+
+def test_from_bytes_same_as_parser():
+    rng = random.Random(0)
+    statuses = [0x80, 0x90, 0xb0, 0xc0, 0xd0, 0xe0, 0xf0, 0xf7, 0xf8]
+    for _ in range(2000):
+        raw = bytes(rng.choice(statuses) if rng.random() < 0.3
+                    else rng.randrange(128)
+                    for _ in range(rng.randrange(1, 30)))
+        assert list(MessageBatch.from_bytes(raw)) == \
+            MidiParser().feed(raw), raw.hex()
+
+
+def test_from_bytes_same_length():
+    # Decoded from slices of the buffer, without running status.
+    raw = bytes([0x90, 60, 100, 0xf8, 0x81, 60, 0, 0xb2, 7, 90])
+    batch = MessageBatch.from_bytes(raw)
+
+    assert list(batch) == MidiParser().feed(raw)
+    assert list(batch.channel) == [1, 2, 3]
+    assert list(MessageBatch.from_bytes(bytes([0xc0, 5, 0xd1, 30]))) == \
+        [Message(ProgramChange(6), 1), Message(ChannelAftertouch(30), 2)]
+
+
+def test_to_bytes(messages, raw):
+    assert MessageBatch.from_messages(messages).to_bytes() == raw
+    assert MessageBatch.from_bytes(raw).to_bytes() == raw
+
+
+def test_to_bytes_same_length():
+    raw = bytes([0x90, 60, 100, 0x81, 60, 0, 0xb2, 7, 127])
+
+    assert MessageBatch.from_bytes(raw).to_bytes() == raw
+
+
+def test_select(messages):
+    batch = MessageBatch.from_messages(messages, timestamps=range(5))
+
+    notes = batch.select(batch.mask(types=[NoteOn, NoteOff]))
+    channel_1 = batch.select(batch.mask(channels=[1]))
+
+    assert list(notes) == [messages[0], messages[4]]
+    assert list(notes.timestamp) == [0, 4]
+    assert list(channel_1) == [messages[0], messages[2], messages[4]]
+    assert channel_1[1].type.data == bytes([1, 2, 3])
+    assert batch.mask(channels=[10]) == bytes([0, 0, 1, 1, 0])
+
+
+def test_mask_note_on_zero_velocity():
+    batch = MessageBatch.from_messages([
+        Message(NoteOn(60, 100), 1), Message(NoteOn(60, 0), 1),
+        Message(NoteOff(61, 0), 2), Message(NoteOn(62, 0), 2)])
+
+    assert batch.mask(types=[NoteOff]) == bytes([0, 1, 1, 1])
+    assert batch.mask(types=[NoteOn]) == bytes([1, 0, 0, 0])
+    assert batch.mask(channels=[2], types=[NoteOff]) == bytes([0, 0, 1, 1])
+    assert list(batch.status) == [0x90, 0x90, 0x81, 0x91]
+
+
+def test_system_common_round_trip():
+    messages = [Message(SongPosition(0x10, 2)), Message(SongSelect(3)),
+                Message(TuneRequest()), Message(NoteOn(60, 100), 1)]
+    batch = MessageBatch.from_messages(messages)
+
+    assert list(batch) == messages
+    assert batch.to_bytes() == bytes(
+        [0xf2, 0x10, 2, 0xf3, 3, 0xf6, 0x90, 60, 100])
+
+
+def test_validate(messages):
+    batch = MessageBatch.from_messages(messages)
+    batch.validate()
+
+    batch.data2[1] = 0x80
+    with pytest.raises(ValueError):
+        batch.validate()
+    batch.data2[1] = 90
+    batch.status[3] = 0xf4
+    with pytest.raises(ValueError):
+        batch.validate()
+    batch.status[3] = 0xc9
+    batch.channel.append(1)
+    with pytest.raises(ValueError):
+        batch.validate()
@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from midi.cli import (CorpusStats, check_outputs, detect_format, main,
+                      read_messages, run)
+from midi.journal import JournalWriter
+from midi.midi import Message
+from midi.smf import SET_TEMPO, MetaEvent, MidiFile, write_midi_file
+from midi.types import ControlChange, NoteOff, NoteOn, SysEx
+
+
+@pytest.fixture
+def messages():
+    return [Message(NoteOn(60, 100), 1), Message(ControlChange(7, 90), 2),
+            Message(SysEx(35, 1, 2, 3)), Message(NoteOff(60, 0), 1),
+            Message(NoteOn(127, 100), 10)]
+
+
+@pytest.fixture
+def corpus(tmp_path, messages):
+    raw = tmp_path / 'capture.raw'
+    raw.write_bytes(b''.join(bytes(message) for message in messages))
+    song = str(tmp_path / 'song.mid')
+    write_midi_file(song, [[(0, messages[0]), (10, messages[3])],
+                           [(5, messages[1]), (5, messages[4])]])
+    journal = str(tmp_path / 'capture.midj')
+    with JournalWriter(journal) as writer:
+        for timestamp, message in enumerate(messages):
+            writer.append(bytes(message), timestamp)
+    return [str(raw), song, journal]
+
+
+def test_read_messages(corpus, messages):
+    raw, song, journal = corpus
+    assert [detect_format(path) for path in corpus] == \
+        ['raw', 'mid', 'journal']
+    assert list(read_messages(raw)) == messages
+    assert list(read_messages(journal)) == messages
+    # Tracks are merged in time order.
+    assert list(read_messages(song)) == \
+        [messages[0], messages[1], messages[3], messages[4]]
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_stats(corpus, jobs):
+    chunks = []
+    stats = run('stats', corpus, {}, jobs=jobs, chunk_size=1,
+                on_result=chunks.append)
+
+    assert len(chunks) == 3
+    assert stats.files == 3
+    assert stats.messages == 14
+    assert stats.types == {'NoteOn': 6, 'NoteOff': 3, 'ControlChange': 3,
+                           'SysEx': 2}
+    assert stats.notes[60] == 3 and stats.notes[127] == 3
+    assert stats.controllers[7] == 3
+    assert stats.channels[9] == 3
+
+
+def test_stats_command(corpus, tmp_path, capsys):
+    bad = tmp_path / 'bad.mid'
+    bad.write_bytes(b'MThd')
+
+    assert main(['stats', '--json', '--channels', '1', '-j', '1']
+                + corpus + [str(bad)]) == 1
+
+    output = capsys.readouterr()
+    stats = json.loads(output.out)
+    assert stats['messages'] == 8
+    assert stats['failures'] == [[str(bad), 'Not a Standard MIDI File.']]
+    assert 'MB/s' in output.err
+
+
+def test_transpose_and_filter(corpus, tmp_path, messages):
+    output = str(tmp_path / 'out')
+    assert main(['transpose', '-s', '1', '-o', output, '-j', '1']
+                + corpus) == 0
+    assert main(['filter', '--types', 'NoteOn,NoteOff', '-o',
+                 str(tmp_path / 'notes'), '-j', '1', corpus[1]]) == 0
+
+    # The note 127 + 1 is dropped.
+    assert list(read_messages(output + '/capture.raw')) == [
+        Message(NoteOn(61, 100), 1), messages[1], messages[2],
+        Message(NoteOff(61, 0), 1)]
+    assert [message.timestamp for message
+            in read_messages(output + '/capture.midj')] == [0, 1, 2, 3]
+    with MidiFile(str(tmp_path / 'notes' / 'song.mid')) as song:
+        assert [[delta for delta, _ in track] for track in song.tracks] == \
+            [[0, 10, 0], [10, 0]]
+
+
+def test_convert(corpus, tmp_path, messages):
+    output = str(tmp_path / 'out')
+    assert main(['convert', '--to', 'mid', '--channel', '3', '-o', output,
+                 '-j', '1', corpus[0]]) == 0
+    assert main(['convert', '--to', 'raw', '-o', output, '-j', '1',
+                 corpus[1]]) == 0
+
+    assert list(read_messages(output + '/capture.mid')) == [
+        Message(NoteOn(60, 100), 3), Message(ControlChange(7, 90), 3),
+        messages[2], Message(NoteOff(60, 0), 3), Message(NoteOn(127, 100), 3)]
+    assert len(list(read_messages(output + '/song.raw'))) == 4
+
+
+def test_convert_journal_timing(tmp_path, messages):
+    journal = str(tmp_path / 'capture.midj')
+    with JournalWriter(journal) as writer:
+        # At 120 bpm and 480 ticks per quarter note, a tick is 1/960 s.
+        for timestamp in (10 ** 9, 10 ** 9 + 500 * 10 ** 6, 3 * 10 ** 9):
+            writer.append(bytes(messages[0]), timestamp)
+    output = str(tmp_path / 'out')
+    assert main(['convert', '--to', 'mid', '-o', output, '-j', '1',
+                 journal]) == 0
+
+    with MidiFile(output + '/capture.mid') as song:
+        events = list(song.tracks[0])
+    assert events[0] == (0, MetaEvent(SET_TEMPO, (500000).to_bytes(3, 'big')))
+    assert [delta for delta, _ in events[1:4]] == [0, 480, 1440]
+
+
+def test_output_collisions(corpus, tmp_path, capsys):
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'capture.raw').write_bytes(bytes([0x90, 60, 100]))
+
+    with pytest.raises(ValueError, match='both be written'):
+        check_outputs([corpus[0], str(other / 'capture.raw')],
+                      str(tmp_path / 'out'))
+    with pytest.raises(ValueError, match='over an input'):
+        run('transpose', corpus, {'semitones': 1,
+                                  'output_dir': str(tmp_path)})
+    with pytest.raises(SystemExit):
+        main(['filter', '--channels', '1', '-o', str(tmp_path), corpus[0]])
+    assert 'over an input' in capsys.readouterr().err
+    assert (tmp_path / 'capture.raw').read_bytes()[:1] == b'\x90'
+
+
+def test_corpus_stats_failure_counts_nothing():
+    stats = CorpusStats()
+
+    def truncated():
+        yield Message(NoteOn(60, 100), 1)
+        raise ValueError('Truncated file.')
+
+    with pytest.raises(ValueError):
+        stats.add_file(truncated())
+    assert stats.as_dict() == CorpusStats().as_dict()
+
+
+def test_missing_file(corpus, tmp_path, capsys):
+    missing = str(tmp_path / 'missing.mid')
+
+    assert main(['stats', '-j', '1', missing] + corpus) == 1
+    assert main(['transpose', '-s', '1', '-o', str(tmp_path / 'out'),
+                 '-j', '1', missing]) == 1
+    errors = capsys.readouterr().err
+    assert errors.count(missing + ': ') == 2
+
+
+def test_corpus_stats_merge():
+    first, second = CorpusStats(), CorpusStats()
+    first.add_file([Message(NoteOn(60, 100), 1)])
+    second.add_file([Message(NoteOn(60, 100), 2)])
+    first.merge(second)
+
+    assert first.files == 2
+    assert first.notes[60] == 2
+    assert first.channels[:2] == [1, 1]
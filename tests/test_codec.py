@@ -0,0 +1,62 @@
+import pytest
+
+from midi.codec import (STATUS_CHANNELS, STATUS_DATA_LENGTHS, STATUS_TYPES,
+                        MessageCache, decode_channel_message)
+from midi.message import Message
+from midi.parser import MidiParser
+from midi.types import (ChannelAftertouch, NoteOff, NoteOn, ProgramChange,
+                        SysEx)
+
+
+@pytest.fixture
+def cache():
+    return MessageCache(maxsize=2)
+
+
+def test_tables():
+    assert STATUS_TYPES[0x9f] is NoteOn
+    assert STATUS_TYPES[0xf0] is SysEx
+    assert STATUS_TYPES[0xf8] is None
+    assert STATUS_TYPES[0x40] is None
+    assert STATUS_CHANNELS[0x9f] == 16
+    assert STATUS_CHANNELS[0xf0] == 0
+    assert STATUS_DATA_LENGTHS[0x90] == 2
+    assert STATUS_DATA_LENGTHS[0xd3] == 1
+    assert STATUS_DATA_LENGTHS[0xf2] == 0
+
+
+def test_decode_channel_message():
+    assert decode_channel_message(0x91, 60, 100) == \
+        Message(NoteOn(60, 100), 2)
+    assert decode_channel_message(0x91, 60, 0) == Message(NoteOff(60, 0), 2)
+    assert decode_channel_message(0xc0, 4) == Message(ProgramChange(5), 1)
+    assert decode_channel_message(0xd0, 4) == \
+        Message(ChannelAftertouch(4), 1)
+
+
+def test_cache(cache):
+    first = cache.decode(0x90, 60, 100)
+    second = cache.decode(0x90, 60, 100)
+
+    assert first is second
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_eviction(cache):
+    first = cache.decode(0x90, 60, 100)
+    cache.decode(0xc0, 1)
+    cache.decode(0xc0, 2)
+
+    assert len(cache) == 2
+    assert cache.decode(0x90, 60, 100) is not first
+    assert cache.misses == 4
+
+
+def test_parser_with_cache(cache):
+    parser = MidiParser(cache)
+
+    messages = parser.feed(bytes([0x90, 60, 100, 60, 0, 60, 100, 60, 0]))
+
+    assert messages[0] is messages[2]
+    assert messages[1] is messages[3]
+    assert (cache.hits, cache.misses) == (2, 2)
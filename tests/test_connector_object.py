@@ -1,9 +1,15 @@
+import time
 from unittest.mock import patch, call, Mock
 
 import pytest
 
 from midi.midi import MidiConnector, Message
-from midi.types import NoteOff
+from midi.filters import MessageFilter
+from midi.journal import JournalReader, JournalWriter
+from midi.metrics import InMemoryMetrics
+from midi.parser import SysExError
+from midi.thinning import OutputThinner
+from midi.types import ControlChange, NoteOff, NoteOn, SysEx
 
 
 def get_bytes(integer):
@@ -29,15 +35,56 @@ def test_write(mock_serial, message):
 
     conn.write(message)
 
-    expected_calls = [call().write(data) for data in message.bytes_content]
+    expected_calls = [call().write(bytes(message.content))]
     assert mock_serial.method_calls == expected_calls
 
 
+@patch('midi.midi.Serial', autospec=True)
+def test_write_many(mock_serial, message):
+    """All messages must be flushed with a single call to 'write'."""
+    mock_serial.return_value.write.side_effect = len
+    conn = MidiConnector('/path/to/serial/port')
+    other = Message(NoteOn(60, 100), 2)
+
+    sent = conn.write_many([message, other, message])
+
+    expected = bytes(message.content + other.content + message.content)
+    assert mock_serial.method_calls == [call().write(expected)]
+    assert sent == 9
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_write_many_empty(mock_serial):
+    conn = MidiConnector('/path/to/serial/port')
+
+    assert conn.write_many([]) == 0
+    assert mock_serial.method_calls == []
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_write_running_status(mock_serial, message):
+    mock_serial.return_value.write.side_effect = len
+    conn = MidiConnector('/path/to/serial/port', running_status=True)
+    sysex = Message(SysEx(35, 1, 2))
+
+    sent = [conn.write(message), conn.write(message),
+            conn.write_many([message, sysex, message, message])]
+
+    assert sent == [3, 2, 2 + 5 + 3 + 2]
+    assert mock_serial.method_calls == [
+        call().write(bytes([128, 35, 127])),
+        call().write(bytes([35, 127])),
+        call().write(bytes([35, 127, 0xf0, 35, 1, 2, 0xf7,
+                            128, 35, 127, 35, 127])),
+    ]
+
+
 @patch('midi.midi.Serial', autospec=True)
 def test_read_standard(mock_serial):
     """3 bytes expected"""
     reader = Mock()
     reader.side_effect = [bytes([value]) for value in [128, 35, 65]]
+    mock_serial.return_value.in_waiting = 0
     conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader)
 
     message = conn.read()
@@ -46,4 +93,203 @@ def test_read_standard(mock_serial):
     assert isinstance(message.type, NoteOff)
     assert message.channel == 1
     assert message.note_number == 35
-    assert message.velocity == 65
\ No newline at end of file
+    assert message.velocity == 65
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_timeout_in_message(mock_serial):
+    """A timeout in the middle of a message must not desync the reader."""
+    reader = Mock()
+    reader.side_effect = [b'\x91\x3c', b'', b'\x64']
+    mock_serial.return_value.in_waiting = 0
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader)
+
+    assert conn.read() is None
+    message = conn.read()
+
+    assert isinstance(message.type, NoteOn)
+    assert message.channel == 2
+    assert message.note_number == 60
+    assert message.velocity == 100
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_channel(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0x80, 35, 65, 0x91, 60, 100])]
+    mock_serial.return_value.in_waiting = 6
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader)
+
+    message = conn.read(channel=2)
+
+    assert message.channel == 2
+    reader.assert_called_once_with(6)
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_many(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0x80, 35, 65, 0x91, 60, 100, 0xc0])]
+    mock_serial.return_value.in_waiting = 7
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader)
+
+    first = conn.read_many(max_messages=1)
+    mock_serial.return_value.in_waiting = 0
+    second = conn.read_many()
+
+    assert [msg.channel for msg in first] == [1]
+    assert [msg.channel for msg in second] == [2]
+    assert conn.read_many() == []
+    reader.assert_called_once_with(7)
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_timestamps(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0x80, 35, 65, 0x91, 60, 100])]
+    mock_serial.return_value.in_waiting = 6
+    conn = MidiConnector('/path/to/serial/port', timestamps=True, test=True,
+                         read_func=reader)
+
+    before = time.monotonic_ns()
+    first, second = conn.read_many()
+    after = time.monotonic_ns()
+
+    assert second.timestamp - first.timestamp == 3 * 320000
+    assert before - 5 * 320000 <= first.timestamp <= after
+    assert conn.stats.inter_arrival.percentile(50) == 3 * 320000
+    assert len(conn.stats.decode_latency) == 2
+    assert min(conn.stats.decode_latency._values) >= 0
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_filter(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0x80, 35, 65, 0x91, 60, 100, 0xb1, 7, 1])]
+    mock_serial.return_value.in_waiting = 9
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader,
+                         filter=MessageFilter(types=[NoteOn, ControlChange]))
+
+    messages = conn.read_many()
+
+    assert [type(msg.type) for msg in messages] == [NoteOn, ControlChange]
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_real_time(mock_serial):
+    received = []
+    reader = Mock()
+    reader.side_effect = [bytes([0xf8, 0x90, 60, 0xf8, 100, 0xfc])]
+    mock_serial.return_value.in_waiting = 6
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader,
+                         on_real_time=received.append)
+
+    assert conn.read_many() == [Message(NoteOn(60, 100), 1)]
+    assert received == [0xf8, 0xf8, 0xfc]
+    assert conn.real_time_counts[0] == 2
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_metrics(mock_serial, message):
+    metrics = InMemoryMetrics()
+    reader = Mock()
+    reader.side_effect = [bytes([60, 0x90, 60, 100, 0xf8, 0xb0, 7, 1])]
+    mock_serial.return_value.in_waiting = 8
+    mock_serial.return_value.write.side_effect = len
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader,
+                         filter=MessageFilter(types=[NoteOn]),
+                         metrics=metrics)
+
+    assert len(conn.read_many()) == 1
+    conn.write(message)
+    conn.write_many([message, message])
+
+    assert metrics.counters == {
+        'bytes_read': 8, 'messages_read': 1, 'messages_rejected': 1,
+        'bytes_dropped': 1, 'real_time_read': 1, 'bytes_written': 9,
+        'messages_written': 3,
+    }
+    assert len(metrics.histograms['read']) == 1
+    assert len(metrics.histograms['parse']) == 1
+    assert len(metrics.histograms['write']) == 2
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_journal(mock_serial, tmp_path):
+    path = str(tmp_path / 'capture.midj')
+    reader = Mock()
+    reader.side_effect = [bytes([0x90, 60]), bytes([100, 0xf8])]
+    mock_serial.return_value.in_waiting = 2
+    with JournalWriter(path) as journal:
+        conn = MidiConnector('/path/to/serial/port', test=True,
+                             read_func=reader, journal=journal)
+        assert conn.read() == Message(NoteOn(60, 100), 1)
+
+    with JournalReader(path) as journal:
+        assert [data for _, data in journal.records()] == \
+            [bytes([0x90, 60]), bytes([100, 0xf8])]
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_sysex(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0xf0, 35, 1, 2]), bytes([3, 4]),
+                          bytes([5, 0xf7, 0x90, 60, 100])]
+    mock_serial.return_value.in_waiting = 4
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader)
+
+    chunks = list(conn.read_sysex())
+
+    assert chunks == [bytes([35, 1, 2]), bytes([3, 4]), bytes([5])]
+    assert conn.read() == Message(NoteOn(60, 100), 1)
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_read_sysex_errors(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0xf0, 35, 1, 2, 3]), b'']
+    mock_serial.return_value.in_waiting = 5
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader,
+                         max_sysex=3)
+
+    with pytest.raises(SysExError):
+        list(conn.read_sysex())
+
+    reader.side_effect = [bytes([0xf0, 35, 1]), b'']
+    with pytest.raises(TimeoutError):
+        list(conn.read_sysex())
+
+
+@patch('midi.midi.time.sleep')
+@patch('midi.midi.Serial', autospec=True)
+def test_write_paced(mock_serial, mock_sleep, message):
+    mock_serial.return_value.write.side_effect = len
+    conn = MidiConnector('/path/to/serial/port')
+    dump = Message(SysEx.from_payload(35, bytes(10)))
+
+    assert conn.write_paced([message, dump], delay=0.05, chunk_size=5) == 16
+
+    serial = mock_serial.return_value
+    assert [bytes(c.args[0]) for c in serial.write.call_args_list] == [
+        bytes([0x80, 35, 127]), bytes([0xf0, 35, 0, 0, 0]), bytes(5),
+        bytes([0, 0, 0xf7])]
+    assert serial.flush.call_count == 4
+    assert mock_sleep.call_args_list == [call(0.05)] * 3
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_write_thinner(mock_serial):
+    mock_serial.return_value.write.side_effect = len
+    conn = MidiConnector('/path/to/serial/port',
+                         thinner=OutputThinner(rate=0.001))
+    volume = [Message(ControlChange(7, value), 1) for value in range(10)]
+    note = Message(NoteOn(60, 100), 1)
+
+    assert conn.write_many(volume[:5] + [note] + volume[5:]) == 6
+    assert conn.write_pending() == 0
+    assert conn.flush_pending() == 3
+
+    serial = mock_serial.return_value
+    assert [bytes(c.args[0]) for c in serial.write.call_args_list] == [
+        bytes([0xb0, 7, 0, 0x90, 60, 100]), bytes([0xb0, 7, 9])]
+    assert conn.thinner.coalesced == 8
@@ -0,0 +1,135 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from midi.dispatch import Dispatcher
+from midi.midi import MidiConnector, Message
+from midi.types import (ControlChange, NoteOff, NoteOn, ProgramChange, SysEx,
+                        TuneRequest)
+
+
+@pytest.fixture
+def messages():
+    return [
+        Message(NoteOn(60, 100), 3),
+        Message(ControlChange(64, 127), 1),
+        Message(ControlChange(64, 0), 1),
+        Message(ControlChange(7, 90), 1),
+        Message(NoteOn(60, 100), 4),
+        Message(SysEx(35, 1, 2)),
+        Message(NoteOff(60, 0), 3),
+        Message(ProgramChange(5), 2),
+    ]
+
+
+def test_routing(messages):
+    calls = []
+    unhandled = []
+    dispatcher = Dispatcher(default=unhandled.append)
+
+    @dispatcher.on(NoteOn, channel=3)
+    def note(message):
+        calls.append(('note', message))
+
+    @dispatcher.on(ControlChange, control_number=64)
+    def sustain(message):
+        calls.append(('sustain', message))
+
+    @dispatcher.on((NoteOn, NoteOff, SysEx), channel=[3, 4])
+    def notes(message):
+        calls.append(('notes', message))
+
+    dispatcher.add(lambda message: calls.append(('program', message)),
+                   ProgramChange, program_number=5)
+
+    for message in messages:
+        dispatcher.dispatch(message)
+
+    assert calls == [
+        ('note', messages[0]), ('notes', messages[0]),
+        ('sustain', messages[1]), ('sustain', messages[2]),
+        ('notes', messages[4]), ('notes', messages[5]),
+        ('notes', messages[6]), ('program', messages[7]),
+    ]
+    assert unhandled == [messages[3]]
+    assert dispatcher.handlers(messages[0]) == [note, notes]
+    assert dispatcher.handled == 8 and dispatcher.unhandled == 0
+
+
+def test_batch_delivery(messages):
+    calls = []
+    dispatcher = Dispatcher()
+
+    @dispatcher.on(ControlChange, channel=1, batch=True)
+    def controllers(batch):
+        calls.append(('controllers', list(batch)))
+
+    @dispatcher.on(NoteOn)
+    def note(message):
+        calls.append(('note', message))
+
+    assert dispatcher.dispatch_many(messages) == 5
+    assert calls == [
+        ('note', messages[0]),
+        ('controllers', messages[1:4]),
+        ('note', messages[4]),
+    ]
+    assert dispatcher.unhandled == 3
+
+    # A run is split by a data1 level.
+    calls.clear()
+    dispatcher.add(lambda message: None, ControlChange, control_number=7)
+    dispatcher.dispatch_many(messages[1:4])
+    assert calls == [('controllers', messages[1:3]),
+                     ('controllers', messages[3:4])]
+
+
+def test_dispatch_generator(messages):
+    batches = []
+    dispatcher = Dispatcher()
+    dispatcher.on(ControlChange, batch=True)(batches.append)
+
+    assert dispatcher.dispatch_many(message for message in messages) == 3
+    assert batches == [messages[1:4]]
+    assert (dispatcher.handled, dispatcher.unhandled) == (3, 5)
+
+
+def test_remove(messages):
+    handler = Mock()
+    dispatcher = Dispatcher()
+    dispatcher.on(TuneRequest)(handler)
+    dispatcher.on(NoteOn, note_number=60)(handler)
+    assert len(dispatcher.registrations) == 2
+
+    dispatcher.remove(handler)
+    dispatcher.dispatch_many(messages + [Message(TuneRequest())])
+    assert not handler.called
+    assert dispatcher.registrations == []
+
+
+def test_invalid_registrations():
+    dispatcher = Dispatcher()
+    with pytest.raises(AssertionError):
+        dispatcher.add(print, NoteOn, channel=17)
+    with pytest.raises(AssertionError):
+        dispatcher.add(print, NoteOn, control_number=64)
+    with pytest.raises(AssertionError):
+        dispatcher.add(print, ProgramChange, program_number=0)
+    with pytest.raises(AssertionError):
+        dispatcher.add(print, NoteOn, note_number=60, velocity=100)
+    assert dispatcher.registrations == []
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_poll(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0x90, 60, 100, 62, 100, 0xb0, 1, 2])]
+    mock_serial.return_value.in_waiting = 8
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader)
+    batches = []
+    dispatcher = Dispatcher()
+    dispatcher.on(NoteOn, batch=True)(batches.append)
+
+    assert dispatcher.poll(conn) == 3
+    assert batches == [[Message(NoteOn(60, 100), 1),
+                        Message(NoteOn(62, 100), 1)]]
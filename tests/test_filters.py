@@ -0,0 +1,39 @@
+from midi.filters import MessageFilter
+from midi.types import ControlChange, NoteOff, NoteOn, SysEx
+
+
+def test_filter_channels():
+    message_filter = MessageFilter(channels=[1, 10])
+
+    assert message_filter.accepts(0x90)
+    assert message_filter.accepts(0xb9)
+    assert not message_filter.accepts(0x91)
+    assert message_filter.accepts(0xf0)
+    assert not message_filter.accepts(0xf8)
+    assert not message_filter.accepts(0x40)
+
+
+def test_filter_types():
+    message_filter = MessageFilter(types=[NoteOn, NoteOff])
+
+    assert message_filter.accepts(0x8f)
+    assert message_filter.accepts(0x90)
+    assert not message_filter.accepts(0xb0)
+    assert not message_filter.accepts(0xf0)
+
+
+def test_filter_intersection():
+    message_filter = MessageFilter(channels=[1, 2]) & MessageFilter(
+        channels=[2, 3], types=[ControlChange, SysEx])
+
+    assert message_filter.channels == {2}
+    assert message_filter.accepts(0xb1)
+    assert message_filter.accepts(0xf0)
+    assert not message_filter.accepts(0xb0)
+    assert not message_filter.accepts(0x91)
+
+
+def test_mask():
+    message_filter = MessageFilter(channels=[2])
+
+    assert message_filter.mask([0x90, 0x91, 0xf0]) == bytes([0, 1, 1])
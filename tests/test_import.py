@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+import midi.midi
+
+
+def test_import_is_lazy():
+    """pyserial is only imported when creating a connector."""
+    output = subprocess.run(
+        [sys.executable, '-c',
+         'import midi, sys; print(" ".join(sys.modules))'],
+        stdout=subprocess.PIPE, check=True).stdout.decode().split()
+
+    assert 'midi' in output
+    assert 'serial' not in output
+
+
+def test_aio_import_is_lazy():
+    output = subprocess.run(
+        [sys.executable, '-c',
+         'import midi.aio, sys; print(" ".join(sys.modules))'],
+        stdout=subprocess.PIPE, check=True).stdout.decode().split()
+
+    assert 'midi.aio' in output
+    assert 'serial' not in output
+
+
+def test_serial_attribute():
+    from serial import Serial
+
+    assert midi.midi.Serial is Serial
+
+
+def test_message_does_not_import_codec():
+    """midi.codec imports midi.message: the reverse import is deferred."""
+    import ast
+    import midi.message
+
+    with open(midi.message.__file__) as f:
+        tree = ast.parse(f.read())
+    imported = [node.module for node in tree.body
+                if isinstance(node, ast.ImportFrom)]
+    assert imported == ['types']
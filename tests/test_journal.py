@@ -0,0 +1,98 @@
+import pytest
+
+from midi.journal import (JournalError, JournalReader, JournalWriter,
+                          TRAILER)
+from midi.midi import Message
+from midi.types import NoteOn
+
+
+class FakeConnector:
+    def __init__(self):
+        self.written = []
+
+    def write_bytes(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    path = str(tmp_path / 'capture.midj')
+    with JournalWriter(path, block_size=64) as journal:
+        for index in range(100):
+            journal.append(bytes([0x90, index, 100]), 1000 * index)
+    return path
+
+
+def test_records_round_trip(journal_path):
+    with JournalReader(journal_path) as journal:
+        records = list(journal.records())
+        assert len(journal) > 1
+        assert not journal.recovered
+        assert journal.start_time == 0
+        assert journal.end_time == 99000
+
+    assert records == [(1000 * index, bytes([0x90, index, 100]))
+                       for index in range(100)]
+
+
+def test_seek(journal_path):
+    with JournalReader(journal_path) as journal:
+        assert [timestamp for timestamp, _
+                in journal.records(start=41500, end=45000)] == \
+            [42000, 43000, 44000]
+        assert list(journal.records(start=200000)) == []
+        messages = list(journal.messages(start=98000))
+
+    assert messages == [Message(NoteOn(98, 100), 1),
+                        Message(NoteOn(99, 100), 1)]
+    assert messages[0].timestamp == 98000
+
+
+def test_long_chunks_and_clock_going_back(tmp_path):
+    path = str(tmp_path / 'capture.midj')
+    data = bytes([0xf0, 0x7d]) + bytes(100000) + bytes([0xf7])
+    with JournalWriter(path) as journal:
+        journal.append(data, 10)
+        journal.append(b'\xf8', 5)
+
+    with JournalReader(path) as journal:
+        records = list(journal.records())
+    assert b''.join(chunk for _, chunk in records) == data + b'\xf8'
+    assert [timestamp for timestamp, _ in records] == [10, 10, 10]
+
+
+def test_recover_without_index(journal_path):
+    with open(journal_path, 'rb') as journal_file:
+        data = journal_file.read()
+    # Drop the index, and half of the last block.
+    offset = TRAILER.unpack_from(data, len(data) - TRAILER.size)[0]
+    with open(journal_path, 'wb') as journal_file:
+        journal_file.write(data[:offset - 10])
+
+    with JournalReader(journal_path) as journal:
+        records = list(journal.records())
+        assert journal.recovered
+    assert 0 < len(records) < 100
+    assert records[-1][0] == 1000 * (len(records) - 1)
+
+
+def test_replay(journal_path):
+    connector = FakeConnector()
+    with JournalReader(journal_path) as journal:
+        assert journal.replay(connector, speed=None, chunk_size=30) == 300
+        assert b''.join(connector.written) == b''.join(
+            bytes([0x90, index, 100]) for index in range(100))
+        assert len(connector.written) == 10
+
+        connector.written.clear()
+        assert journal.replay(connector, start=0, end=3000, speed=10) == 9
+        assert connector.written == [b'\x90\x00\x64', b'\x90\x01\x64',
+                                     b'\x90\x02\x64']
+
+
+def test_not_a_journal(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'MThd\x00\x00\x00\x06')
+    with pytest.raises(JournalError):
+        JournalReader(str(path))
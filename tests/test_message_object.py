@@ -1,7 +1,9 @@
 import pytest
 
 from midi.midi import Message
-from midi.types import NoteOff, SysEx
+from midi.parser import MidiParser
+from midi.types import (NoteOff, NoteOn, ProgramChange, SongPosition, SysEx,
+                        TuneRequest)
 from midi.utils import get_status_value
 
 
@@ -41,3 +43,74 @@ def test_sysex_content(sysex_msg):
     assert sysex_msg[0] == 0xf0  # SysEx start byte
     assert sysex_msg[1] == 35
     assert sysex_msg[-1] == 0xf7  # SysEx end byte
+
+
+def test_message_is_immutable(note_off_msg):
+    with pytest.raises(AttributeError):
+        note_off_msg.channel = 2
+    with pytest.raises(TypeError):
+        note_off_msg.velocity = 0
+    with pytest.raises(AttributeError):
+        note_off_msg.foo = 'bar'
+
+
+def test_message_is_hashable(note_off_msg, sysex_msg):
+    same = Message(NoteOff(10, 100), 1)
+    other_channel = Message(NoteOff(10, 100), 2)
+
+    assert note_off_msg == same
+    assert note_off_msg != other_channel
+    assert len({note_off_msg, same, other_channel, sysex_msg}) == 3
+    assert sysex_msg == Message(SysEx(35, 0x12, 0xac, 0x9a, 0x8d))
+
+
+@pytest.mark.parametrize('message', [
+    Message(NoteOff(10, 100), 1),
+    Message(ProgramChange(128), 16),
+    Message(SongPosition(0x10, 2)),
+    Message(TuneRequest()),
+])
+def test_from_bytes_and_packed_round_trip(message):
+    assert Message.from_bytes(bytes(message)) == message
+    assert Message.from_packed(message.to_packed()) == message
+
+
+def test_to_packed():
+    assert Message(NoteOn(60, 100), 2).to_packed() == 0x913c64
+    assert Message(ProgramChange(1), 1).to_packed() == 0xc00000
+    with pytest.raises(ValueError):
+        Message(SysEx(35, 1, 2)).to_packed()
+
+
+def test_from_bytes_sysex_without_payload():
+    # Dropped as malformed by the parser: rejected as well.
+    data = bytes([0xf0, 0x7d, 0xf7])
+    assert MidiParser().feed(data) == []
+    with pytest.raises(ValueError):
+        Message.from_bytes(data)
+
+
+def test_from_bytes_decodes_like_the_parser():
+    assert Message.from_bytes(bytes([0x90, 60, 0])) == \
+        Message(NoteOff(60, 0), 1)
+    assert Message.from_bytes(bytearray([0xf0, 35, 1, 2, 0xf7])) == \
+        Message(SysEx(35, 1, 2))
+
+
+@pytest.mark.parametrize('data', [
+    b'', b'\x90\x3c', b'\x90\x3c\x64\x00', b'\x90\x3c\x80', b'\x3c\x64',
+    b'\xf8', b'\xf4', b'\xf0\x23\x01', b'\xf0\x23\x90\xf7',
+    b'\xf0\x7d\xf7',
+])
+def test_from_bytes_rejects_invalid_data(data):
+    with pytest.raises(ValueError):
+        Message.from_bytes(data)
+
+
+@pytest.mark.parametrize('packed', [
+    -1, 0x3c64, 0x1903c64, 0x903c80, 0xf00000, 0xf80000, 0xc00501,
+    0xf60100,
+])
+def test_from_packed_rejects_invalid_values(packed):
+    with pytest.raises(ValueError):
+        Message.from_packed(packed)
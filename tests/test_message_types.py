@@ -95,4 +95,33 @@ def test_pitch_bend(pitch_bend):
 def test_sysex(sysex):
     assert isinstance(sysex, MidiMessageType)
     assert sysex.data1 == sysex.manufacturer_id == 35
-    assert sysex.data2 == [120, 255, 90]
\ No newline at end of file
+    assert sysex.data2 == bytes([120, 255, 90])
+
+
+def test_types_are_immutable(note_on):
+    with pytest.raises(TypeError):
+        note_on.note_number = 10
+    with pytest.raises(AttributeError):
+        note_on.foo = 'bar'
+
+
+def test_types_are_hashable(note_on, sysex):
+    assert note_on == NoteOn(20, 110)
+    assert note_on != NoteOff(20, 110)
+    assert hash(sysex) == hash(SysEx(35, 120, 255, 90))
+    assert len({note_on, NoteOn(20, 110), sysex}) == 2
+
+
+def test_cannot_instanciate_parent_class():
+    with pytest.raises(RuntimeError):
+        MidiMessageType(10)
+
+
+def test_sysex_from_payload():
+    payload = bytes(range(128)) * 8
+    sysex = SysEx.from_payload(35, memoryview(payload))
+
+    assert sysex.data == payload
+    assert sysex == SysEx(35, *payload)
+    assert repr(sysex) == 'SysEx(35, <1024 bytes>)'
+    assert repr(SysEx(35, 1, 2)) == 'SysEx(35, 1, 2)'
@@ -0,0 +1,45 @@
+from midi.metrics import InMemoryMetrics, MetricsSink, PrometheusMetrics
+
+
+def test_sink_ignores_everything():
+    sink = MetricsSink()
+    sink.increment('bytes_read', 3)
+    sink.observe('read', 1000)
+
+
+def test_in_memory():
+    metrics = InMemoryMetrics()
+    metrics.increment('bytes_read', 3)
+    metrics.increment('bytes_read')
+    metrics.observe('parse', 1500)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot['counters']['bytes_read'] == 4
+    assert snapshot['counters']['messages_written'] == 0
+    assert snapshot['durations']['parse']['count'] == 1
+    assert snapshot['durations']['write']['count'] == 0
+
+    metrics.reset()
+    assert metrics.counters['bytes_read'] == 0
+
+
+def test_prometheus_render():
+    metrics = PrometheusMetrics(labels={'port': '/dev/serial0'}, buckets=4)
+    metrics.increment('messages_read', 2)
+    metrics.observe('read', 500)
+    metrics.observe('read', 3000)
+    metrics.observe('read', 10 ** 9)
+
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE midi_messages_read_total counter' in lines
+    assert 'midi_messages_read_total{port="/dev/serial0"} 2' in lines
+    assert '# TYPE midi_read_duration_seconds histogram' in lines
+    assert 'midi_read_duration_seconds_bucket{port="/dev/serial0",' \
+        'le="1e-06"} 1' in lines
+    assert 'midi_read_duration_seconds_bucket{port="/dev/serial0",' \
+        'le="4e-06"} 2' in lines
+    assert 'midi_read_duration_seconds_bucket{port="/dev/serial0",' \
+        'le="+Inf"} 3' in lines
+    assert 'midi_read_duration_seconds_count{port="/dev/serial0"} 3' in lines
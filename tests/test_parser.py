@@ -0,0 +1,255 @@
+import pytest
+
+from midi.codec import MessageCache
+from midi.filters import MessageFilter
+from midi.midi import Message
+from midi.parser import (SYSEX_ABORTED, SYSEX_CHUNK, SYSEX_COMPLETE, START,
+                         TIMING_CLOCK, MidiParser)
+from midi.types import (ControlChange, NoteOff, NoteOn, ProgramChange,
+                        SongPosition, SongSelect, SysEx, TimeCodeQuarterFrame,
+                        TuneRequest)
+
+
+@pytest.fixture
+def parser():
+    return MidiParser()
+
+
+def test_feed_complete_messages(parser):
+    messages = parser.feed(bytes([0x90, 60, 100, 0xc1, 4, 0x82, 60, 0]))
+
+    assert len(messages) == 3
+    assert all(isinstance(msg, Message) for msg in messages)
+    assert isinstance(messages[0].type, NoteOn)
+    assert isinstance(messages[1].type, ProgramChange)
+    assert messages[1].channel == 2
+    assert messages[1].type.data1 == 4
+    assert messages[1].program_number == 5
+    assert isinstance(messages[2].type, NoteOff)
+    assert messages[2].channel == 3
+
+
+def test_feed_partial_message(parser):
+    assert parser.feed(b'\x90') == []
+    assert parser.feed(b'\x3c') == []
+    messages = parser.feed(b'\x64\x90')
+
+    assert len(messages) == 1
+    assert messages[0].note_number == 60
+    assert messages[0].velocity == 100
+
+
+def test_feed_sysex(parser):
+    assert parser.feed(bytes([0xf0, 35, 0x12, 0x2c])) == []
+    messages = parser.feed(bytes([0x1a, 0xf7]))
+
+    assert len(messages) == 1
+    assert isinstance(messages[0].type, SysEx)
+    assert messages[0].manufacturer_id == 35
+    assert messages[0].data == bytes([0x12, 0x2c, 0x1a])
+
+
+def test_feed_resync(parser):
+    """An incomplete message is dropped when a new status byte arrives."""
+    messages = parser.feed(bytes([0x10, 0x90, 60, 0xb0, 7, 100]))
+
+    assert len(messages) == 1
+    assert messages[0].control_number == 7
+    assert messages[0].value == 100
+
+
+def test_feed_real_time_interleaved(parser):
+    messages = parser.feed(bytes([0x90, 60, 0xf8, 100]))
+
+    assert len(messages) == 1
+    assert messages[0].velocity == 100
+
+
+def test_feed_running_status(parser):
+    messages = parser.feed(bytes([0xb0, 7, 100, 7, 90, 0xf8, 10]))
+    messages += parser.feed(bytes([64]))
+
+    assert [(msg.control_number, msg.value) for msg in messages] == \
+        [(7, 100), (7, 90), (10, 64)]
+    assert all(msg.channel == 1 for msg in messages)
+
+
+def test_feed_running_status_cancelled(parser):
+    """System messages cancel the running status."""
+    messages = parser.feed(bytes([0x90, 60, 100, 0xf6, 61, 100]))
+
+    assert len(messages) == 2
+    assert messages[0].note_number == 60
+    assert messages[1] == Message(TuneRequest())
+
+
+def test_feed_timestamps(parser):
+    """Every message is stamped with the arrival time of its first byte."""
+    messages = parser.feed(bytes([0x90, 60, 100, 62]), timestamp=1000,
+                           byte_duration=10)
+    messages += parser.feed(bytes([100, 0xf8, 0xf0, 35, 1, 0xf7]),
+                            timestamp=2000, byte_duration=10)
+
+    assert [msg.timestamp for msg in messages] == [970, 1000, 1970]
+
+
+def test_feed_timestamps_not_cached():
+    cache = MessageCache()
+    parser = MidiParser(cache)
+
+    first, second = parser.feed(bytes([0x90, 60, 100, 60, 100]),
+                                timestamp=100, byte_duration=1)
+
+    assert first == second
+    assert first is not second
+    assert (first.timestamp, second.timestamp) == (96, 99)
+    assert cache.misses == 0
+
+
+def test_feed_filter():
+    parser = MidiParser(filter=MessageFilter(channels=[2], types=[NoteOn]))
+
+    messages = parser.feed(bytes([
+        0x90, 60, 100, 61, 100,  # NoteOn, channel 1, with running status
+        0x91, 62, 100, 0xf8, 63, 100,  # NoteOn, channel 2
+        0xb1, 7, 100,  # ControlChange, channel 2
+        0xf0, 35, 1, 2, 0xf7,  # SysEx
+    ]))
+
+    assert [msg.note_number for msg in messages] == [62, 63]
+    assert parser.rejected == 4
+
+
+def test_feed_filter_change():
+    """A message is accepted by the filter in use when it is completed."""
+    parser = MidiParser(filter=MessageFilter(channels=[2]))
+    assert parser.feed(bytes([0x90, 60, 100, 61])) == []
+
+    parser.filter = None
+
+    assert [msg.note_number for msg in parser.feed(bytes([100, 62, 100]))] \
+        == [61, 62]
+    assert parser.rejected == 1
+
+
+def test_feed_real_time_counted(parser):
+    """Real-time bytes are counted, without interrupting other messages."""
+    messages = parser.feed(bytes([
+        0x90, 0xf8, 60, 0xf8, 100,
+        0xf0, 35, 0xfa, 1, 0xf8, 2, 0xf7,
+        0xf8,
+    ]))
+
+    assert messages == [Message(NoteOn(60, 100), 1), Message(SysEx(35, 1, 2))]
+    assert parser.real_time_counts[TIMING_CLOCK - 0xf8] == 4
+    assert parser.real_time_counts[START - 0xf8] == 1
+
+
+def test_feed_real_time_callback():
+    received = []
+    parser = MidiParser(on_real_time=received.append)
+
+    messages = parser.feed(bytes([0xfa, 0xc0, 0xf8, 4, 0xf8, 0xfc]))
+
+    assert received == [0xfa, 0xf8, 0xf8, 0xfc]
+    assert messages == [Message(ProgramChange(5), 1)]
+
+
+def test_feed_real_time_callback_cached():
+    cache = MessageCache()
+    shared = cache.decode(0x90, 60, 100)
+    # Messages are immutable: the parser must not write to a shared instance.
+    object.__setattr__(shared, '_timestamp', 42)
+    parser = MidiParser(cache, on_real_time=lambda byte: None)
+
+    messages = parser.feed(bytes([0x90, 0xf8, 60, 100]))
+
+    assert messages[0] is shared
+    assert shared.timestamp == 42
+
+
+def test_feed_system_common(parser):
+    messages = parser.feed(bytes([
+        0xf1, 0x23, 0xf2, 0x10, 0xf8, 0x02, 0xf3, 7, 0xf6,
+        0xf4, 1, 2,  # Undefined, skipped
+    ]))
+
+    assert messages == [
+        Message(TimeCodeQuarterFrame(0x23)),
+        Message(SongPosition(0x10, 0x02)),
+        Message(SongSelect(7)),
+        Message(TuneRequest()),
+    ]
+    assert messages[0].type.piece_type == 2
+    assert messages[1].type.position == 0x110
+    assert bytes(messages[1]) == bytes([0xf2, 0x10, 0x02])
+
+
+def test_feed_system_common_filtered():
+    parser = MidiParser(filter=MessageFilter(types=[SongPosition]))
+
+    messages = parser.feed(bytes([0xf3, 7, 0xf2, 0, 1, 0xf6]))
+
+    assert messages == [Message(SongPosition(0, 1))]
+    assert parser.rejected == 2
+
+
+def test_feed_dropped(parser):
+    """Bytes discarded to resynchronize are counted."""
+    messages = parser.feed(bytes([
+        60, 100,  # Data bytes without status
+        0x90, 60, 0xb0, 7, 100,  # Incomplete NoteOn
+        0xf7,  # SysEx end without start
+    ]))
+
+    assert messages == [Message(ControlChange(7, 100), 1)]
+    assert parser.dropped == 4
+
+
+def test_feed_rejected_sysex_not_dropped():
+    parser = MidiParser(filter=MessageFilter(types=[NoteOn]))
+
+    parser.feed(bytes([0xf0, 35, 1, 2, 0xf7, 0x90, 60, 100]))
+
+    assert parser.rejected == 1
+    assert parser.dropped == 0
+
+
+def test_feed_sysex_split(parser):
+    """SysEx payloads are copied by slices, across chunks."""
+    payload = bytes(range(128)) * 100
+
+    assert parser.feed(bytes([0x90, 60, 100, 0xf0, 35]) + payload[:5000]) \
+        == [Message(NoteOn(60, 100), 1)]
+    assert parser.feed(payload[5000:]) == []
+    messages = parser.feed(bytes([0xf8, 0xf7, 0x90, 62, 100]))
+
+    assert messages == [Message(SysEx.from_payload(35, payload)),
+                        Message(NoteOn(62, 100), 1)]
+    assert isinstance(messages[0].data, bytes)
+
+
+def test_feed_sysex_max_size():
+    parser = MidiParser(max_sysex=4)
+
+    messages = parser.feed(bytes([0xf0, 35, 1, 2, 3, 0xf7,
+                                  0xf0, 35, 1, 2, 3, 4, 5, 0xf7]))
+
+    assert messages == [Message(SysEx(35, 1, 2, 3))]
+    assert parser.oversized == 1
+    assert parser.dropped == 0
+
+
+def test_feed_sysex_stream():
+    chunks = []
+    parser = MidiParser(on_sysex=lambda chunk, state: chunks.append(
+        (bytes(chunk), state)))
+
+    parser.feed(bytes([0xf0, 35, 1, 2]))
+    parser.feed(bytes([3, 0xf7, 0xf0, 36, 1, 0x90]))
+
+    assert chunks == [
+        (bytes([35, 1, 2]), SYSEX_CHUNK), (bytes([3]), SYSEX_CHUNK),
+        (b'', SYSEX_COMPLETE),
+        (bytes([36, 1]), SYSEX_CHUNK), (b'', SYSEX_ABORTED),
+    ]
@@ -0,0 +1,130 @@
+import os
+import select
+import time
+
+import pytest
+
+from midi.midi import MidiConnector
+from midi.router import MidiFramer, MidiRouter
+from midi.types import NoteOff, NoteOn, ProgramChange
+
+
+@pytest.fixture
+def ptys():
+    """Three pseudo-terminal pairs: the slave ends stand in for serial
+    ports."""
+    pairs = [os.openpty() for _ in range(3)]
+    yield [(master, os.ttyname(slave)) for master, slave in pairs]
+    for master, slave in pairs:
+        os.close(master)
+        os.close(slave)
+
+
+@pytest.fixture
+def router(ptys):
+    router = MidiRouter()
+    for name, (_, port) in zip('abc', ptys):
+        router.add_port(name, MidiConnector(port))
+    yield router
+    router.close()
+
+
+def receive(master, timeout=1):
+    """Return the bytes written to the port at the other end of 'master'."""
+    data = b''
+    while select.select([master], [], [], timeout)[0]:
+        data += os.read(master, 1024)
+        timeout = 0.05
+    return data
+
+
+def test_framer():
+    framer = MidiFramer()
+
+    frames = framer.feed(bytes([
+        0x90, 60, 0xf8, 100, 62, 100,  # Running status
+        0xf0, 35, 1, 0xf8, 2, 0xf7,  # SysEx
+        0xc1, 0x90, 60, 0,  # Incomplete ProgramChange
+        0xf6, 5,
+    ]))
+
+    assert frames == [
+        bytes([0xf8]), bytes([0x90, 60, 100]), bytes([0x90, 62, 100]),
+        bytes([0xf8]), bytes([0xf0, 35, 1, 2, 0xf7]), bytes([0x90, 60, 0]),
+        bytes([0xf6]),
+    ]
+    assert framer.dropped == 1
+
+
+def test_framer_split():
+    framer = MidiFramer()
+
+    assert framer.feed(bytes([0xb0, 7])) == []
+    assert framer.feed(bytes([100])) == [bytes([0xb0, 7, 100])]
+
+
+def route_until(router, size, timeout=1):
+    """Poll the router until 'size' bytes were sent."""
+    deadline = time.monotonic() + timeout
+    sent = 0
+    while sent < size and time.monotonic() < deadline:
+        sent += router.poll(timeout=0.05)
+    return sent
+
+
+def test_merge(ptys, router):
+    (a, _), (b, _), (c, _) = ptys
+    router.add_route('a', ['c'])
+    router.add_route('b', ['c'])
+
+    os.write(a, bytes([0x90, 60, 100, 62]))
+    os.write(b, bytes([0xc0, 4, 0xf8]))
+    os.write(a, bytes([100]))
+
+    assert route_until(router, 8) == 8
+    frames = MidiFramer().feed(receive(c))
+    assert sorted(frames) == sorted([
+        bytes([0x90, 60, 100]), bytes([0x90, 62, 100]), bytes([0xc0, 4])])
+
+
+def test_route_remap_transpose(ptys, router):
+    (a, _), (b, _), (c, _) = ptys
+    to_b = router.add_route('a', ['b'], channels=[1], types=[NoteOn, NoteOff],
+                            remap=10, transpose=12)
+    to_c = router.add_route('a', ['c'], types=[ProgramChange], real_time=True)
+
+    os.write(a, bytes([
+        0x90, 60, 100,  # NoteOn, channel 1
+        0x91, 60, 100,  # NoteOn, channel 2: not routed
+        0x80, 120, 0,  # NoteOff, transposed out of range: dropped
+        0xf8, 0xc0, 5,
+    ]))
+
+    assert route_until(router, 6) == 6
+    assert receive(b) == bytes([0x99, 72, 100])
+    assert receive(c) == bytes([0xf8, 0xc0, 5])
+    assert to_b.throughput()['messages'] == 1
+    assert to_b.dropped == 1
+    assert to_c.throughput()['bytes'] == 3
+
+
+def test_route_no_message_objects(monkeypatch, ptys, router):
+    """Forwarded messages are never decoded."""
+    (a, _), (b, _), _ = ptys
+    router.add_route('a', ['b'])
+    monkeypatch.setattr(NoteOn, '__init__', None)
+
+    os.write(a, bytes([0x90, 60, 100]))
+
+    assert route_until(router, 3) == 3
+    assert receive(b) == bytes([0x90, 60, 100])
+
+
+def test_remove_port(router):
+    router.add_route('a', ['b'])
+    router.add_route('b', ['c'])
+
+    router.remove_port('b')
+
+    assert router.routes == []
+    assert list(router.ports) == ['a', 'c']
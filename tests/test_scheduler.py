@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+import pytest
+
+from midi.midi import MidiConnector
+from midi.message import Message
+from midi.scheduler import MidiScheduler
+from midi.types import NoteOff, NoteOn
+
+
+class FakeConnector:
+    """Record the messages sent, and the time they were sent at."""
+    def __init__(self):
+        self.writes = []
+        self.sent = threading.Event()
+
+    def write_many(self, messages):
+        self.writes.append((time.monotonic_ns(), list(messages)))
+        self.sent.set()
+        return 3 * len(messages)
+
+
+@pytest.fixture
+def connector():
+    return FakeConnector()
+
+
+@pytest.fixture
+def scheduler(connector):
+    scheduler = MidiScheduler(connector)
+    yield scheduler
+    scheduler.stop()
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return predicate()
+
+
+def test_schedule(scheduler, connector):
+    note_on = Message(NoteOn(60, 100), 1)
+    note_off = Message(NoteOff(60, 0), 1)
+    scheduler.start()
+    start = time.monotonic_ns()
+
+    scheduler.schedule(note_off, at=start + 20000000)
+    scheduler.schedule_relative(note_on, 0.01)
+
+    assert wait_for(lambda: len(connector.writes) == 2)
+    (first_time, first), (second_time, second) = connector.writes
+    assert first == [note_on]
+    assert second == [note_off]
+    assert first_time >= start + 10000000
+    assert second_time >= start + 20000000
+    assert scheduler.lateness.count == 2
+
+
+def test_coalesce(scheduler, connector):
+    messages = [Message(NoteOn(note, 100), 1) for note in range(10)]
+    at = time.monotonic_ns() + 10000000
+    for message in messages:
+        scheduler.schedule(message, at)
+    scheduler.start()
+
+    assert wait_for(lambda: connector.writes)
+    assert connector.writes[0][1] == messages
+
+
+def test_cancel(scheduler, connector):
+    message = Message(NoteOn(60, 100), 1)
+    cancelled = scheduler.schedule_relative(message, 0.01)
+    kept = scheduler.schedule_relative(message, 0.02)
+    cancelled.cancel()
+    scheduler.start()
+
+    assert len(scheduler) == 1
+    assert wait_for(lambda: connector.writes)
+    time.sleep(0.02)
+    assert len(connector.writes) == 1
+    assert not kept.cancelled
+
+
+def test_ticks(scheduler):
+    scheduler.tempo = 120
+    scheduler.ppq = 480
+
+    assert scheduler.ticks_to_ns(480) == 500000000
+    event = scheduler.schedule_ticks(Message(NoteOn(60, 100), 1), 960)
+    assert event.at == scheduler.origin + 1000000000
+
+
+def test_pty_loopback():
+    master, slave = os.openpty()
+    try:
+        conn = MidiConnector(os.ttyname(slave))
+        scheduler = MidiScheduler(conn)
+        scheduler.start()
+        for index in range(5):
+            scheduler.schedule_relative(Message(NoteOn(60, 100), 1),
+                                        0.005 * (index + 1))
+        assert wait_for(lambda: scheduler.lateness.count == 5)
+        scheduler.stop()
+
+        assert os.read(master, 100) == bytes([0x90, 60, 100]) * 5
+        assert scheduler.lateness.percentile(50) < 10000000
+    finally:
+        os.close(master)
+        os.close(slave)
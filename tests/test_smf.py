@@ -0,0 +1,108 @@
+import struct
+
+import pytest
+
+from midi.midi import Message
+from midi.smf import (MetaEvent, MidiFile, SMFError, END_OF_TRACK,
+                      TRACK_NAME, encode_variable_length, write_midi_file)
+from midi.types import ControlChange, NoteOff, NoteOn, SysEx
+
+
+@pytest.fixture
+def tracks():
+    return [
+        [(0, MetaEvent.set_tempo(500000)), (0, MetaEvent(TRACK_NAME, b'A'))],
+        [(0, Message(NoteOn(60, 100), 1)),
+         (480, Message(NoteOn(62, 100), 1)),
+         (200, Message(SysEx(35, 1, 2))),
+         (0, Message(ControlChange(7, 90), 2)),
+         (1000, Message(NoteOff(60, 0), 1))],
+    ]
+
+
+def test_variable_length():
+    assert encode_variable_length(0) == b'\x00'
+    assert encode_variable_length(0x7f) == b'\x7f'
+    assert encode_variable_length(0x80) == b'\x81\x00'
+    assert encode_variable_length(0x0fffffff) == b'\xff\xff\xff\x7f'
+
+
+def test_round_trip(tmp_path, tracks):
+    path = str(tmp_path / 'song.mid')
+    write_midi_file(path, tracks, division=96)
+
+    with MidiFile(path) as song:
+        assert song.format == 1
+        assert song.division == 96
+        assert len(song.tracks) == 2
+        events = [list(track) for track in song.tracks]
+
+    assert events[0][0][1].tempo == 500000
+    assert events[0][:2] == tracks[0]
+    assert events[1][:5] == tracks[1]
+    assert events[1][5] == (0, MetaEvent(END_OF_TRACK))
+
+
+def test_running_status(tmp_path):
+    path = str(tmp_path / 'song.mid')
+    track = bytes([0, 0x90, 60, 100, 10, 62, 100, 0, 0xff, 0x2f, 0])
+    with open(path, 'wb') as f:
+        f.write(b'MThd' + struct.pack('>LHHh', 6, 0, 1, 480))
+        f.write(b'MTrk' + struct.pack('>L', len(track)) + track)
+
+    with MidiFile(path) as song:
+        events = list(song.tracks[0])
+
+    assert events[:2] == [(0, Message(NoteOn(60, 100), 1)),
+                          (10, Message(NoteOn(62, 100), 1))]
+    assert song.format == 0
+
+
+def test_lazy_tracks(tmp_path):
+    """Unknown chunks are skipped, tracks are decoded only when iterated."""
+    path = str(tmp_path / 'song.mid')
+    bad_track = bytes([0, 0x40, 0x40])
+    with open(path, 'wb') as f:
+        f.write(b'MThd' + struct.pack('>LHHh', 6, 2, 1, 480))
+        f.write(b'XXXX' + struct.pack('>L', 2) + b'??')
+        f.write(b'MTrk' + struct.pack('>L', len(bad_track)) + bad_track)
+
+    with MidiFile(path) as song:
+        assert len(song.tracks) == 1
+        with pytest.raises(SMFError):
+            list(song.tracks[0])
+
+
+def test_not_a_midi_file(tmp_path):
+    path = tmp_path / 'song.mid'
+    path.write_bytes(b'RIFF' + bytes(20))
+
+    with pytest.raises(SMFError):
+        MidiFile(str(path))
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'song.mid'
+    path.write_bytes(b'')
+
+    with pytest.raises(SMFError):
+        MidiFile(str(path))
+
+
+def test_invalid_meta_event_type(tmp_path):
+    path = str(tmp_path / 'song.mid')
+    track = bytes([0, 0xff, 0x80, 0])
+    with open(path, 'wb') as f:
+        f.write(b'MThd' + struct.pack('>LHHh', 6, 0, 1, 480))
+        f.write(b'MTrk' + struct.pack('>L', len(track)) + track)
+
+    with MidiFile(path) as song:
+        with pytest.raises(SMFError):
+            list(song.tracks[0])
+
+
+def test_format_0_single_track(tmp_path, tracks):
+    path = tmp_path / 'song.mid'
+    with pytest.raises(ValueError):
+        write_midi_file(str(path), tracks, format=0)
+    assert not path.exists()
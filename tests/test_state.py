@@ -0,0 +1,120 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from midi.midi import MidiConnector, Message
+from midi.state import ChannelState
+from midi.types import (ChannelAftertouch, ControlChange, NoteOff, NoteOn,
+                        PitchBend, ProgramChange, SysEx)
+
+
+@pytest.fixture
+def state():
+    state = ChannelState()
+    state.update_many([
+        Message(ControlChange(7, 100), 1),
+        Message(ProgramChange(5), 1),
+        Message(ControlChange(0, 2), 1),
+        Message(NoteOn(60, 90), 1),
+        Message(NoteOn(64, 80), 10),
+        Message(PitchBend(0, 64), 2),
+        Message(ChannelAftertouch(30), 3),
+        Message(SysEx(35, 1, 2)),
+    ])
+    return state
+
+
+def test_update(state):
+    assert state.controller(1, 7) == 100
+    assert state.controller(2, 7) is None
+    assert state.program(1) == 5
+    assert state.program(2) is None
+    assert state.pitch_bend(2) == 8192
+    assert state.pitch_bend(1) is None
+    assert state.velocity(1, 60) == 90
+    assert state.held_notes() == [(1, 60), (10, 64)]
+
+    state.update(Message(NoteOff(60, 0), 1))
+    assert state.velocity(1, 60) == 0
+    assert state.held_notes() == [(10, 64)]
+
+
+def test_channel_mode_messages(state):
+    state.update(Message(ControlChange(123, 0), 10))
+    assert state.held_notes() == [(1, 60)]
+    assert state.controller(10, 123) is None
+
+    state.update(Message(ControlChange(121, 0), 1))
+    assert state.controller(1, 7) is None
+    assert state.pitch_bend(1) == 8192
+    assert state.program(1) == 5
+
+
+def test_snapshot(state):
+    snapshot = state.snapshot()
+    state.update(Message(ControlChange(7, 1), 1))
+    state.update(Message(NoteOn(61, 1), 1))
+
+    assert snapshot.controller(1, 7) == 100
+    assert snapshot.held_notes() == [(1, 60), (10, 64)]
+    snapshot.update(Message(ControlChange(7, 1), 1))
+    snapshot.update(Message(NoteOn(61, 1), 1))
+    assert snapshot == state
+
+
+def test_chase(state):
+    assert state.chase() == [
+        Message(ControlChange(0, 2), 1),
+        Message(ProgramChange(5), 1),
+        Message(ControlChange(7, 100), 1),
+        Message(PitchBend(0, 64), 2),
+        Message(ChannelAftertouch(30), 3),
+    ]
+
+    target = state.snapshot()
+    target.update_many([Message(ControlChange(7, 50), 1),
+                        Message(NoteOff(60, 0), 1),
+                        Message(NoteOn(62, 70), 4)])
+    messages = target.chase(state, notes=True)
+    assert messages == [Message(ControlChange(7, 50), 1),
+                        Message(NoteOff(60, 0), 1),
+                        Message(NoteOn(62, 70), 4)]
+
+    state.update_many(messages)
+    assert state == target
+    assert target.chase(state, notes=True) == []
+
+
+def test_panic(state):
+    assert state.panic() == [Message(NoteOff(60, 0), 1),
+                             Message(NoteOff(64, 0), 10)]
+    assert state.held_notes() == []
+    assert state.velocity(1, 60) == 0
+    assert state.panic() == []
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_connector_state(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0xc0, 4, 0x90, 60, 100])]
+    mock_serial.return_value.in_waiting = 5
+    state = ChannelState()
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader,
+                         state=state)
+
+    assert len(conn.read_many()) == 2
+    assert state.program(1) == 5
+    assert state.held_notes() == [(1, 60)]
+
+
+@patch('midi.midi.Serial', autospec=True)
+def test_connector_state_read_channel(mock_serial):
+    reader = Mock()
+    reader.side_effect = [bytes([0xc1, 5, 0x90, 60, 100])]
+    mock_serial.return_value.in_waiting = 5
+    state = ChannelState()
+    conn = MidiConnector('/path/to/serial/port', test=True, read_func=reader,
+                         state=state)
+
+    assert conn.read(channel=1) == Message(NoteOn(60, 100), 1)
+    assert state.program(2) == 6
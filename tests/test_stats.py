@@ -0,0 +1,37 @@
+from midi.stats import Histogram, RollingStats
+
+
+def test_histogram():
+    histogram = Histogram(resolution=1000)
+    for value in [-5, 500, 1500, 3000, 3000, 10 ** 15]:
+        histogram.record(value)
+
+    assert histogram.count == len(histogram) == 6
+    assert histogram.counts[:3] == [2, 1, 2]
+    assert histogram.counts[-1] == 1
+    assert histogram.min == 0
+    assert histogram.max == 10 ** 15
+    assert histogram.percentile(50) == 2000
+    assert histogram.percentile(100) == 10 ** 15
+    assert histogram.summary()['p50'] == 2000
+
+
+def test_empty_histogram():
+    histogram = Histogram()
+
+    assert histogram.mean is None
+    assert histogram.percentile(99) is None
+
+
+def test_rolling_stats():
+    stats = RollingStats(window=4)
+    for value in range(10):
+        stats.record(value)
+
+    assert stats.count == 10
+    assert len(stats) == 4
+    assert stats.mean == 7.5
+    assert stats.percentile(0) == 6
+    assert stats.percentile(50) == 8
+    assert stats.percentile(100) == 9
+    assert stats.summary()['max'] == 9
@@ -0,0 +1,63 @@
+from midi.midi import Message
+from midi.thinning import OutputThinner
+from midi.types import (ChannelAftertouch, ControlChange, NoteOff, NoteOn,
+                        PitchBend)
+
+
+def cc(controller, value, channel=1):
+    return Message(ControlChange(controller, value), channel)
+
+
+def test_passthrough():
+    thinner = OutputThinner(rate=10)
+    notes = [Message(NoteOn(60, 100), 1), Message(NoteOff(60, 0), 1)] * 3
+
+    assert [thinner.add(note, now=0)[0] for note in notes] == notes
+    assert len(thinner) == 0
+
+
+def test_coalesce_latest_value():
+    thinner = OutputThinner(rate=10)
+
+    assert thinner.add(cc(7, 1), now=0) == [cc(7, 1)]
+    assert thinner.add(cc(7, 2), now=0.01) == []
+    assert thinner.add(cc(7, 3), now=0.02) == []
+    assert thinner.add(cc(10, 64), now=0.03) == [cc(10, 64)]
+    assert thinner.due(now=0.05) == []
+    assert thinner.next_due() == 0.1
+
+    assert thinner.due(now=0.1) == [cc(7, 3)]
+    assert thinner.coalesced == 1
+    assert thinner.stats() == {(1, 'ControlChange', 7): 1}
+
+
+def test_streams():
+    """Channels, controllers, pitch bend and aftertouch are separate
+    streams."""
+    thinner = OutputThinner(rate=10, rates={PitchBend: 1000})
+    messages = [cc(7, 1), cc(7, 1, channel=2), cc(1, 1),
+                Message(PitchBend(0, 64), 1),
+                Message(ChannelAftertouch(10), 1)]
+
+    assert [thinner.add(msg, now=0) for msg in messages] == [
+        [msg] for msg in messages]
+    assert thinner.add(Message(PitchBend(1, 64), 1), now=0.001) == [
+        Message(PitchBend(1, 64), 1)]
+    assert thinner.add(Message(ChannelAftertouch(11), 1), now=0.001) == []
+
+
+def test_discrete_controllers():
+    """Switches and data entry are never coalesced."""
+    thinner = OutputThinner(rate=10)
+
+    for value in (127, 0, 127):
+        assert thinner.add(cc(64, value), now=0) == [cc(64, value)]
+
+
+def test_flush():
+    thinner = OutputThinner(rate=10)
+    thinner.add(cc(7, 1), now=0)
+    thinner.add(cc(7, 2), now=0)
+
+    assert thinner.flush() == [cc(7, 2)]
+    assert thinner.next_due() is None
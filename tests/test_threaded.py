@@ -0,0 +1,149 @@
+import queue
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from midi.threaded import (RingBuffer, ThreadedMidiConnector, BLOCK,
+                           DROP_NEWEST, DROP_OLDEST)
+from midi.types import ControlChange, NoteOn
+
+
+class FakePort:
+    """Serve chunks of bytes as the read function of a connector."""
+    def __init__(self):
+        self.chunks = queue.Queue()
+
+    def send(self, *values):
+        self.chunks.put(bytes(values))
+
+    def read(self, size=1):
+        try:
+            return self.chunks.get(timeout=0.01)
+        except queue.Empty:
+            return b''
+
+
+@pytest.fixture
+def port():
+    return FakePort()
+
+
+@pytest.fixture
+def connector(port):
+    with patch('midi.midi.Serial', autospec=True) as mock_serial:
+        mock_serial.return_value.in_waiting = 0
+        conn = ThreadedMidiConnector('/path/to/serial/port', timeout=1,
+                                     test=True, read_func=port.read)
+        yield conn
+        conn.stop()
+
+
+def test_ring_buffer_drop_oldest():
+    buffer = RingBuffer(3, DROP_OLDEST)
+    for item in range(5):
+        buffer.put(item)
+
+    assert buffer.depth == 3
+    assert buffer.dropped == 2
+    assert buffer.get_many() == [2, 3, 4]
+    assert buffer.get(timeout=0) is None
+
+
+def test_ring_buffer_drop_newest():
+    buffer = RingBuffer(3, DROP_NEWEST)
+    stored = [buffer.put(item) for item in range(5)]
+
+    assert stored == [True, True, True, False, False]
+    assert buffer.dropped == 2
+    assert buffer.get_many(max_items=2) == [0, 1]
+    assert buffer.get() == 2
+
+
+def test_ring_buffer_block():
+    buffer = RingBuffer(1, BLOCK)
+    buffer.put(0)
+    producer = threading.Thread(target=buffer.put, args=(1,))
+    producer.start()
+    producer.join(0.05)
+
+    assert producer.is_alive()
+    assert buffer.get() == 0
+    producer.join(1)
+    assert not producer.is_alive()
+    assert buffer.get() == 1
+    assert buffer.dropped == 0
+
+
+def test_read(connector, port):
+    connector.start()
+    port.send(0x90, 60, 100, 0xb1, 7)
+    port.send(90)
+
+    first = connector.read()
+    second = connector.read(channel=2)
+
+    assert isinstance(first.type, NoteOn)
+    assert isinstance(second.type, ControlChange)
+    assert second.value == 90
+
+
+def test_subscriptions(connector, port):
+    notes = connector.subscribe(types=[NoteOn])
+    channel_2 = connector.subscribe(channels=[2])
+    connector.start()
+    port.send(0x90, 60, 100, 0xb1, 7, 90, 0x91, 61, 100)
+
+    assert [msg.note_number for msg in (notes.get(1), notes.get(1))] == \
+        [60, 61]
+    assert [type(channel_2.get(1).type) for _ in range(2)] == \
+        [ControlChange, NoteOn]
+    assert notes.get(timeout=0.05) is None
+    # Only consumed through subscriptions so far: the ring buffer is empty.
+    assert connector.depth == 0 and connector.dropped == 0
+    assert connector.read_many() == []
+
+    port.send(0x90, 62, 100)
+    assert connector.read_many(timeout=1)[0].note_number == 62
+
+
+def test_subscriptions_do_not_block_on_ring_buffer(port):
+    with patch('midi.midi.Serial', autospec=True) as mock_serial:
+        mock_serial.return_value.in_waiting = 0
+        connector = ThreadedMidiConnector(
+            '/path/to/serial/port', buffer_size=4, overflow=BLOCK, test=True,
+            read_func=port.read)
+    notes = connector.subscribe(size=16)
+    connector.start()
+    for note in range(10):
+        port.send(0x90, note, 100)
+
+    try:
+        assert [notes.get(1).note_number for _ in range(10)] == \
+            list(range(10))
+    finally:
+        connector.stop()
+
+
+def test_stop_wakes_up_consumers(connector):
+    subscription = connector.subscribe()
+    connector.start()
+    consumer = threading.Thread(target=lambda: list(subscription))
+    consumer.start()
+
+    connector.stop()
+    consumer.join(1)
+
+    assert not consumer.is_alive()
+    assert not connector.running
+
+
+def test_restart(connector, port):
+    subscription = connector.subscribe()
+    connector.start()
+    connector.stop()
+    assert subscription.get(timeout=0) is None
+
+    connector.start()
+    port.send(0x90, 60, 100)
+    assert subscription.get(1).note_number == 60
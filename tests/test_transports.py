@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+
+from midi.midi import MidiConnector, Message
+from midi.rtpmidi import (PAYLOAD_TYPE, RTP_HEADER, Peer,
+                          RtpMidiSession)
+from midi.transports import MemoryTransport
+from midi.types import ControlChange, NoteOff, NoteOn, SysEx
+
+
+@pytest.fixture
+def messages():
+    return [Message(NoteOn(60, 100), 1), Message(ControlChange(7, 90), 2),
+            Message(SysEx(35, 1, 2, 3)), Message(NoteOff(60, 0), 1)]
+
+
+def test_memory_transport_pair(messages):
+    local, remote = MemoryTransport.pair()
+    sender = MidiConnector(transport=local, running_status=True)
+    receiver = MidiConnector(transport=remote, timeout=0.1)
+
+    sender.write_many(messages)
+
+    assert receiver.read_many() == messages
+    assert receiver.read() is None
+    assert local.bytes_written == sum(len(message) for message in messages)
+
+
+def test_memory_transport_blocking_read():
+    transport = MemoryTransport()
+    threading.Timer(0.05, transport.write, [b'\x90\x3c\x64']).start()
+
+    assert MidiConnector(transport=transport).read() == \
+        Message(NoteOn(60, 100), 1)
+
+
+@pytest.fixture
+def sessions():
+    first = RtpMidiSession(0, name='first', host='127.0.0.1', timeout=1)
+    second = RtpMidiSession(0, name='second', host='127.0.0.1', timeout=1)
+    yield first, second
+    first.close()
+    second.close()
+
+
+def invite(first, second):
+    """Invite 'second' from 'first', polling 'second' from a thread."""
+    done = threading.Event()
+
+    def poll():
+        while not done.is_set():
+            second.poll(0.01)
+
+    thread = threading.Thread(target=poll)
+    thread.start()
+    try:
+        return first.invite('127.0.0.1', second.port)
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_rtpmidi_session(sessions, messages):
+    first, second = sessions
+    peer = invite(first, second)
+    assert peer.name == 'second'
+    assert peer.latency is not None
+    sender = MidiConnector(transport=first)
+    receiver = MidiConnector(transport=second, timeout=1)
+
+    sender.write_many(messages)
+    received = []
+    while len(received) < len(messages):
+        received += receiver.read_many(timeout=1)
+
+    assert received == messages
+    assert first.packets_sent == 1
+    assert [peer.name for peer in second.peers.values()] == ['first']
+    # And the other way round
+    receiver.write(messages[0])
+    assert sender.read() == messages[0]
+
+
+def test_rtpmidi_big_sysex(sessions):
+    first, second = sessions
+    invite(first, second)
+    message = Message(SysEx(35, *(i % 128 for i in range(5000))))
+
+    MidiConnector(transport=first).write(message)
+
+    assert MidiConnector(transport=second, timeout=1).read() == message
+    assert first.packets_sent == 5
+
+
+def test_rtpmidi_recovery_journal(sessions, monkeypatch):
+    first, second = sessions
+    invite(first, second)
+    sender = MidiConnector(transport=first)
+    receiver = MidiConnector(transport=second, timeout=1)
+    notes = [Message(NoteOn(note, 100), 1) for note in range(60, 64)]
+
+    monkeypatch.setattr(first, '_data', _DroppingSocket(first._data, [1]))
+    for note in notes:
+        sender.write(note)
+    received = []
+    while len(received) < len(notes):
+        received += receiver.read_many(timeout=1)
+
+    assert received == notes
+    assert second.recovered == 1
+    assert second.lost == 0
+
+
+def test_rtpmidi_malformed_packets(sessions):
+    _, session = sessions
+    session.peers[1234] = Peer(1234, 'peer', ('127.0.0.1', 9))
+
+    def packet(sequence, csrc_count=0):
+        return RTP_HEADER.pack(0x80 | csrc_count, PAYLOAD_TYPE, sequence, 0,
+                               1234)
+
+    for datagram in (
+            packet(1, csrc_count=15) + bytes(8),  # Truncated CSRC list
+            packet(2) + bytes([0x80]),  # Truncated long header
+            packet(3) + bytes([0x0a, 0x90, 60]),  # Truncated commands
+    ):
+        session._handle_rtp(datagram)
+    assert session.malformed == 3
+    assert session.packets_received == 0
+
+    # Truncated delta time and journal entry: the rest is dropped.
+    session._handle_rtp(packet(4) + bytes([0x21, 0x81]))
+    session._handle_rtp(packet(6) + bytes([0x43, 0x90, 61, 100, 0, 0, 1])
+                        + bytes([0, 5, 0, 9, 0x90]))
+    assert session.read(16) == bytes([0x90, 61, 100])
+    assert session.packets_received == 2
+    assert session.lost == 1
+    assert session.fileno() in session.filenos()
+
+
+class _DroppingSocket:
+    """Wrap a socket, dropping some of the RTP packets sent."""
+    def __init__(self, sock, dropped):
+        self._socket = sock
+        self._dropped = set(dropped)
+        self._count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._socket, name)
+
+    def sendto(self, packet, address):
+        count = self._count
+        self._count += 1
+        if count in self._dropped:
+            return len(packet)
+        return self._socket.sendto(packet, address)